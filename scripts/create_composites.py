@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+sys.path.append(".")
+from src.processing.composite import composite_granules
+from src.processing.granule_index import list_granules
+
+
+def create_composites(data_dir: Path, variables: list[str], bbox: tuple, resolution: float = 0.01, days: int = 1,
+                      median: bool = False, save_dir: Path = Path("data/composites")):
+    """
+    Creates daily (or N-day) composites of the granules in a directory on a fixed grid over the AOI
+    and saves them to `{save_dir}/{short_name}_{days}day.nc`.
+
+    Params:
+        data_dir (Path): a directory with downloaded granules, ex. data/PACE_OCI_L2_BGC_NRT
+        variables (list): the variables to composite
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude) of the grid
+        resolution (float): the size of a grid cell in degrees
+        days (int): the length of a composite period in days
+        median (bool): if set to True, also estimates a median per grid cell
+        save_dir (Path): the directory to save the composites in
+
+    Returns:
+        Path: the path to the saved composites, or None if no granule has data in the AOI
+    """
+    composites = composite_granules(list_granules(data_dir), variables, bbox, resolution, days, median=median)
+    if composites is None:
+        print("No data in the bounding box for", data_dir.name)
+        return None
+    save_dir.mkdir(parents=True, exist_ok=True)
+    save_path = save_dir / f"{data_dir.name}_{days}day.nc"
+    composites.to_netcdf(save_path)
+    return save_path
+
+
+if __name__ == '__main__':
+    """
+    Bins the valid pixels of every pass onto one regular grid per day, so overlapping passes and
+    their different cloud gaps are merged into one value per grid cell per day.
+    Assumes the data is already downloaded using `download_data.py`
+    """
+    pacific_pal_bbox = (-118.75, 33.99, -118.45, 34.15)
+
+    create_composites(Path("data/PACE_OCI_L2_BGC_NRT"), ["chlor_a", "poc", "carbon_phyto"], pacific_pal_bbox)
+    create_composites(Path("data/PACE_OCI_L2_LANDVI_NRT"), ["ndvi", "evi", "ndwi", "ndii"], pacific_pal_bbox)
+    # create_composites(Path("data/PACE_OCI_L2_AOP_NRT"), ["aot_865", "angstrom"], pacific_pal_bbox, days=8)
@@ -1,10 +1,16 @@
 import os
-from PIL import Image
+import sys
 from pathlib import Path
 
-def create_gif(image_dir, output_gif, duration=200, loop=0, image_format=('png', 'jpg', 'jpeg')):
+sys.path.append(".")
+from src.plotting.animation import write_animation
+from src.profiling.trace import traced
+
+@traced()
+def create_gif(image_dir, output_gif, duration=200, loop=0, image_format=('png', 'jpg', 'jpeg'), extra_outputs=()):
     """
     Creates an animated GIF from images in a directory.
+    The images are read and written one at a time, so memory does not grow with the number of images.
     
     Parameters:
     - image_dir (str): Path to directory containing images.
@@ -12,6 +18,7 @@ def create_gif(image_dir, output_gif, duration=200, loop=0, image_format=('png',
     - duration (int): Duration between frames in milliseconds.
     - loop (int): Number of loops (0 for infinite).
     - image_format (tuple): File extensions to include.
+    - extra_outputs (tuple): Other filenames to also write the animation to (ex. output.mp4, requires imageio[ffmpeg]).
     """
     # Get list of image files, sorted
     image_files = [os.path.join(image_dir, f) 
@@ -22,12 +29,9 @@ def create_gif(image_dir, output_gif, duration=200, loop=0, image_format=('png',
         print("No images found in the directory.")
         return
     
-    # Open images and convert to RGB
-    images = [Image.open(img).convert("RGB") for img in image_files]
-    
-    # Save as GIF
-    images[0].save(image_dir / output_gif, save_all=True, append_images=images[1:], 
-                   duration=duration, loop=loop)
+    # Stream the images into the GIF with one palette sampled across them
+    write_animation(image_files, image_dir / output_gif, duration=duration, loop=loop,
+                    extra_outputs=[image_dir / output for output in extra_outputs])
     print(f"GIF saved to {image_dir / output_gif}")
 
 
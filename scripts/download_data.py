@@ -3,6 +3,7 @@ import earthaccess
 
 sys.path.append(".")
 from src.downloader.pace_data_downloader import PaceDataDownloader
+from src.downloader.granule_catalog import GranuleCatalog
 
 
 if __name__=='__main__':
@@ -33,7 +34,13 @@ if __name__=='__main__':
 
 
     # Can change the bounding box area and/or time span
-    downloader = PaceDataDownloader(bounding_box=pacific_pal_bbox, time_span=wider_dates)
+    # The catalog records downloaded granules so repeat runs only fetch new ones
+    catalog = GranuleCatalog("data/granule_catalog.sqlite")
+    downloader = PaceDataDownloader(bounding_box=pacific_pal_bbox, time_span=wider_dates, catalog=catalog)
+
+    ## Uncomment to list the BGC granules already downloaded for the AOI in January (without searching):
+    # for row in catalog.query("PACE_OCI_L2_BGC_NRT", bbox=pacific_pal_bbox, time_span=january_dates):
+    #     print(row["granule_id"], row["path"])
 
 
     ### Uncomment below to download data from different datasets:
@@ -55,3 +62,23 @@ if __name__=='__main__':
 
     ## Aqua MODIS Data
     # downloader.download_data("MODISA_L2_OC", max_count=150)
+
+
+    ### Uncomment below to search and download several datasets concurrently:
+    # downloader.download_many(
+    #     [("PACE_OCI_L2_BGC_NRT", 3.0), "PACE_OCI_L2_AOP_NRT", "PACE_OCI_L2_LANDVI_NRT", "MODISA_L2_OC"],
+    #     max_count=150, max_workers=8
+    # )
+
+
+    ### Uncomment below to stream only the AOI window of the variables of interest instead of whole granules
+    ### (saved to data/{short_name}_SUBSET):
+    # downloader.subset_data("PACE_OCI_L2_BGC_NRT", ["chlor_a", "poc", "carbon_phyto"], padding=0.5,
+    #                        max_count=150, version=3.0)
+
+
+    ### Uncomment below to clip downloaded data to the AOI (saved to data/{short_name}_AOI):
+    # downloader.clip_data("PACE_OCI_L2_BGC_NRT", ["chlor_a", "poc", "carbon_phyto"])
+    # downloader.clip_data("PACE_OCI_L2_AOP_NRT", ["aot_865", "angstrom", "avw", "nflh", "Rrs"])
+    # downloader.clip_data("PACE_OCI_L2_LANDVI_NRT", ["ndvi", "evi", "ndwi", "ndii", "pri", "cci", "cire"])
+    # downloader.clip_data("PACE_HARP2_L1C_SCI")
@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+sys.path.append(".")
+from src.processing.granule_index import list_granules
+from src.processing.aoi_stats import write_statistics
+from src.processing.harp2_stats import angular_statistics
+
+
+if __name__ == '__main__':
+    """
+    Aggregates the angular signatures of every downloaded HARP2 L1C granule:
+    the count, mean, std, and percentiles of DoLP and reflectance for each view angle and wavelength.
+    The granules are streamed a chunk of rows at a time, so the archive can be larger than memory.
+
+    Assumes HARP2 data (PACE_HARP2_L1C_SCI) is downloaded from scripts/download_data.py
+    """
+    harp2_dir = Path("data/PACE_HARP2_L1C_SCI")
+    files = list_granules(harp2_dir)
+
+    # Whole granules
+    table = angular_statistics(files)
+    write_statistics(table, Path("data/harp2_stats/angular_statistics.csv"))
+
+    # Only the pixels in the area of interest (Pacific Palisades)
+    pacific_pal_bbox = (-118.75, 33.99, -118.45, 34.15)
+    table = angular_statistics(files, bbox=pacific_pal_bbox)
+    write_statistics(table, Path("data/harp2_stats/angular_statistics_aoi.csv"))
@@ -1,10 +1,10 @@
 import os
 import sys
 from pathlib import Path
+from functools import cached_property, partial
 from tempfile import TemporaryDirectory
 
 from scipy.ndimage import gaussian_filter1d
-from matplotlib import animation
 import cartopy.crs as ccrs
 import earthaccess
 import matplotlib.pyplot as plt
@@ -13,17 +13,38 @@ import xarray as xr
 
 sys.path.append(".")
 from src.plotting.plotting_functions import plot_variable, print_metadata, _extract_date_from_file
+from src.processing.granule_index import list_granules
+from src.processing.parallel import run_in_parallel
+from src.plotting.animation import write_animation, figure_frame
+from src.processing.harp2_stats import radiance_to_reflectance
+from src.processing.l1c_reader import open_l1c
+from src.profiling.trace import span, traced
 
 class HARP2:
-    def __init__(self, file):
-        self.prod = xr.open_dataset(file)
-        self.view = xr.open_dataset(file, group="sensor_views_bands").squeeze()
-        self.geo = xr.open_dataset(file, group="geolocation_data").set_coords(["longitude", "latitude"])
-        self.obs = xr.open_dataset(file, group="observation_data").squeeze()
-        self.dataset = xr.merge((self.prod, self.obs, self.geo))
+    # The derived products that can be persisted next to the granule
+    PERSISTED_PRODUCTS = ("reflectance", "rgb_stokes", "view_means")
 
-        self.angles = self.view["sensor_view_angle"]
-        self.wavelengths = self.view["intensity_wavelength"]
+    def __init__(self, file, persist_derived=False):
+        """
+        Opens a HARP2 L1C granule. The derived products (reflectance, RGB Stokes, crop window, nadir indices,
+        and per view means) are computed in float32 the first time they are used and reused by every plot.
+
+        file: the path to the HARP2 L1C granule
+        persist_derived: if set to True, saves the heavy derived products to `{granule}_derived.nc`
+            next to the granule and loads them from there on later runs
+        """
+        self.derived_path = None
+        if persist_derived:
+            self.derived_path = file.with_name(f"{file.stem}_derived.nc")
+            if self.derived_path.exists() and self.derived_path.stat().st_mtime < file.stat().st_mtime:
+                self.derived_path.unlink()  # Outdated, the granule was downloaded again
+
+        # Open the granule once, lazily, with only the variables the plots use
+        with span("HARP2.open", file=file):
+            self.dataset = open_l1c(file, ["i", "q", "u", "dolp", "solar_zenith_angle"], chunks={})
+
+        self.angles = self.dataset["sensor_view_angle"]
+        self.wavelengths = self.dataset["intensity_wavelength"]
 
         # Create a directory in images to save the visualizations to
         date_str = _extract_date_from_file(file)
@@ -42,6 +63,74 @@ class HARP2:
         self.mean_reflectance_check()
         self.create_animation()
 
+    @cached_property
+    def nadir_indices(self):
+        """The (red, green, blue) indices of the views closest to nadir"""
+        green_nadir_idx = np.argmin(np.abs(self.angles[:10].values))
+        red_nadir_idx = 10 + np.argmin(np.abs(self.angles[10:70].values))
+        blue_nadir_idx = 80 + np.argmin(np.abs(self.angles[80:].values))
+        return int(red_nadir_idx), int(green_nadir_idx), int(blue_nadir_idx)
+
+    @cached_property
+    def reflectance(self):
+        """The reflectance of every view (float32)"""
+        def compute():
+            refl = HARP2.rad_to_refl(
+                rad=self.dataset["i"].astype(np.float32),
+                f0=self.dataset["intensity_f0"].astype(np.float32),
+                sza=self.dataset["solar_zenith_angle"].astype(np.float32),
+                r=float(self.dataset.attrs["sun_earth_distance"]),
+            )
+            return refl.astype(np.float32).rename("reflectance").to_dataset()
+        return self._derived("reflectance", compute)["reflectance"]
+
+    @cached_property
+    def rgb_stokes(self):
+        """The I, Q, and U of the red, green, and blue nadir views, normalized and brightened (float32)"""
+        def compute():
+            stokes = self.dataset[["i", "q", "u"]].isel({"number_of_views": list(self.nadir_indices)})
+            stokes = stokes.astype(np.float32).load()
+            rgb_stokes = (stokes - stokes.min()) / (stokes.max() - stokes.min())
+            return (rgb_stokes ** (3 / 4)).astype(np.float32)
+        return self._derived("rgb_stokes", compute)
+
+    @cached_property
+    def crop_window(self):
+        """A mask of the rows and columns with valid data in the nadir views, to crop the plots with"""
+        window = self.rgb_stokes["i"].notnull().all("number_of_views")
+        return window.any("bins_along_track") & window.any("bins_across_track")
+
+    @cached_property
+    def view_means(self):
+        """The mean DoLP and reflectance of each view over the granule (float32)"""
+        def compute():
+            bins = ["bins_along_track", "bins_across_track"]
+            return xr.Dataset({
+                "dolp": self.dataset["dolp"].astype(np.float32).mean(bins),
+                "reflectance": self.reflectance.mean(bins),
+            }).astype(np.float32)
+        return self._derived("view_means", compute)
+
+    def _derived(self, name, compute):
+        """
+        Helper function to load a derived product from the persisted file,
+        or compute it (and persist it if `persist_derived` is set)
+        """
+        with span(f"HARP2.{name}") as s:
+            if self.derived_path is not None and self.derived_path.exists():
+                try:
+                    ds = xr.load_dataset(self.derived_path, group=name)
+                    s.set(persisted=True, nbytes=int(ds.nbytes))
+                    return ds
+                except OSError:
+                    pass
+            ds = compute().load()
+            s.set(persisted=False, nbytes=int(ds.nbytes))
+            if self.derived_path is not None:
+                ds.to_netcdf(self.derived_path, mode="a" if self.derived_path.exists() else "w", group=name)
+        return ds
+
+    @traced()
     def angle_wavelength_plot(self):
         fig, (ax_angle, ax_wavelength) = plt.subplots(2, 1, figsize=(14, 7))
         ax_angle.set_ylabel("View Angle (degrees)")
@@ -76,32 +165,14 @@ class HARP2:
         plt.close()
 
     # Understanding Polarimetry
+    @traced()
     def iqu_plot(self):
-        stokes = self.dataset[["i", "q", "u"]]
-
-        green_nadir_idx = np.argmin(np.abs(self.angles[:10].values))
-        red_nadir_idx = 10 + np.argmin(np.abs(self.angles[10:70].values))
-        blue_nadir_idx = 80 + np.argmin(np.abs(self.angles[80:].values))
-
-        rgb_stokes = stokes.isel(
-            {
-                "number_of_views": [red_nadir_idx, green_nadir_idx, blue_nadir_idx],
-            }
-        )
-
-        rgb_stokes = (rgb_stokes - rgb_stokes.min()) / (rgb_stokes.max() - rgb_stokes.min())
-        rgb_stokes = rgb_stokes ** (3 / 4)
-
-        window = rgb_stokes["i"].notnull().all("number_of_views")
-        crop_rgb_stokes = rgb_stokes.where(
-            window.any("bins_along_track") & window.any("bins_across_track"),
-            drop=True,
-        )
+        crop_rgb_stokes = self.rgb_stokes.where(self.crop_window, drop=True)
         crs_proj = ccrs.PlateCarree(-170)
         crs_data = ccrs.PlateCarree()
 
         fig, ax = plt.subplots(1, 3, figsize=(16, 5), subplot_kw={"projection": crs_proj})
-        fig.suptitle(f'{self.prod.attrs["product_name"]} RGB')
+        fig.suptitle(f'{self.dataset.attrs["product_name"]} RGB')
 
         for i, (key, value) in enumerate(crop_rgb_stokes.items()):
             ax[i].pcolormesh(value["longitude"], value["latitude"], value, transform=crs_data)
@@ -114,45 +185,19 @@ class HARP2:
         plt.close()
 
     # DoLP: Degree of Linear Polarization
+    @traced()
     def plot_degree_of_linear_polarization(self):
-        green_nadir_idx = np.argmin(np.abs(self.angles[:10].values))
-        red_nadir_idx = 10 + np.argmin(np.abs(self.angles[10:70].values))
-        blue_nadir_idx = 80 + np.argmin(np.abs(self.angles[80:].values))
-
-        stokes = self.dataset[["i", "q", "u"]]
-
-        rgb_stokes = stokes.isel(
-            {
-                "number_of_views": [red_nadir_idx, green_nadir_idx, blue_nadir_idx],
-            }
-        )
-
-        rgb_stokes = (rgb_stokes - rgb_stokes.min()) / (rgb_stokes.max() - rgb_stokes.min())
-        rgb_stokes = rgb_stokes ** (3 / 4)
-
-        window = rgb_stokes["i"].notnull().all("number_of_views")
-        crop_rgb_stokes = rgb_stokes.where(
-            window.any("bins_along_track") & window.any("bins_across_track"),
-            drop=True,
-        )
+        crop_rgb_stokes = self.rgb_stokes.where(self.crop_window, drop=True)
 
         crs_proj = ccrs.PlateCarree(-170)
         crs_data = ccrs.PlateCarree()
 
-        rgb_dolp = self.dataset["dolp"].isel(
-            {
-                "number_of_views": [red_nadir_idx, green_nadir_idx, blue_nadir_idx],
-            }
-        )
-        window = rgb_stokes["i"].notnull().all("number_of_views")
-        crop_rgb_dolp = rgb_dolp.where(
-            window.any("bins_along_track") & window.any("bins_across_track"),
-            drop=True,
-        )
+        rgb_dolp = self.dataset["dolp"].isel({"number_of_views": list(self.nadir_indices)})
+        crop_rgb_dolp = rgb_dolp.where(self.crop_window, drop=True)
         crop_rgb = xr.merge((crop_rgb_dolp, crop_rgb_stokes))
 
         fig, ax = plt.subplots(1, 2, figsize=(16, 8), subplot_kw={"projection": crs_proj})
-        fig.suptitle(f'{self.prod.attrs["product_name"]} RGB')
+        fig.suptitle(f'{self.dataset.attrs["product_name"]} RGB')
 
         for i, (key, value) in enumerate(crop_rgb[["i", "dolp"]].items()):
             ax[i].pcolormesh(value["longitude"], value["latitude"], value, transform=crs_data)
@@ -165,8 +210,9 @@ class HARP2:
         plt.close()
 
     # Mean DoLP by View Angle
+    @traced()
     def mean_dolp_by_view_angle(self):
-        dolp_mean = self.dataset["dolp"].mean(["bins_along_track", "bins_across_track"])
+        dolp_mean = self.view_means["dolp"]
         dolp_mean = (dolp_mean - dolp_mean.min()) / (dolp_mean.max() - dolp_mean.min())
 
         fig, ax = plt.subplots(figsize=(16, 6))
@@ -204,17 +250,12 @@ class HARP2:
 
         Returns: Reflectance.
         """
-        return (r**2) * np.pi * rad / np.cos(sza * np.pi / 180) / f0
+        return radiance_to_reflectance(rad, f0, sza, r)
 
+    @traced()
     def plot_radiance_reflection(self):
-        refl = HARP2.rad_to_refl(
-            rad=self.dataset["i"],
-            f0=self.view["intensity_f0"],
-            sza=self.dataset["solar_zenith_angle"],
-            r=float(self.dataset.attrs["sun_earth_distance"]),
-        )
-
-        red_nadir_idx = 10 + np.argmin(np.abs(self.angles[10:70].values))
+        refl = self.reflectance
+        red_nadir_idx, _, _ = self.nadir_indices
 
         fig, ax = plt.subplots(1, 2, figsize=(16, 8))
         ax[0].imshow(self.dataset["i"].sel({"number_of_views": red_nadir_idx}), cmap="gray")
@@ -226,18 +267,12 @@ class HARP2:
         plt.close()
 
     # Mean reflectance for each view angle and spectral channel -- flatness as a sanity check
+    @traced()
     def mean_reflectance_check(self):
-        refl = HARP2.rad_to_refl(
-            rad=self.dataset["i"],
-            f0=self.view["intensity_f0"],
-            sza=self.dataset["solar_zenith_angle"],
-            r=float(self.dataset.attrs["sun_earth_distance"]),
-        )
-
         fig, ax = plt.subplots(figsize=(16, 6))
         wv_uq = np.unique(self.wavelengths.values)
         plot_data = [("b", "o"), ("g", "^"), ("r", "*"), ("black", "s")]
-        refl_mean = refl.mean(["bins_along_track", "bins_across_track"])
+        refl_mean = self.view_means["reflectance"]
         for wv_idx in range(4):
             wv = wv_uq[wv_idx]
             wv_mask = self.wavelengths.values == wv
@@ -259,13 +294,9 @@ class HARP2:
         plt.savefig(self.save_dir / "mean_reflectance_check.png")
         plt.close()
 
+    @traced()
     def create_animation(self):
-        refl = HARP2.rad_to_refl(
-            rad=self.dataset["i"],
-            f0=self.view["intensity_f0"],
-            sza=self.dataset["solar_zenith_angle"],
-            r=float(self.dataset.attrs["sun_earth_distance"]),
-        )
+        refl = self.reflectance
         # Get reflectances of red channel and normalize
         refl_red = refl[..., 10:70]
         refl_pretty = (refl_red - refl_red.min()) / (refl_red.max() - refl_red.min())
@@ -280,22 +311,33 @@ class HARP2:
         fig, ax = plt.subplots()
         im = ax.imshow(refl_pretty[{"number_of_views": 0}], cmap="gray")
 
-        def update(i):
-            im.set_data(refl_pretty[{"number_of_views": i}])
-            return im
+        def render_frames():
+            # Only the image data changes, so draw the figure to its canvas and pass the buffer on
+            for i in frames:
+                im.set_data(refl_pretty[{"number_of_views": i}])
+                yield figure_frame(fig)
 
-        an = animation.FuncAnimation(fig=fig, func=update, frames=frames, interval=30)
         filename = f'{self.save_dir}/harp2_red_anim_{self.dataset.attrs["product_name"].split(".")[1]}.gif'
-        an.save(filename, writer="pillow")
+        write_animation(render_frames(), filename, duration=30)
         plt.close()
 
 
-def visualize_harp2_data(data_dir: Path, verbose=True):
-    """Loop through a directory with HARP2 data files and create visualizations for them"""
-    for file in os.listdir(data_dir):
-        if verbose: print("Processing", file)
-        file_path = data_dir / file
-        HARP2(file_path).create_visualizations()
+def visualize_harp2_data(data_dir: Path, verbose=True, max_workers: int = None, persist_derived=False):
+    """
+    Create visualizations for each HARP2 data file in a directory,
+    with max_workers files processed in parallel (defaults to the number of CPUs).
+    If persist_derived is set to True, the derived products of each file are saved next to it (see `HARP2`)
+    """
+    files = list_granules(data_dir)
+    run_in_parallel(partial(visualize_harp2_file, persist_derived=persist_derived), files, max_workers,
+                    verbose=verbose)
+
+def visualize_harp2_file(file_path: Path, persist_derived=False):
+    """
+    Create the visualizations of one HARP2 data file, ex. as a task of `scripts/run_pipeline.py`.
+    If persist_derived is set to True, the derived products of the file are saved next to it (see `HARP2`)
+    """
+    HARP2(file_path, persist_derived).create_visualizations()
 
 
 if __name__ == '__main__':
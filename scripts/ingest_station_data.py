@@ -0,0 +1,25 @@
+import sys
+from pathlib import Path
+
+sys.path.append(".")
+from src.analysis.station_data import StationStore
+
+
+if __name__ == '__main__':
+    """
+    Converts the EPA and NOAA CSVs in data/ into the station store once (already converted CSVs are skipped).
+    The notebooks can then load, for example, every pollutant at one site with
+    `StationStore().station_table("Los Angeles-North Main Street", start="2025-01-01", end="2025-05-01")`
+    """
+    store = StationStore(Path("data/stations"))
+
+    for pollutant in ["PM25", "PM10", "NO2", "CO", "ozone"]:
+        csv_path = Path(f"data/LA_{pollutant}_2025.csv")
+        if csv_path.exists():
+            store.ingest_epa(csv_path, pollutant.lower())
+
+    ## Uncomment to convert the nationwide daily files (https://aqs.epa.gov/aqsweb/airdata/download_files.html)
+    # for csv_path in Path("data/epa").glob("daily_*.csv"):
+    #     store.ingest_epa(csv_path)
+
+    store.ingest_noaa(Path("data/noaa_weather_data.csv"))
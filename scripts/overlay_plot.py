@@ -4,10 +4,17 @@ import numpy as np
 import cartopy.crs as ccrs
 import matplotlib.pyplot as plt
 from pathlib import Path
+from functools import partial
 
 sys.path.append(".")
-from src.plotting.plotting_functions import open_file_as_xr, _extract_date_from_file, _create_image_subdir
-
+from src.plotting.plotting_functions import _extract_date_from_file, _create_image_subdir
+from src.processing.granule_reader import read_variables
+from src.plotting.figure_templates import get_map_template
+from src.processing.parallel import run_in_parallel
+from src.processing.granule_index import join_granules
+from src.profiling.trace import span, traced
+
+@traced()
 def overlay_plot(bgc_file, aop_file, landvi_file, bgc_var="chlor_a", aop_var="aot_865", landvi_var="ndvi",
                  min_lon=-118.75, max_lon=-118.45, min_lat=33.99, max_lat=34.15, padding=1, zoomed_map=True,
                  cmaps = ['viridis', 'Greys', 'Greens'], alphas = [0.7, 0.4, 1], 
@@ -16,70 +23,88 @@ def overlay_plot(bgc_file, aop_file, landvi_file, bgc_var="chlor_a", aop_var="ao
     Creates an overlayed plot with variables from BGC, AOP, and LANDVI files.
     Assumes the files are from the same date/time and location.
     """
-    # Load datasets
-    bgc = open_file_as_xr(bgc_file, bgc_var)
-    aop = open_file_as_xr(aop_file, aop_var)
-    landvi = open_file_as_xr(landvi_file, landvi_var)
+    # Load the variables in the AOI. The granules of a pass share their navigation data,
+    # so the lat/lon and the AOI window come from the BGC granule and only the variables are read
+    # from the other two
+    bbox = (min_lon, min_lat, max_lon, max_lat) if zoomed_map else None
+    lon, lat, bgc = read_variables(bgc_file, [bgc_var], bbox, padding)
+    _, _, aop = read_variables(aop_file, [aop_var], bbox, padding, coords=False)
+    _, _, landvi = read_variables(landvi_file, [landvi_var], bbox, padding, coords=False)
+
+    bgc_values = np.log(bgc[bgc_var])
+    aop_values = aop[aop_var]
+    landvi_values = landvi[landvi_var]
+
+    date_str = _extract_date_from_file(bgc_file)
+    title = f"{date_str} - BGC ({bgc_var}), AOP ({aop_var}), LANDVI ({landvi_var})"
+    save_dir = Path("images/BGC_AOP_LANDVI_Overlay")
+    os.makedirs(save_dir, exist_ok=True)
 
-    lon = bgc['longitude'].values
-    lat = bgc['latitude'].values
+    layers = [
+        {"label": label, "color_map": cmap, "alpha": alpha, "vmin": min_max[0], "vmax": min_max[1]}
+        for label, cmap, alpha, min_max in zip([f'Log of {bgc_var}', aop_var, landvi_var], cmaps, alphas,
+                                               min_max_values)
+    ]
+    colorbar_kwargs = {"orientation": "vertical", "shrink": 0.6, "pad": 0.02}
 
-    bgc_values = np.log(bgc[bgc_var].values)
-    aop_values = aop[aop_var].values
-    landvi_values = landvi[landvi_var].values
+    if zoomed_map:
+        # Reuse the overlay figure across passes, only swapping the data and title
+        extent = [min_lon - padding, max_lon + padding, min_lat - padding, max_lat + padding]
+        template = get_map_template(extent, layers, colorbar_kwargs=colorbar_kwargs, colorbar_fontsize=10,
+                                    axis_labels=False)
+        template.render(lon, lat, [bgc_values, aop_values, landvi_values], title, save_dir / date_str)
+        return
 
     # Prepare map
     fig = plt.figure(figsize=(10, 6))
     ax = plt.axes(projection=ccrs.PlateCarree())
 
-    if zoomed_map:
-        min_lon -= padding
-        max_lon += padding
-        min_lat -= padding
-        max_lat += padding
-
-        # Create a mask for the bounding box
-        lon_mask = (lon >= min_lon) & (lon <= max_lon)
-        lat_mask = (lat >= min_lat) & (lat <= max_lat)
-
-        # Apply the mask using array slicing
-        valid_rows = np.where(lat_mask.any(axis=1))[0]  # Get valid row indices
-        valid_cols = np.where(lon_mask.any(axis=0))[0]  # Get valid col indices
-
-        # Subset the data using row and column indices
-        lon = lon[np.min(valid_rows):np.max(valid_rows)+1, np.min(valid_cols):np.max(valid_cols)+1]
-        lat = lat[np.min(valid_rows):np.max(valid_rows)+1, np.min(valid_cols):np.max(valid_cols)+1]
-        bgc_values = bgc_values[np.min(valid_rows):np.max(valid_rows)+1, np.min(valid_cols):np.max(valid_cols)+1]
-        aop_values = aop_values[np.min(valid_rows):np.max(valid_rows)+1, np.min(valid_cols):np.max(valid_cols)+1]
-        landvi_values = landvi_values[np.min(valid_rows):np.max(valid_rows)+1, np.min(valid_cols):np.max(valid_cols)+1]
-
-        ax.set_extent([min_lon, max_lon, min_lat, max_lat], crs=ccrs.PlateCarree()) 
-
     meshes = []
-    for var, cmap, alpha, min_max in zip([bgc_values, aop_values, landvi_values], cmaps, alphas, min_max_values):
-        mesh = ax.pcolormesh(lon, lat, var, cmap=cmap, shading='auto', transform=ccrs.PlateCarree(),
-                             alpha=alpha, vmin=min_max[0], vmax=min_max[1])
+    for var, layer in zip([bgc_values, aop_values, landvi_values], layers):
+        mesh = ax.pcolormesh(lon, lat, var, cmap=layer["color_map"], shading='auto', transform=ccrs.PlateCarree(),
+                             alpha=layer["alpha"], vmin=layer["vmin"], vmax=layer["vmax"])
         meshes.append(mesh)
 
     # After the loop, add one colorbar for each layer
-    for mesh, label in zip(meshes, [f'Log of {bgc_var}', aop_var, landvi_var]):
-        cbar = plt.colorbar(mesh, ax=ax, orientation='vertical', shrink=0.6, pad=0.02)
-        cbar.set_label(label, fontsize=10)
+    for mesh, layer in zip(meshes, layers):
+        cbar = plt.colorbar(mesh, ax=ax, **colorbar_kwargs)
+        cbar.set_label(layer["label"], fontsize=10)
         
     # Add coastlines, borders
     ax.coastlines()
     gl = ax.gridlines(draw_labels=True, linestyle="--", alpha=0.5)
     gl.top_labels = False  # Remove top labels
     gl.right_labels = False  # Remove right labels
-    date_str = _extract_date_from_file(bgc_file)
-    ax.set_title(f"{date_str} - BGC ({bgc_var}), AOP ({aop_var}), LANDVI ({landvi_var})")
+    ax.set_title(title)
 
     # Save the file
-    save_dir = Path("images/BGC_AOP_LANDVI_Overlay")
-    os.makedirs(save_dir, exist_ok=True)
-    plt.savefig(save_dir / date_str)
+    with span("savefig", file=date_str):
+        plt.savefig(save_dir / date_str)
     plt.close()
 
+def overlay_passes(bgc_dir: Path, aop_dir: Path, landvi_dir: Path, max_workers: int = None, verbose=True,
+                   **kwargs):
+    """
+    Creates the overlay plot of every pass that has a BGC, AOP, and LANDVI granule.
+    The granules are joined by the pass timestamp in their file names, and the passes
+    are plotted in parallel.
+
+    Params:
+        bgc_dir (Path): a directory with PACE OCI L2 BGC granules
+        aop_dir (Path): a directory with PACE OCI L2 AOP granules
+        landvi_dir (Path): a directory with PACE OCI L2 LANDVI granules
+        max_workers (int): the number of processes plotting passes in parallel, defaults to the number of CPUs
+        verbose (bool): writes print statements about the progress if set to True
+        kwargs: other keyword arguments for `overlay_plot` (ex. padding, bgc_var)
+    """
+    passes = join_granules({"bgc": bgc_dir, "aop": aop_dir, "landvi": landvi_dir}, verbose=verbose)
+    files = [(granules["bgc"], granules["aop"], granules["landvi"]) for _, granules in passes]
+    run_in_parallel(partial(_overlay_pass, **kwargs), files, max_workers, verbose=verbose)
+
+def _overlay_pass(files, **kwargs):
+    """Helper function to plot the overlay of one pass, given its (BGC, AOP, LANDVI) files"""
+    overlay_plot(*files, **kwargs)
+
 
 if __name__ == '__main__':
     # bgc_file = Path("data/PACE_OCI_L2_BGC_NRT/PACE_OCI.20250104T202321.L2.OC_BGC.V3_0.NRT.nc")
@@ -90,9 +115,4 @@ if __name__ == '__main__':
     bgc_dir = Path("data/PACE_OCI_L2_BGC_NRT")
     aop_dir = Path("data/PACE_OCI_L2_AOP_NRT")
     landvi_dir = Path("data/PACE_OCI_L2_LANDVI_NRT")
-    for bgc_file, aop_file, landvi_file in zip(bgc_dir.iterdir(), aop_dir.iterdir(), landvi_dir.iterdir()):
-        try:
-            overlay_plot(bgc_file, aop_file, landvi_file, padding=0)
-        except Exception as e:
-            print(f"Skipping file {bgc_file.name}: {e}")
-            continue
+    overlay_passes(bgc_dir, aop_dir, landvi_dir, padding=0)
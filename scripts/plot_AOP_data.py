@@ -1,12 +1,29 @@
-import os
 import sys
 import numpy as np
 from pathlib import Path
+from functools import partial
 
 sys.path.append(".")
-from src.plotting.plotting_functions import plot_variable, print_metadata
+from src.plotting.plotting_functions import plot_variable, plot_variables, print_metadata
+from src.processing.granule_index import list_granules
+from src.processing.parallel import run_in_parallel
 
-def plot_AOP_data(aop_directory: Path, verbose=True):
+# The AOP variables to plot and how to plot them
+AOP_VARIABLES = [
+    {"var_of_interest": "aot_865", "var_label": "AOT at 865 nm",
+     "plot_title": "Aerosol optical thickness at 865 nm", "color_map": "inferno", "vmin": 0, "vmax": 0.35},
+    # {"var_of_interest": "Rrs", "var_label": "Remote Reflectance (sr^-1)",
+    #  "plot_title": "Remote Sensing Reflectance", "color_map": "ocean"},
+    {"var_of_interest": "nflh", "var_label": "Normalized Fluorescence Line Height (W m^-2 um^-1 sr^-1)",
+     "plot_title": "Normalized Fluorescence Line Height (NFLH)", "color_map": "turbo"},
+    {"var_of_interest": "angstrom", "var_label": "Aerosol Angstrom exponent (443-865nm)",
+     "plot_title": "Aerosol Angstrom exponent", "color_map": "coolwarm"},
+    {"var_of_interest": "avw", "var_label": "Apparent Visible Wavelenth (400-700nm)",
+     "plot_title": "Apparent Visible Wavelength", "color_map": "coolwarm"},
+]
+
+
+def plot_AOP_data(aop_directory: Path, verbose=True, max_workers: int = None):
     """
     Plots Aerosol Optical Thickness (AOT), NFLH, Angstrom, and AVW
     for all the downloaded Level 2 AOP data in the given directory.
@@ -14,30 +31,11 @@ def plot_AOP_data(aop_directory: Path, verbose=True):
     Params:
         aop_directory: a path to a directory containing PACE OCI L2 AOP downloaded data
         verbose (bool): writes print statements about the progress if set to True
+        max_workers (int): the number of processes plotting files in parallel, defaults to the number of CPUs
     """
-    for file in os.listdir(aop_directory):
-        file_path = aop_directory / file
-        if verbose:
-            print("File:", file_path.name)
-            print(" Plotting AOT")
-        plot_variable(file_path, "aot_865", "AOT at 865 nm", "Aerosol optical thickness at 865 nm",
-                      color_map="inferno", vmin=0, vmax=0.35)
-
-        # if verbose: print(" Plotting Rrs")
-        # plot_variable(file_path, "Rrs", "Remote Reflectance (sr^-1)", "Remote Sensing Reflectance",
-        #               color_map="ocean")
-
-        if verbose: print(" Plotting NFLH")
-        plot_variable(file_path, "nflh", "Normalized Fluorescence Line Height (W m^-2 um^-1 sr^-1)",
-            "Normalized Fluorescence Line Height (NFLH)", color_map="turbo")
-        
-        if verbose: print(" Plotting angstrom")
-        plot_variable(file_path, "angstrom", "Aerosol Angstrom exponent (443-865nm)",
-            "Aerosol Angstrom exponent", color_map="coolwarm")
-        
-        if verbose: print(" Plotting avw")
-        plot_variable(file_path, "avw", "Apparent Visible Wavelenth (400-700nm)",
-            "Apparent Visible Wavelength", color_map="coolwarm")
+    if verbose: print("Plotting AOT, NFLH, angstrom, and avw")
+    files = list_granules(aop_directory)
+    run_in_parallel(partial(plot_variables, var_specs=AOP_VARIABLES), files, max_workers, verbose=verbose)
 
 
 if __name__ == '__main__':
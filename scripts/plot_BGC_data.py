@@ -1,13 +1,27 @@
-import os
 import sys
 import numpy as np
 from pathlib import Path
+from functools import partial
 
 sys.path.append(".")
-from src.plotting.plotting_functions import plot_variable, print_metadata
+from src.plotting.plotting_functions import plot_variables, print_metadata
+from src.processing.granule_index import list_granules
+from src.processing.parallel import run_in_parallel
 
 
-def plot_BGC_data(bgc_directory: Path, verbose=True):
+# The BGC variables to plot and how to plot them
+BGC_VARIABLES = [
+    {"var_of_interest": "chlor_a", "var_label": "Log of Chlorophyll-a (mg/m³)",
+     "plot_title": "Chlorophyll-a Concentration", "transformation": np.log, "vmin": -6, "vmax": 6},
+    {"var_of_interest": "poc", "var_label": "Particulate Organic Carbon (mg/m³)",
+     "plot_title": "POC Concentration", "color_map": "cividis", "transformation": np.log1p, "vmin": 0, "vmax": 7.5},
+    {"var_of_interest": "carbon_phyto", "var_label": "Phytoplankton Carbon (mg/m³)",
+     "plot_title": "Phytoplankton Carbon Concentration", "color_map": "plasma", "transformation": np.log,
+     "vmin": 0, "vmax": 7},
+]
+
+
+def plot_BGC_data(bgc_directory: Path, verbose=True, max_workers: int = None):
     """
     Plots chlorophyll-a, particulate organic carbon, and phytoplankton carbon concentrations
     for all the downloaded Level 2 BGC data in the given directory.
@@ -15,22 +29,11 @@ def plot_BGC_data(bgc_directory: Path, verbose=True):
     Params:
         bgc_directory: a path to a directory containing PACE OCI L2 BGC downloaded data
         verbose (bool): writes print statements about the progress if set to True
+        max_workers (int): the number of processes plotting files in parallel, defaults to the number of CPUs
     """
-    for file in os.listdir(bgc_directory):
-        file_path = bgc_directory / file
-        if verbose:
-            print("File:", file_path.name)
-            print(" Plotting chlorophyll-a")
-        plot_variable(file_path, "chlor_a", "Log of Chlorophyll-a (mg/m³)",
-            "Chlorophyll-a Concentration", transformation=np.log, vmin=-6, vmax=6)
-
-        if verbose: print(" Plotting particulate organic carbon")
-        plot_variable(file_path, "poc", "Particulate Organic Carbon (mg/m³)",
-            "POC Concentration", color_map="cividis", transformation=np.log1p, vmin=0, vmax=7.5)
-
-        if verbose: print(" Plotting phytoplankton carbon")
-        plot_variable(file_path, "carbon_phyto", "Phytoplankton Carbon (mg/m³)",
-            "Phytoplankton Carbon Concentration", color_map="plasma", transformation=np.log, vmin=0, vmax=7)
+    if verbose: print("Plotting chlorophyll-a, particulate organic carbon, and phytoplankton carbon")
+    files = list_granules(bgc_directory)
+    run_in_parallel(partial(plot_variables, var_specs=BGC_VARIABLES), files, max_workers, verbose=verbose)
 
 
 if __name__ == '__main__':
@@ -1,51 +1,45 @@
-import os
 import sys
 import numpy as np
 from pathlib import Path
+from functools import partial
 
 sys.path.append(".")
-from src.plotting.plotting_functions import plot_variable, print_metadata
+from src.plotting.plotting_functions import plot_variables, print_metadata
+from src.processing.granule_index import list_granules
+from src.processing.parallel import run_in_parallel
 
 
-def plot_LANDVI_data(landvi_dir: Path, verbose=True):
+# The LANDVI variables to plot and how to plot them
+LANDVI_VARIABLES = [
+    {"var_of_interest": "ndvi", "var_label": "Normalized Difference Vegetation Index",
+     "plot_title": "Normalized Difference Vegetation Index", "color_map": "YlGn", "vmin": -1, "vmax": 1},
+    {"var_of_interest": "evi", "var_label": "Enhanced Vegetation Index",
+     "plot_title": "Enhanced Vegetation Index", "color_map": "YlGn", "vmin": -1, "vmax": 1},
+    {"var_of_interest": "ndwi", "var_label": "Normalized Difference Water Index",
+     "plot_title": "Normalized Difference Water Index", "color_map": "Blues", "vmin": -1, "vmax": 1},
+    {"var_of_interest": "ndii", "var_label": "Normalized Difference Infrared Index",
+     "plot_title": "Normalized Difference Infrared Index", "color_map": "Blues", "vmin": -1, "vmax": 1},
+    {"var_of_interest": "pri", "var_label": "Photochemical Reflectance Index",
+     "plot_title": "Photochemical Reflectance Index", "color_map": "cividis", "vmin": -0.2, "vmax": 0.2},
+    {"var_of_interest": "cci", "var_label": "Chlorophyll-Cartenoid Index",
+     "plot_title": "Chlorophyll-Cartenoid Index", "color_map": "cividis", "vmin": -0.3, "vmax": 0.3},
+    {"var_of_interest": "cire", "var_label": "Chlorophyll Index Red Edge",
+     "plot_title": "Chlorophyll Index Red Edge", "color_map": "YlGn", "vmin": 0, "vmax": 5},
+]
+
+
+def plot_LANDVI_data(landvi_dir: Path, verbose=True, max_workers: int = None):
     """
     Plots different land index plots for all the downloaded L2 LANDVI data in the given directory.
 
     Params:
         landvi_dir: a path to a directory containing PACE OCI L2 BGC downloaded data
         verbose (bool): writes print statements about the progress if set to True
+        max_workers (int): the number of processes plotting files in parallel, defaults to the number of CPUs
     """
-    for file in os.listdir(landvi_dir):
-        file_path = landvi_dir / file
-        if verbose:
-            print("File:", file_path.name)
-            print(" Plotting NDVI")
-        plot_variable(file_path, "ndvi", "Normalized Difference Vegetation Index",
-            "Normalized Difference Vegetation Index", color_map='YlGn', vmin=-1, vmax=1)
-
-        if verbose: print(" Plotting EVI")
-        plot_variable(file_path, "evi", "Enhanced Vegetation Index",
-            "Enhanced Vegetation Index", color_map='YlGn', vmin=-1, vmax=1)
-
-        if verbose: print(" Plotting NDWI")
-        plot_variable(file_path, "ndwi", "Normalized Difference Water Index",
-            "Normalized Difference Water Index", color_map="Blues", vmin=-1, vmax=1)
-        
-        if verbose: print(" Plotting NDII")
-        plot_variable(file_path, "ndii", "Normalized Difference Infrared Index",
-            "Normalized Difference Infrared Index", color_map="Blues", vmin=-1, vmax=1)
-
-        if verbose: print(" Plotting PRI")
-        plot_variable(file_path, "pri", "Photochemical Reflectance Index",
-            "Photochemical Reflectance Index", color_map="cividis", vmin=-0.2, vmax=0.2)
-        
-        if verbose: print(" Plotting CCI")
-        plot_variable(file_path, "cci", "Chlorophyll-Cartenoid Index",
-            "Chlorophyll-Cartenoid Index", color_map="cividis", vmin=-0.3, vmax=0.3)
-        
-        if verbose: print(" Plotting CIRE")
-        plot_variable(file_path, "cire", "Chlorophyll Index Red Edge",
-            "Chlorophyll Index Red Edge", color_map="YlGn", vmin=0, vmax=5)
+    if verbose: print("Plotting NDVI, EVI, NDWI, NDII, PRI, CCI, and CIRE")
+    files = list_granules(landvi_dir)
+    run_in_parallel(partial(plot_variables, var_specs=LANDVI_VARIABLES), files, max_workers, verbose=verbose)
 
 if __name__ == '__main__':
     """
@@ -1,32 +1,30 @@
 
-import os
 import sys
 import numpy as np
 from pathlib import Path
+from functools import partial
 
 sys.path.append(".")
 from src.plotting.plotting_functions import plot_variable, print_metadata
+from src.processing.granule_index import list_granules
+from src.processing.parallel import run_in_parallel
 
 
-def plot_MODISA_data(data_directory: Path, verbose=True):
+def plot_MODISA_data(data_directory: Path, verbose=True, max_workers: int = None):
     """
     Plots chlorophyll-a concentrations Aqua MODIS data in the given directory.
 
     Params:
         bgc_directory: a path to a directory containing PACE OCI L2 BGC downloaded data
         verbose (bool): writes print statements about the progress if set to True
+        max_workers (int): the number of processes plotting files in parallel, defaults to the number of CPUs
     """
-    for file in os.listdir(data_directory):
-        file_path = data_directory / file
-        try:
-            plot_variable(file_path, "chlor_a", "Log of Chlorophyll-a (mg/m³)",
-                "Chlorophyll-a Concentration", transformation=np.log, vmin=-6, vmax=6, padding=0)
-            if verbose:
-                print("File:", file_path.name)
-                print(" Plotting chlorophyll-a")
-        except Exception as e:
-            print("Error processing", file_path.name)
-            continue
+    if verbose: print("Plotting chlorophyll-a")
+    plot_chlor_a = partial(plot_variable, var_of_interest="chlor_a", var_label="Log of Chlorophyll-a (mg/m³)",
+                           plot_title="Chlorophyll-a Concentration", transformation=np.log, vmin=-6, vmax=6,
+                           padding=0)
+    files = list_granules(data_directory)
+    run_in_parallel(plot_chlor_a, files, max_workers, verbose=verbose)
 
 if __name__ == '__main__':
 
@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(".")
+from src.processing.stats_store import AOIStatsStore
+
+# The variables summarized for each product, and the transformations applied before summarizing
+PRODUCTS = {
+    "PACE_OCI_L2_BGC_NRT": (["chlor_a", "poc", "carbon_phyto"], {"chlor_a": np.log}),
+    "PACE_OCI_L2_AOP_NRT": (["aot_865", "angstrom"], None),
+    "PACE_OCI_L2_LANDVI_NRT": (["ndvi", "evi", "ndwi", "ndii"], None),
+    "MODISA_L2_OC": (["chlor_a"], {"chlor_a": np.log}),
+}
+
+
+def refresh_aoi_stats(store: AOIStatsStore, bbox: tuple, aoi: str, data_dir: Path = Path("data"),
+                      max_workers: int = None, verbose=True):
+    """
+    Adds the AOI statistics of newly downloaded granules of every product to the store.
+    Products that haven't been downloaded are skipped.
+
+    Params:
+        store (AOIStatsStore): the store of AOI statistics
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        aoi (str): the name of the AOI
+        data_dir (Path): the directory with a subdirectory of granules per product
+        max_workers (int): the number of processes summarizing granules in parallel
+        verbose (bool): writes print statements about the progress if set to True
+    """
+    for product, (variables, transformations) in PRODUCTS.items():
+        if not (data_dir / product).exists():
+            if verbose: print("Skipping", product, "- not downloaded")
+            continue
+        store.refresh(product, data_dir / product, variables, bbox, aoi, transformations,
+                      max_workers=max_workers, verbose=verbose)
+
+
+if __name__ == '__main__':
+    """
+    Run after downloading new granules: only the granules that aren't in the store yet are summarized.
+    The time series can then be read in the notebooks with, for example,
+    `AOIStatsStore().read("PACE_OCI_L2_BGC_NRT", ["chlor_a"], aoi="pacific_palisades")`
+    """
+    pacific_pal_bbox = (-118.75, 33.99, -118.45, 34.15)
+    store = AOIStatsStore(Path("data/aoi_stats"))
+
+    refresh_aoi_stats(store, pacific_pal_bbox, "pacific_palisades")
+
+    ## Uncomment to merge the small files of the daily refreshes
+    # store.compact()
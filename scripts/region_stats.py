@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(".")
+from src.processing.aoi_stats import write_statistics
+from src.processing.granule_index import list_granules
+from src.processing.regions import RegionSet, summarize_regions
+
+
+if __name__ == '__main__':
+    """
+    Computes the statistics of every region for every granule, reading each granule once.
+    Assumes the data is already downloaded using `download_data.py`
+    """
+    regions = RegionSet.from_bboxes({
+        "pacific_palisades": (-118.75, 33.99, -118.45, 34.15),
+        "santa_monica_bay": (-118.95, 33.75, -118.45, 33.99),
+        "offshore_control": (-119.60, 33.40, -119.10, 33.80),
+    })
+    ## Uncomment to use polygons (ex. burn scars and plumes) from a GeoJSON file instead
+    # regions = RegionSet.from_file(Path("data/regions.geojson"), name_column="name")
+
+    files = list_granules("data/PACE_OCI_L2_BGC_NRT")
+    table = summarize_regions(files, ["chlor_a", "poc", "carbon_phyto"], regions, {"chlor_a": np.log})
+    write_statistics(table.reset_index(), Path("data/stats/bgc_region_stats.csv"))
+    print(table)
@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import platform
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+sys.path.append(".")
+from src.plotting.plotting_functions import open_file_as_xr, plot_variable
+from src.processing.aoi_stats import summarize_granules, write_statistics
+from src.synthetic.granules import write_granules, OCI_PRODUCTS
+from scripts.overlay_plot import overlay_plot
+from scripts.harp2_data import HARP2
+from scripts.create_gifs import create_gif
+
+PACIFIC_PAL_BBOX = (-118.75, 33.99, -118.45, 34.15)
+
+
+def time_function(function, repeat: int = 3):
+    """
+    Times a function a number of times.
+
+    Returns:
+        dict: the time of the first (cold caches) run, and the best and median time of all runs in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+        plt.close("all")
+    return {"first_s": times[0], "best_s": min(times), "median_s": float(np.median(times)), "repeat": repeat}
+
+def run_benchmarks(swath_sizes: list[tuple] = ((400, 300), (1710, 1272)), granule_counts: list[int] = (1, 4, 8),
+                   variable_counts: list[int] = (1, 3), harp2_sizes: list[tuple] = ((120, 100), (395, 519)),
+                   repeat: int = 3, verbose=True):
+    """
+    Times the main functions of the project on synthetic granules (see `src/synthetic/granules.py`), so
+    no downloaded data or network access is needed. The granules and images are written to a temporary
+    directory.
+
+    Params:
+        swath_sizes (list): the (number_of_lines, pixels_per_line) of the OCI L2 granules
+        granule_counts (list): the numbers of granules summarized at once
+        variable_counts (list): the numbers of BGC variables summarized at once
+        harp2_sizes (list): the (bins_along_track, bins_across_track) of the HARP2 L1C granules
+        repeat (int): the number of times each benchmark is run
+        verbose (bool): writes print statements about the progress if set to True
+
+    Returns:
+        pd.DataFrame: a row per benchmark and parameters with the first, best, and median times
+    """
+    rows = []
+
+    def record(name, function, **params):
+        result = time_function(function, repeat)
+        rows.append({"benchmark": name, **params, **result})
+        if verbose: print(f"{name} {params}: first {result['first_s']:.3f}s, best {result['best_s']:.3f}s")
+
+    cwd = os.getcwd()
+    with TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            for size in swath_sizes:
+                swath = f"{size[0]}x{size[1]}"
+                if verbose: print("Writing synthetic OCI granules of", swath)
+                files = {product: write_granules(Path("data") / swath, product, max(granule_counts), size=size,
+                                                 n_wavelengths=16)
+                         for product in OCI_PRODUCTS}
+                bgc_file, aop_file, landvi_file = files["BGC"][0], files["AOP"][0], files["LANDVI"][0]
+
+                record("open_file_as_xr", lambda: open_file_as_xr(bgc_file, "chlor_a", PACIFIC_PAL_BBOX).load(),
+                       swath=swath)
+                record("plot_variable", lambda: plot_variable(bgc_file, "chlor_a", "log(chlor_a)", "Chlorophyll-a",
+                                                              transformation=np.log),
+                       swath=swath)
+                record("plot_variable_quicklook",
+                       lambda: plot_variable(bgc_file, "chlor_a", "log(chlor_a)", "Chlorophyll-a",
+                                             transformation=np.log, quicklook=True),
+                       swath=swath)
+                record("overlay_plot", lambda: overlay_plot(bgc_file, aop_file, landvi_file), swath=swath)
+
+                variables = OCI_PRODUCTS["BGC"][0]
+                for n_granules in granule_counts:
+                    for n_variables in variable_counts:
+                        record("summarize_granules",
+                               lambda: summarize_granules(files["BGC"][:n_granules], variables[:n_variables],
+                                                          PACIFIC_PAL_BBOX, max_workers=1, verbose=False),
+                               swath=swath, n_granules=n_granules, n_variables=n_variables)
+
+                record("create_gif", lambda: create_gif(Path("images/BGC_AOP_LANDVI_Overlay"), "bench.gif"),
+                       swath=swath)
+
+            for size in harp2_sizes:
+                swath = f"{size[0]}x{size[1]}"
+                if verbose: print("Writing a synthetic HARP2 granule of", swath)
+                harp2_file = write_granules(Path("data") / swath, "HARP2", 1, size=size)[0]
+                record("HARP2.reflectance", lambda: HARP2(harp2_file).reflectance, swath=swath)
+                for method in ("iqu_plot", "plot_degree_of_linear_polarization", "mean_dolp_by_view_angle",
+                               "plot_radiance_reflection", "create_animation"):
+                    harp2 = HARP2(harp2_file)
+                    # Compute the shared derived products first, so each plot is timed on its own
+                    harp2.reflectance, harp2.rgb_stokes
+                    record(f"HARP2.{method}", getattr(harp2, method), swath=swath)
+        finally:
+            os.chdir(cwd)
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    """
+    Runs the benchmarks on synthetic granules and saves the timings, to compare before and after a change.
+    Use smaller sizes for a quick check, ex. run_benchmarks(swath_sizes=[(400, 300)], harp2_sizes=[(120, 100)])
+    """
+    results = run_benchmarks()
+    results.insert(0, "python", platform.python_version())
+    output_path = write_statistics(results, Path(f"data/benchmarks/benchmarks_{time.strftime('%Y%m%dT%H%M%S')}.csv"))
+    print(results.to_string(index=False))
+    print("Results saved to", output_path)
@@ -0,0 +1,187 @@
+import sys
+from pathlib import Path
+
+sys.path.append(".")
+from src.pipeline.runner import Pipeline, Task
+from src.downloader.pace_data_downloader import PaceDataDownloader
+from src.downloader.granule_catalog import GranuleCatalog
+from src.downloader.granule_clipper import clip_granule, clipped_path
+from src.plotting.plotting_functions import plot_variables, _extract_date_from_file
+from src.processing.stats_store import AOIStatsStore, STATS_VERSION, aoi_name
+from src.processing.granule_index import granule_timestamp, list_granules
+from scripts.plot_BGC_data import BGC_VARIABLES
+from scripts.plot_AOP_data import AOP_VARIABLES
+from scripts.plot_LANDVI_data import LANDVI_VARIABLES
+from scripts.refresh_aoi_stats import PRODUCTS as STATS_PRODUCTS
+from scripts.overlay_plot import overlay_plot
+from scripts.create_gifs import create_gif
+from scripts.harp2_data import visualize_harp2_file
+
+# The OCI products of the pipeline: their version to download and the variables to plot
+OCI_PRODUCTS = {
+    "PACE_OCI_L2_BGC_NRT": (3.0, BGC_VARIABLES),
+    "PACE_OCI_L2_AOP_NRT": (None, AOP_VARIABLES),
+    "PACE_OCI_L2_LANDVI_NRT": (None, LANDVI_VARIABLES),
+}
+
+# The HARP2 product of the pipeline
+HARP2_PRODUCT = "PACE_HARP2_L1C_SCI"
+
+# The directory of the overlay plots (see `overlay_plot`)
+OVERLAY_DIR = Path("images/BGC_AOP_LANDVI_Overlay")
+
+
+def build_pipeline(bbox: tuple, aoi: str = None, data_dir: Path = Path("data"), padding: float = 0.5,
+                   clip=False, quicklook=False, harp2=True, state_path: Path = Path("data/pipeline_state.json")):
+    """
+    Builds the graph of tasks from the granules on disk: clipping (optional), the AOI statistics of each product,
+    a plot of each variable of each granule, the overlay plot of each pass and its GIF, and the HARP2 visualizations.
+    Every task is keyed by the contents of its input files, its parameters, and the code of its function, so after
+    a daily download only the new granules (and the statistics and GIF that include them) are processed when
+    the pipeline runs.
+
+    Params:
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude) of the area of interest
+        aoi (str): the name of the AOI in the statistics store, defaults to a name made from the bbox
+        data_dir (Path): the directory with a subdirectory of granules per product
+        padding (float): the padding in latitude/longitude around the bounding box
+        clip (bool): if set to True, the granules are first clipped to the AOI (saved to data/{short_name}_AOI)
+            and the later tasks read the clipped granules, the plots are then saved to images/{short_name}_AOI
+        quicklook (bool): if set to True, renders quicklook images instead of the matplotlib plots
+        harp2 (bool): if set to True, adds the visualizations of the HARP2 granules
+        state_path (Path): the JSON file with the state of the last runs
+
+    Returns:
+        Pipeline: the pipeline, run it with `pipeline.run()`
+    """
+    pipeline = Pipeline(state_path)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    bbox_kwargs = {"min_lon": min_lon, "max_lon": max_lon, "min_lat": min_lat, "max_lat": max_lat}
+    granules = {}
+
+    for product, (_, var_specs) in OCI_PRODUCTS.items():
+        files = list_granules(data_dir / product)
+        if clip:
+            variables = [var_spec["var_of_interest"] for var_spec in var_specs]
+            variables += [var for var in STATS_PRODUCTS.get(product, ([], None))[0] if var not in variables]
+            clipped = []
+            for file_path in files:
+                output_path = clipped_path(file_path)
+                pipeline.add(Task(f"clip/{file_path.name}", clip_granule,
+                                  {"file_path": file_path, "bbox": bbox, "variables": variables, "padding": padding,
+                                   "output_path": output_path},
+                                  inputs=[file_path], outputs=[output_path]))
+                clipped.append(output_path)
+            files = clipped
+        granules[product] = files
+
+        # The statistics of the new granules are appended to the store
+        if product in STATS_PRODUCTS and files:
+            variables, transformations = STATS_PRODUCTS[product]
+            stats_dir = data_dir / "aoi_stats"
+            partition = stats_dir / f"product={product}" / f"aoi={aoi or aoi_name(bbox)}" / f"version={STATS_VERSION}"
+            pipeline.add(Task(f"stats/{product}", _refresh_stats,
+                              {"product": product, "data_dir": files[0].parent, "stats_dir": stats_dir,
+                               "variables": variables, "bbox": bbox, "aoi": aoi, "transformations": transformations},
+                              inputs=files, outputs=[partition]))
+
+        # The plots are named after the day of the granule, so only the last granule of each day is plotted
+        for file_path in _last_granule_per_day(files).values():
+            for var_spec in var_specs:
+                var = var_spec["var_of_interest"]
+                image_path = (Path("images") / file_path.parent.name / (var + ("_quicklook" if quicklook else ""))
+                              / f"{_extract_date_from_file(file_path)}.png")
+                pipeline.add(Task(f"render/{file_path.parent.name}/{file_path.name}/{var}", plot_variables,
+                                  {"file_path": file_path, "var_specs": [var_spec], "padding": padding,
+                                   "quicklook": quicklook, **bbox_kwargs},
+                                  inputs=[file_path], outputs=[image_path]))
+
+    # The overlay of each pass that has a BGC, AOP, and LANDVI granule, and the GIF of the overlays
+    # (the granules are joined by name, since the clipped granules may not be written yet)
+    passes = {}
+    for product in OCI_PRODUCTS:
+        for file_path in granules[product]:
+            passes.setdefault(granule_timestamp(file_path), {})[product] = file_path
+    overlays = {}
+    for _, files in sorted(passes.items()):
+        if len(files) == len(OCI_PRODUCTS):
+            overlays[_extract_date_from_file(files["PACE_OCI_L2_BGC_NRT"])] = files
+    overlay_images = []
+    for date_str, files in overlays.items():
+        image_path = OVERLAY_DIR / f"{date_str}.png"
+        pipeline.add(Task(f"overlay/{date_str}", overlay_plot,
+                          {"bgc_file": files["PACE_OCI_L2_BGC_NRT"], "aop_file": files["PACE_OCI_L2_AOP_NRT"],
+                           "landvi_file": files["PACE_OCI_L2_LANDVI_NRT"], "padding": padding, **bbox_kwargs},
+                          inputs=list(files.values()), outputs=[image_path]))
+        overlay_images.append(image_path)
+    if overlay_images:
+        pipeline.add(Task("gif/overlay", create_gif, {"image_dir": OVERLAY_DIR, "output_gif": "overlay.gif"},
+                          inputs=overlay_images, outputs=[OVERLAY_DIR / "overlay.gif"]))
+
+    if harp2:
+        for file_path in _last_granule_per_day(list_granules(data_dir / HARP2_PRODUCT)).values():
+            output_dir = Path("images") / file_path.parent.name / _extract_date_from_file(file_path)
+            pipeline.add(Task(f"harp2/{file_path.name}", visualize_harp2_file, {"file_path": file_path},
+                              inputs=[file_path], outputs=[output_dir]))
+    return pipeline
+
+def download_granules(bbox: tuple, time_span: tuple[str, str], max_count: int = 150, max_workers: int = 8,
+                      harp2=True, data_dir: Path = Path("data")):
+    """
+    Downloads the new granules of the pipeline products, the catalog skips the granules already downloaded.
+
+    Params:
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        time_span (tuple): (start YYYY-mm-dd, end YYYY-mm-dd)
+        max_count (int): the maximum number of granules to download per product
+        max_workers (int): the maximum number of granules downloaded at the same time
+        harp2 (bool): if set to True, also downloads the HARP2 granules
+        data_dir (Path): the directory to save a subdirectory of granules per product in
+    """
+    import earthaccess
+    earthaccess.login(persist=True)
+    catalog = GranuleCatalog(data_dir / "granule_catalog.sqlite")
+    downloader = PaceDataDownloader(bounding_box=bbox, time_span=time_span, catalog=catalog)
+    products = [(product, version) for product, (version, _) in OCI_PRODUCTS.items()]
+    if harp2:
+        products.append((HARP2_PRODUCT, None))
+    try:
+        downloader.download_many(products, max_count=max_count, max_workers=max_workers, save_root=data_dir)
+    finally:
+        catalog.close()
+
+def _refresh_stats(product: str, data_dir: Path, stats_dir: Path, variables: list[str], bbox: tuple, aoi: str = None,
+                   transformations: dict = None):
+    """Helper function to add the statistics of the new granules of a product to the store"""
+    # The other tasks already use the worker processes, so the granules are summarized one after another
+    AOIStatsStore(stats_dir).refresh(product, data_dir, variables, bbox, aoi, transformations, max_workers=1)
+
+def _last_granule_per_day(files: list[Path]):
+    """Helper function to keep the last granule of each day, since the images are named after the day"""
+    return {_extract_date_from_file(file_path): file_path for file_path in files}
+
+
+if __name__ == '__main__':
+    """
+    Runs the whole workflow (download -> clip -> stats -> render) in one go, instead of the download,
+    plot, overlay, and GIF scripts one after another. Only the tasks whose granules or parameters changed
+    since the last run are processed, so re-running it after a daily download only handles the new granules.
+    Changing a plot setting (ex. the color map or vmin/vmax of a variable in `BGC_VARIABLES`) re-renders
+    only the plots of that variable.
+    """
+    pacific_pal_bbox = (-118.75, 33.99, -118.45, 34.15)
+    wider_dates = ("2025-01-01", "2025-05-01")
+
+    ## Comment out to only process the granules already on disk
+    download_granules(pacific_pal_bbox, wider_dates)
+
+    pipeline = build_pipeline(pacific_pal_bbox, "pacific_palisades")
+
+    ## Uncomment to list the tasks that would run without running them
+    # pipeline.run(dry_run=True)
+
+    ## Uncomment to rerun every task (ex. after changing a module that the task functions use, like
+    ## src/plotting/figure_templates.py, the modules of the task functions are already part of their keys)
+    # pipeline.run(force=True)
+
+    pipeline.run()
@@ -12,6 +12,7 @@ import xarray as xr
 
 sys.path.append(".")
 from src.plotting.plotting_functions import plot_variable, print_metadata
+from src.processing.l1c_reader import open_l1c
 
 
 if __name__ == '__main__':
@@ -20,9 +21,10 @@ if __name__ == '__main__':
     """
     # Open a file and print information
     file = Path("data\\PACE_SPEXONE_L1C_SCI\\PACE_SPEXONE.20250107T202910.L1C.V3.5km.nc")
-    prod = xr.open_dataset(file)
-    view = xr.open_dataset(file, group="sensor_views_bands").squeeze()
-    geo = xr.open_dataset(file, group="geolocation_data").set_coords(["longitude", "latitude"])
-    obs = xr.open_dataset(file, group="observation_data").squeeze()
-    dataset = xr.merge((prod, obs, geo))
+    dataset = open_l1c(file, chunks={})
     print(dataset)
+
+    ## Uncomment to open only the radiance of the AOI (Pacific Palisades) at a few wavelengths
+    # pacific_pal_bbox = (-118.75, 33.99, -118.45, 34.15)
+    # dataset = open_l1c(file, ["i"], bbox=pacific_pal_bbox, padding=0.5, wavelengths=[440, 550, 670])
+    # print(dataset)
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy import fft as sp_fft
+
+# The minimum number of (driver, response) pairs for a correlation, fewer pairs give NaN
+MIN_OVERLAP = 5
+
+# The number of pixels whose series are transformed at once, so a large stack (ex. 365 days of a
+# 1000 x 1000 grid) is processed in blocks instead of holding the FFTs of every pixel in memory
+PIXEL_BLOCK_SIZE = 4096
+
+
+def lagged_correlation(x: np.ndarray, y: np.ndarray, lags: np.ndarray, min_overlap: int = MIN_OVERLAP,
+                       dtype=np.float32):
+    """
+    Computes the Pearson correlation between x(t) and y(t + lag) for every lag, along the first (time) axis.
+    Missing values (NaN) are masked out, so each lag only uses the time steps where both series have values.
+    The sums over the valid pairs of every lag are cross-correlations, which are computed for every
+    lag at once with FFTs, for blocks of `PIXEL_BLOCK_SIZE` pixels so the memory used doesn't grow
+    with the size of the grid.
+
+    Params:
+        x (np.ndarray): the driver series, (time,) or (time, ...) with the same shape as y
+        y (np.ndarray): the response series, (time,) or (time, ...) (ex. a (time, lat, lon) grid stack)
+        lags (np.ndarray): the lags in time steps, positive lags compare x with later values of y
+        min_overlap (int): the minimum number of valid pairs for a correlation
+        dtype: the precision of the FFTs and of the correlations, float32 uses half the memory of float64
+            and the correlations are within about 1e-5 of the float64 ones
+
+    Returns:
+        tuple: (correlation, number of valid pairs), both (lags, ...) arrays
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    lags = np.asarray(lags, dtype=np.int64)
+    n_times = y.shape[0]
+    if x.shape[0] != n_times:
+        raise ValueError("x and y must have the same number of time steps")
+    max_lag = int(np.abs(lags).max(initial=0))
+    if max_lag >= n_times:
+        raise ValueError(f"The lags must be shorter than the series ({n_times} time steps)")
+
+    # Flatten the pixels, a driver series (time,) is shared by every pixel
+    pixel_shape = y.shape[1:]
+    y = y.reshape(n_times, -1)
+    x = x.reshape(n_times, 1) if x.ndim == 1 else np.broadcast_to(x, (n_times, *pixel_shape)).reshape(n_times, -1)
+
+    # Zero padding to n_times + max_lag keeps the requested lags from wrapping around
+    n_fft = sp_fft.next_fast_len(n_times + max_lag, real=True)
+    rows = lags % n_fft
+    correlation = np.empty((len(lags), y.shape[1]), dtype=dtype)
+    n = np.empty((len(lags), y.shape[1]), dtype=np.int32)
+    shared_x = _transform(x, n_fft, dtype) if x.shape[1] == 1 else None
+    for start in range(0, y.shape[1], PIXEL_BLOCK_SIZE):
+        block = slice(start, start + PIXEL_BLOCK_SIZE)
+        fx = shared_x if shared_x is not None else _transform(x[:, block], n_fft, dtype)
+        correlation[:, block], n[:, block] = _correlate(fx, _transform(y[:, block], n_fft, dtype), rows, n_fft,
+                                                        min_overlap)
+    return correlation.reshape((len(lags), *pixel_shape)), n.reshape((len(lags), *pixel_shape))
+
+def lagged_series_correlation(driver: pd.Series, response: pd.Series, max_lag: int = 30, freq: str = "D",
+                              min_overlap: int = MIN_OVERLAP):
+    """
+    Computes the lagged correlation between two time series, ex. the PM2.5 at a station and the
+    AOI mean chlorophyll-a. The series are averaged onto a regular time axis, with NaN for the gaps.
+
+    Params:
+        driver (pd.Series): the driver series indexed by time
+        response (pd.Series): the response series indexed by time
+        max_lag (int): the maximum lag in time steps, in both directions
+        freq (str): the time step of the regular time axis, ex. "D" for days
+        min_overlap (int): the minimum number of valid pairs for a correlation
+
+    Returns:
+        pd.DataFrame: the correlation and number of valid pairs indexed by lag, positive lags are responses
+            after the driver
+    """
+    driver, response = _regular_series(driver, freq), _regular_series(response, freq)
+    times = pd.date_range(min(driver.index[0], response.index[0]), max(driver.index[-1], response.index[-1]),
+                          freq=freq)
+    lags = np.arange(-max_lag, max_lag + 1)
+    correlation, n = lagged_correlation(driver.reindex(times).values, response.reindex(times).values, lags,
+                                        min_overlap)
+    return pd.DataFrame({"correlation": correlation, "n_pairs": n}, index=pd.Index(lags, name="lag"))
+
+def lag_correlation_map(driver: pd.Series, stack: xr.DataArray, max_lag: int = 30, freq: str = "D",
+                        min_overlap: int = MIN_OVERLAP):
+    """
+    Computes the lagged correlation between a driver series and every pixel of a gridded time stack
+    (ex. the chlor_a_mean of the daily composites), and the lag of the strongest correlation of each pixel.
+
+    Params:
+        driver (pd.Series): the driver series indexed by time, ex. the daily PM2.5 at a station
+        stack (xr.DataArray): the gridded time stack with a time dimension, ex. (time, lat, lon)
+        max_lag (int): the maximum lag in time steps, in both directions
+        freq (str): the time step of the regular time axis, ex. "D" for days
+        min_overlap (int): the minimum number of valid pairs for a correlation
+
+    Returns:
+        xr.Dataset: the correlation and n_pairs of every (lag, pixel), and the best_lag and best_correlation
+            (largest absolute correlation) of every pixel
+    """
+    stack = stack.transpose("time", ...).resample(time=freq).mean()
+    driver = _regular_series(driver, freq).reindex(stack["time"].values)
+    lags = np.arange(-max_lag, max_lag + 1)
+    correlation, n = lagged_correlation(driver.values, stack.values, lags, min_overlap)
+
+    dims = ("lag",) + stack.dims[1:]
+    coords = {"lag": lags, **{dim: stack[dim] for dim in stack.dims[1:] if dim in stack.coords}}
+    ds = xr.Dataset({"correlation": (dims, correlation), "n_pairs": (dims, n)}, coords=coords)
+
+    # The lag of the largest absolute correlation, NaN where no lag has a correlation
+    has_correlation = np.isfinite(correlation).any(axis=0)
+    best = np.argmax(np.nan_to_num(np.abs(correlation), nan=-1), axis=0)
+    best_correlation = np.take_along_axis(correlation, best[np.newaxis], axis=0)[0]
+    ds["best_lag"] = (stack.dims[1:], np.where(has_correlation, lags[best], np.nan))
+    ds["best_correlation"] = (stack.dims[1:], np.where(has_correlation, best_correlation, np.nan))
+    return ds
+
+def _transform(a: np.ndarray, n_fft: int, dtype):
+    """
+    Helper function to compute the FFTs of a block of series: of their values, squares, and valid mask.
+    The series are centered first (their means don't change the correlation) to avoid cancellation in the sums.
+    """
+    mask = np.isfinite(a)
+    values = np.where(mask, a, 0)
+    mean = values.sum(axis=0, dtype=np.float64) / np.maximum(mask.sum(axis=0), 1)
+    values = np.where(mask, values - mean, 0).astype(dtype)
+    return tuple(sp_fft.rfft(b, n=n_fft, axis=0) for b in (values, values ** 2, mask.astype(dtype)))
+
+def _correlate(fx: tuple, fy: tuple, rows: np.ndarray, n_fft: int, min_overlap: int):
+    """
+    Helper function to compute the lagged correlations of a block of series from their FFTs (see `_transform`).
+
+    Returns:
+        tuple: (correlation, number of valid pairs), both (lags, pixels) arrays
+    """
+    fx, fxx, fmx = fx
+    fy, fyy, fmy = fy
+
+    # sum_t a(t) b(t + lag) for every lag, as an inverse FFT of conj(A) B
+    def cross(fa, fb):
+        return np.take(sp_fft.irfft(np.conj(fa) * fb, n=n_fft, axis=0), rows, axis=0).astype(np.float64)
+
+    n = np.rint(cross(fmx, fmy))
+    sx, sy = cross(fx, fmy), cross(fmx, fy)
+    sxx, syy = cross(fxx, fmy), cross(fmx, fyy)
+    sxy = cross(fx, fy)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        covariance = n * sxy - sx * sy
+        variance = np.clip(n * sxx - sx ** 2, 0, None) * np.clip(n * syy - sy ** 2, 0, None)
+        correlation = np.clip(covariance / np.sqrt(variance), -1, 1)
+    correlation[(n < max(min_overlap, 2)) | ~np.isfinite(correlation)] = np.nan
+    return correlation, n
+
+def _regular_series(series: pd.Series, freq: str):
+    """Helper function to average a series onto a regular time axis, ex. one value per day"""
+    series = series.copy()
+    series.index = pd.to_datetime(series.index)
+    return series.sort_index().resample(freq).mean()
@@ -0,0 +1,339 @@
+import re
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as pds
+import pyarrow.parquet as pq
+from pathlib import Path
+from functools import partial
+
+# The number of CSV rows converted at a time, so the nationwide files don't have to fit in memory
+CSV_CHUNK_ROWS = 1_000_000
+
+# The pollutant names of the AQS parameter codes
+EPA_PARAMETERS = {
+    88101: "pm25",
+    88502: "pm25",
+    81102: "pm10",
+    42602: "no2",
+    42101: "co",
+    44201: "ozone",
+    42401: "so2",
+}
+
+# The columns of the two EPA daily CSV formats (AirData site downloads and the nationwide daily files),
+# renamed to one schema
+EPA_SITE_COLUMNS = {
+    "Date": "date",
+    "Site ID": "site_id",
+    "Local Site Name": "site_name",
+    "Site Latitude": "latitude",
+    "Site Longitude": "longitude",
+    "POC": "poc",
+    "AQS Parameter Code": "parameter_code",
+    "Units": "units",
+    "Daily AQI Value": "aqi",
+    "Daily Obs Count": "obs_count",
+}
+EPA_NATIONWIDE_COLUMNS = {
+    "Date Local": "date",
+    "State Code": "state_code",
+    "County Code": "county_code",
+    "Site Num": "site_num",
+    "Local Site Name": "site_name",
+    "Latitude": "latitude",
+    "Longitude": "longitude",
+    "POC": "poc",
+    "Parameter Code": "parameter_code",
+    "Units of Measure": "units",
+    "AQI": "aqi",
+    "Observation Count": "obs_count",
+    "Arithmetic Mean": "value",
+    "1st Max Value": "daily_max",
+}
+
+EPA_SCHEMA = pa.schema([
+    ("date", pa.timestamp("ns")),
+    ("site_name", pa.string()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("poc", pa.int16()),
+    ("parameter_code", pa.int32()),
+    ("units", pa.string()),
+    ("value", pa.float32()),
+    ("daily_max", pa.float32()),
+    ("aqi", pa.float32()),
+    ("obs_count", pa.float32()),
+    ("pollutant", pa.string()),
+    ("site_id", pa.string()),
+    ("year", pa.int16()),
+])
+EPA_PARTITIONS = pa.schema([("pollutant", pa.string()), ("site_id", pa.string()), ("year", pa.int16())])
+
+# The columns of the table of EPA sites
+SITE_COLUMNS = ["site_id", "site_name", "latitude", "longitude"]
+
+NOAA_PARTITIONS = pa.schema([("station", pa.string()), ("year", pa.int16())])
+
+
+class StationStore:
+    def __init__(self, root: Path = Path("data/stations")):
+        """
+        A columnar store of EPA AQS daily pollutant data and NOAA daily summaries.
+        The CSVs are converted once into typed Parquet files partitioned by (pollutant, site, year) for EPA
+        and (station, year) for NOAA, and the loaders only read the partitions, columns, and rows they need.
+
+        root: the directory of the store
+        """
+        self.root = Path(root)
+        self.epa_dir = self.root / "epa"
+        self.noaa_dir = self.root / "noaa"
+        self.manifest_path = self.root / "ingested.json"
+        self.sites_path = self.root / "epa_sites.parquet"
+
+    def ingest_epa(self, csv_path: Path, pollutant: str = None, force=False):
+        """
+        Converts an EPA daily CSV into the store. Both the AirData site downloads (ex. LA_PM25_2025.csv)
+        and the nationwide daily files (ex. daily_88101_2024.csv) are supported.
+        The CSV is skipped if it was already ingested and hasn't changed since.
+
+        Params:
+            csv_path (Path): the path to the CSV
+            pollutant (str): the name of the pollutant (ex. pm25), inferred from the AQS parameter code if not specified
+            force (bool): if set to True, converts the CSV even if it was already ingested
+
+        Returns:
+            int: the number of rows ingested
+        """
+        return self._ingest(Path(csv_path), "epa", partial(_read_epa_chunks, pollutant=pollutant), force)
+
+    def ingest_noaa(self, csv_path: Path, force=False):
+        """
+        Converts a NOAA GHCN daily summaries CSV (ex. noaa_weather_data.csv) into the store.
+        The CSV is skipped if it was already ingested and hasn't changed since.
+
+        Params:
+            csv_path (Path): the path to the CSV
+            force (bool): if set to True, converts the CSV even if it was already ingested
+
+        Returns:
+            int: the number of rows ingested
+        """
+        return self._ingest(Path(csv_path), "noaa", _read_noaa_chunks, force)
+
+    def read_epa(self, pollutants: list[str] = None, sites: list[str] = None, start=None, end=None,
+                 columns: list[str] = None):
+        """
+        Reads EPA daily data from the store.
+
+        Params:
+            pollutants (list): the pollutants to read (ex. ["pm25", "no2"]), reads every pollutant if not specified
+            sites (list): the site IDs or local site names to read (ex. ["Los Angeles-North Main Street"])
+            start: the first date to read
+            end: the last date to read
+            columns (list): the columns to read, reads every column if not specified
+
+        Returns:
+            pd.DataFrame: the daily data, sorted by date
+        """
+        dataset = self._dataset(self.epa_dir, EPA_PARTITIONS, EPA_SCHEMA)
+        if dataset is None:
+            return pd.DataFrame(columns=columns or EPA_SCHEMA.names)
+        expression = _time_filter("date", start, end)
+        if pollutants is not None:
+            expression &= pds.field("pollutant").isin(list(pollutants))
+        if sites is not None:
+            # Site names are looked up in the site table, so only the partitions of the sites are read
+            sites = [str(site) for site in sites]
+            site_table = self.sites()
+            site_ids = set(sites) | set(site_table.loc[site_table["site_name"].isin(sites), "site_id"])
+            expression &= pds.field("site_id").isin(sorted(site_ids))
+        return _to_pandas(dataset, expression, columns, "date")
+
+    def sites(self):
+        """Returns the EPA sites in the store with their site_id, site_name, latitude, and longitude"""
+        if not self.sites_path.exists():
+            return pd.DataFrame(columns=SITE_COLUMNS)
+        return pd.read_parquet(self.sites_path)
+
+    def read_noaa(self, stations: list[str] = None, start=None, end=None, columns: list[str] = None):
+        """
+        Reads NOAA daily summaries from the store.
+
+        Params:
+            stations (list): the station IDs to read (ex. ["USW00093197"]), reads every station if not specified
+            start: the first date to read
+            end: the last date to read
+            columns (list): the columns to read (ex. ["DATE", "PRCP"]), reads every column if not specified
+
+        Returns:
+            pd.DataFrame: the daily summaries, sorted by date
+        """
+        dataset = self._dataset(self.noaa_dir, NOAA_PARTITIONS)
+        if dataset is None:
+            return pd.DataFrame(columns=columns)
+        expression = _time_filter("DATE", start, end)
+        if stations is not None:
+            expression &= pds.field("station").isin([str(station) for station in stations])
+        return _to_pandas(dataset, expression, columns, "DATE")
+
+    def station_table(self, site: str, pollutants: list[str] = None, start=None, end=None, value: str = "value"):
+        """
+        Returns the daily values of several pollutants at one site as one table, one column per pollutant.
+        Days with several measurements of a pollutant (ex. several instruments, POCs) are averaged.
+
+        Params:
+            site (str): the site ID or local site name (ex. "Los Angeles-North Main Street")
+            pollutants (list): the pollutants to include, includes every pollutant of the site if not specified
+            start: the first date to include
+            end: the last date to include
+            value (str): the column to use for the values, "value", "daily_max", or "aqi"
+
+        Returns:
+            pd.DataFrame: a table indexed by date with a column per pollutant
+        """
+        data = self.read_epa(pollutants, [site], start, end, columns=["date", "pollutant", value])
+        table = data.pivot_table(index="date", columns="pollutant", values=value, aggfunc="mean", observed=True)
+        table.columns = table.columns.astype(str)
+        table.columns.name = None
+        return table
+
+    def _ingest(self, csv_path: Path, kind: str, read_chunks, force: bool):
+        """Helper function to convert a CSV into the Parquet files of a store, one chunk at a time"""
+        manifest = self._read_manifest()
+        stat = csv_path.stat()
+        signature = {"kind": kind, "size": stat.st_size, "mtime": stat.st_mtime}
+        # CSVs in different directories can have the same name, ex. the yearly downloads of each site
+        csv_key = str(csv_path.resolve())
+        if not force and manifest.get(csv_key) == signature:
+            print("Skipping", csv_path.name, "- already ingested")
+            return 0
+
+        # Replace the files of a previous version of the CSV
+        base_dir = self.epa_dir if kind == "epa" else self.noaa_dir
+        for old_file in base_dir.rglob(f"{_file_prefix(csv_path)}-*.parquet"):
+            old_file.unlink()
+
+        n_rows, sites = 0, []
+        for i, table in enumerate(read_chunks(csv_path)):
+            partitioning = EPA_PARTITIONS if kind == "epa" else NOAA_PARTITIONS
+            # Sorting by partition writes each partition in one go, instead of many small files
+            table = table.sort_values(partitioning.names, ignore_index=True)
+            pds.write_dataset(
+                pa.Table.from_pandas(table, schema=EPA_SCHEMA if kind == "epa" else None, preserve_index=False),
+                base_dir, format="parquet", partitioning=pds.partitioning(partitioning, flavor="hive"),
+                basename_template=f"{_file_prefix(csv_path)}-{i}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore", max_partitions=1_000_000,
+            )
+            if kind == "epa":
+                sites.append(table[SITE_COLUMNS].drop_duplicates("site_id"))
+            n_rows += len(table)
+        print(f"Ingested {n_rows} rows from {csv_path.name}")
+
+        if sites:
+            # Keep a small table of the sites to look up site names without scanning every file
+            sites = pd.concat([self.sites(), *sites], ignore_index=True)
+            self.root.mkdir(parents=True, exist_ok=True)
+            sites.drop_duplicates("site_id", keep="last").to_parquet(self.sites_path, index=False)
+
+        manifest[csv_key] = signature
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest_path.write_text(json.dumps(manifest, indent=2))
+        return n_rows
+
+    def _read_manifest(self):
+        if self.manifest_path.exists():
+            return json.loads(self.manifest_path.read_text())
+        return {}
+
+    def _dataset(self, base_dir: Path, partitions: pa.Schema, schema: pa.Schema = None):
+        """
+        Helper function to open the Parquet files of a store as one dataset, or None if it's empty.
+        Without a schema, the schemas of the CSVs are merged (ex. NOAA stations measuring different elements),
+        reading the schema of one file per CSV.
+        """
+        files = base_dir.rglob("*.parquet") if base_dir.exists() else []
+        first_files = {}
+        for file in files:
+            first_files.setdefault(file.name.rsplit("-", 2)[0], file)
+        if not first_files:
+            return None
+        if schema is None:
+            schema = pa.unify_schemas([pq.read_schema(file) for file in first_files.values()] + [partitions])
+        return pds.dataset(base_dir, schema=schema, format="parquet",
+                           partitioning=pds.partitioning(partitions, flavor="hive"))
+
+
+def _read_epa_chunks(csv_path: Path, pollutant: str = None):
+    """Helper function to read an EPA daily CSV in chunks, renamed and typed to the EPA schema"""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    nationwide = "State Code" in header
+    columns = EPA_NATIONWIDE_COLUMNS if nationwide else dict(EPA_SITE_COLUMNS)
+    if not nationwide:
+        # The value column is named after the pollutant, ex. Daily Mean PM2.5 Concentration
+        value_column = next((col for col in header if re.match(r"Daily (Mean|Max).*Concentration", col)), None)
+        if value_column is None:
+            raise ValueError(f"No concentration column in {csv_path.name}")
+        columns[value_column] = "value"
+    usecols = [col for col in columns if col in header]
+
+    for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=CSV_CHUNK_ROWS, low_memory=False,
+                             dtype={"Site ID": str, "State Code": str, "County Code": str, "Site Num": str}):
+        chunk = chunk.rename(columns=columns)
+        if nationwide:
+            chunk["site_id"] = (chunk.pop("state_code").str.zfill(2) + chunk.pop("county_code").str.zfill(3) +
+                                chunk.pop("site_num").str.zfill(4))
+        else:
+            # The site downloads often write the Site ID as a number, without the leading zero of the state code
+            chunk["site_id"] = chunk["site_id"].str.zfill(9)
+        chunk["date"] = pd.to_datetime(chunk["date"])
+        chunk["year"] = chunk["date"].dt.year.astype(np.int16)
+        if pollutant is not None:
+            chunk["pollutant"] = pollutant
+        else:
+            chunk["pollutant"] = chunk["parameter_code"].map(EPA_PARAMETERS).fillna(chunk["parameter_code"].astype(str))
+        for column in EPA_SCHEMA.names:
+            if column not in chunk:
+                chunk[column] = np.nan
+        yield chunk[EPA_SCHEMA.names]
+
+def _read_noaa_chunks(csv_path: Path):
+    """Helper function to read a NOAA daily summaries CSV in chunks, without the attribute columns"""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [col for col in header if not col.endswith("_ATTRIBUTES")]
+    text_columns = {"STATION", "NAME"}
+    dtype = {col: str if col in text_columns else np.float32 for col in usecols if col != "DATE"}
+    dtype.update({"LATITUDE": np.float64, "LONGITUDE": np.float64})
+
+    for chunk in pd.read_csv(csv_path, usecols=usecols, dtype=dtype, chunksize=CSV_CHUNK_ROWS):
+        chunk["DATE"] = pd.to_datetime(chunk["DATE"])
+        chunk["year"] = chunk["DATE"].dt.year.astype(np.int16)
+        yield chunk.rename(columns={"STATION": "station"})
+
+def _time_filter(column: str, start, end):
+    """Helper function to create a filter on a date column, also pruning the year partitions"""
+    expression = pds.scalar(True)
+    if start is not None:
+        start = pd.Timestamp(start)
+        expression &= (pds.field("year") >= start.year) & (pds.field(column) >= start)
+    if end is not None:
+        end = pd.Timestamp(end)
+        expression &= (pds.field("year") <= end.year) & (pds.field(column) <= end)
+    return expression
+
+def _to_pandas(dataset: pds.Dataset, expression, columns: list[str], sort_column: str):
+    """Helper function to read the filtered rows of a dataset"""
+    table = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    if sort_column in table:
+        table = table.sort_values(sort_column, ignore_index=True)
+    return table
+
+def _file_prefix(csv_path: Path):
+    """
+    Helper function to name the Parquet files of a CSV after it, with a hash of its full path
+    so CSVs with the same name in different directories don't replace each other's files
+    """
+    path_hash = hashlib.sha1(str(Path(csv_path).resolve()).encode()).hexdigest()[:8]
+    return re.sub(r"\W", "_", Path(csv_path).stem) + f"_{path_hash}"
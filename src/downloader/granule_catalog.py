@@ -0,0 +1,255 @@
+import json
+import sqlite3
+from pathlib import Path
+from datetime import datetime, timezone
+
+
+class GranuleCatalog:
+    def __init__(self, db_path: Path = Path("data/granule_catalog.sqlite")):
+        """
+        A persistent SQLite catalog of the granules that have already been downloaded.
+        Granules are keyed by their short name and granule ID, and store their version,
+        time span, footprint (as a bounding box), and local file path. The footprint of a granule
+        crossing the antimeridian has a min longitude greater than its max longitude (ex. 170 to -170).
+
+        db_path (Path): the path to the SQLite database file, created if it does not exist
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS granules (
+                granule_id TEXT NOT NULL,
+                short_name TEXT NOT NULL,
+                version TEXT,
+                start_time TEXT,
+                end_time TEXT,
+                min_lon REAL,
+                min_lat REAL,
+                max_lon REAL,
+                max_lat REAL,
+                path TEXT NOT NULL,
+                downloaded_at TEXT,
+                PRIMARY KEY (short_name, granule_id)
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS granules_time ON granules (short_name, start_time)")
+        # AOI subsets are kept apart from the full downloads, keyed by the AOI and variables they were cut for.
+        # Granules that don't cover the AOI are recorded with no path, so they aren't streamed again
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS subsets (
+                granule_id TEXT NOT NULL,
+                short_name TEXT NOT NULL,
+                subset_key TEXT NOT NULL,
+                version TEXT,
+                start_time TEXT,
+                end_time TEXT,
+                path TEXT,
+                subset_at TEXT,
+                PRIMARY KEY (short_name, granule_id, subset_key)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, granule_id: str, short_name: str, path: Path, version=None,
+            start_time: str = None, end_time: str = None, bbox: tuple = None):
+        """
+        Adds (or replaces) a granule in the catalog.
+
+        Params:
+            granule_id (str): the granule ID, ex. PACE_OCI.20250104T202321.L2.OC_BGC.V3_0.NRT.nc
+            short_name (str): the short name of the data product
+            path (Path): the local path to the downloaded granule
+            version: the version of the data product
+            start_time (str): the ISO formatted start time of the granule
+            end_time (str): the ISO formatted end time of the granule
+            bbox (tuple): the footprint of the granule as (min lon, min lat, max lon, max lat),
+                with min lon > max lon if it crosses the antimeridian
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox if bbox else (None, None, None, None)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (granule_id, short_name, None if version is None else str(version), start_time, end_time,
+             min_lon, min_lat, max_lon, max_lat, str(path), datetime.now(timezone.utc).isoformat())
+        )
+        self.conn.commit()
+
+    def add_granule(self, granule, short_name: str, path: Path, version=None):
+        """Adds an earthaccess search result that was downloaded to the given path to the catalog"""
+        umm = granule["umm"]
+        temporal = umm.get("TemporalExtent", {}).get("RangeDateTime", {})
+        if version is None:
+            version = umm.get("CollectionReference", {}).get("Version")
+        self.add(granule_id(granule), short_name, path, version=version,
+                 start_time=temporal.get("BeginningDateTime"), end_time=temporal.get("EndingDateTime"),
+                 bbox=_granule_footprint(umm))
+
+    def contains(self, short_name: str, granule_id: str):
+        """Returns True if the granule is in the catalog and its file is still on disk"""
+        row = self.conn.execute(
+            "SELECT path FROM granules WHERE short_name = ? AND granule_id = ?", (short_name, granule_id)
+        ).fetchone()
+        return row is not None and Path(row["path"]).exists()
+
+    def new_granules(self, results, short_name: str, save_dir: Path, version=None):
+        """
+        Computes the delta between earthaccess search results and the granules already downloaded.
+        Granules found in `save_dir` that are not in the catalog yet (ex. downloaded before the
+        catalog existed) are added to the catalog instead of being downloaded again.
+
+        Params:
+            results (list): earthaccess search results
+            short_name (str): the short name of the data product
+            save_dir (Path): the directory the data product is downloaded to
+            version: the version of the data product
+
+        Returns:
+            list: the search results that still need to be downloaded
+        """
+        new = []
+        for granule in results:
+            if self.contains(short_name, granule_id(granule)):
+                continue
+            paths = [Path(save_dir) / url.split("/")[-1] for url in granule.data_links()]
+            if paths and all(path.exists() for path in paths):
+                self.add_granule(granule, short_name, paths[0], version=version)
+                continue
+            new.append(granule)
+        return new
+
+    def add_subset(self, granule, short_name: str, subset_key: str, path: Path = None, version=None):
+        """
+        Adds an earthaccess search result that was subset to an AOI to the catalog.
+
+        Params:
+            granule: the earthaccess search result
+            short_name (str): the short name of the data product
+            subset_key (str): the AOI and variables of the subset (see `subset_key`)
+            path (Path): the local path to the subset file, None if the granule does not cover the AOI
+            version: the version of the data product
+        """
+        umm = granule["umm"]
+        temporal = umm.get("TemporalExtent", {}).get("RangeDateTime", {})
+        if version is None:
+            version = umm.get("CollectionReference", {}).get("Version")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO subsets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (granule_id(granule), short_name, subset_key, None if version is None else str(version),
+             temporal.get("BeginningDateTime"), temporal.get("EndingDateTime"),
+             None if path is None else str(path), datetime.now(timezone.utc).isoformat())
+        )
+        self.conn.commit()
+
+    def new_subsets(self, results, short_name: str, subset_key: str):
+        """
+        Returns the earthaccess search results that still need to be subset for an AOI: the granules that
+        weren't subset yet (or whose subset file was deleted). Granules that don't cover the AOI are skipped.
+        """
+        new = []
+        for granule in results:
+            row = self.conn.execute(
+                "SELECT path FROM subsets WHERE short_name = ? AND granule_id = ? AND subset_key = ?",
+                (short_name, granule_id(granule), subset_key)
+            ).fetchone()
+            if row is None or (row["path"] is not None and not Path(row["path"]).exists()):
+                new.append(granule)
+        return new
+
+    def query(self, short_name: str = None, bbox: tuple = None, time_span: tuple[str, str] = None):
+        """
+        Finds the downloaded granules that overlap a bounding box and/or time span, without
+        searching CMR.
+
+        Params:
+            short_name (str): only return granules of this data product if specified
+            bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+            time_span (tuple): (start YYYY-mm-dd, end YYYY-mm-dd), both inclusive
+
+        Returns:
+            list: the matching catalog rows as dictionaries, ordered by start time
+        """
+        clauses, params = [], []
+        if short_name is not None:
+            clauses.append("short_name = ?")
+            params.append(short_name)
+        if bbox is not None:
+            # A footprint crossing the antimeridian covers min_lon to 180 and -180 to max_lon
+            clauses.append("((min_lon <= max_lon AND min_lon <= ? AND max_lon >= ?) "
+                           "OR (min_lon > max_lon AND (min_lon <= ? OR max_lon >= ?))) "
+                           "AND min_lat <= ? AND max_lat >= ?")
+            params.extend([bbox[2], bbox[0], bbox[2], bbox[0], bbox[3], bbox[1]])
+        if time_span is not None:
+            start, end = time_span
+            if len(end) == 10:
+                end += "T23:59:59.999Z"
+            clauses.append("start_time <= ? AND end_time >= ?")
+            params.extend([end, start])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.conn.execute(f"SELECT * FROM granules {where} ORDER BY start_time", params)
+        return [dict(row) for row in rows]
+
+
+def granule_id(granule):
+    """Returns the granule ID (GranuleUR) of an earthaccess search result"""
+    return granule["umm"]["GranuleUR"]
+
+def subset_key(bbox: tuple, variables: list[str], padding: float = 0.0):
+    """Returns the key of the subsets cut for a bounding box, padding, and variables (see `add_subset`)"""
+    return json.dumps({"bbox": [float(value) for value in bbox], "padding": float(padding),
+                       "variables": sorted(variables)})
+
+def _granule_footprint(umm: dict):
+    """
+    Helper function to compute the bounding box of a granule's footprint from its UMM metadata.
+    The longitudes are wrapped around the largest gap between them, so the footprint of a granule
+    crossing the antimeridian doesn't span the whole globe.
+
+    Returns:
+        tuple: (min lon, min lat, max lon, max lat), or None if the granule has no spatial extent
+            min lon is greater than max lon if the footprint crosses the antimeridian
+    """
+    geometry = umm.get("SpatialExtent", {}).get("HorizontalSpatialDomain", {}).get("Geometry", {})
+    intervals, lats = [], []
+    for polygon in geometry.get("GPolygons", []):
+        for point in polygon["Boundary"]["Points"]:
+            intervals.append((point["Longitude"], point["Longitude"]))
+            lats.append(point["Latitude"])
+    for rect in geometry.get("BoundingRectangles", []):
+        west, east = rect["WestBoundingCoordinate"], rect["EastBoundingCoordinate"]
+        # A rectangle crossing the antimeridian has a west coordinate greater than its east coordinate
+        intervals.extend([(west, 180.0), (-180.0, east)] if west > east else [(west, east)])
+        lats.extend([rect["SouthBoundingCoordinate"], rect["NorthBoundingCoordinate"]])
+    if not intervals:
+        return None
+    min_lon, max_lon = _longitude_range(intervals)
+    return min_lon, min(lats), max_lon, max(lats)
+
+def _longitude_range(intervals: list[tuple]):
+    """
+    Helper function to find the smallest longitude range covering some (west, east) intervals,
+    which is the circle of longitudes without the largest gap between the intervals.
+
+    Returns:
+        tuple: (west, east), with west > east if the range crosses the antimeridian
+    """
+    merged = []
+    for west, east in sorted(intervals):
+        if merged and west <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], east)
+        else:
+            merged.append([west, east])
+    # The gap before each interval, the first one being the gap across the antimeridian
+    gaps = [merged[0][0] + 360 - merged[-1][1]] + [merged[i][0] - merged[i - 1][1] for i in range(1, len(merged))]
+    largest = max(range(len(gaps)), key=gaps.__getitem__)
+    if gaps[largest] <= 0:
+        return -180.0, 180.0
+    return merged[largest][0], merged[largest - 1][1]
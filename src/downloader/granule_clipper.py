@@ -0,0 +1,142 @@
+import json
+import netCDF4
+import xarray as xr
+from pathlib import Path
+
+from src.downloader.remote_subset import write_subset_granule
+from src.processing.aoi_window import compute_aoi_window
+from src.processing.granule_index import list_granules
+
+# The group with latitude/longitude, the group with the data variables, and the small groups
+# copied whole, for each kind of granule
+GROUP_LAYOUTS = {
+    "navigation_data": ("geophysical_data", ("sensor_band_parameters",)),    # OCI and MODIS L2
+    "geolocation_data": ("observation_data", ("sensor_views_bands",)),       # HARP2 and SPEXone L1C
+}
+
+# The global attribute of a clipped granule with the bounding box, padding and variables it was clipped with
+CLIP_PARAMETERS_ATTR = "clip_parameters"
+
+
+def clip_granule(file_path: Path, bbox: tuple, variables: list[str] = None, padding: float = 0.5,
+                 output_path: Path = None, fmt: str = "netcdf"):
+    """
+    Crops a downloaded granule to a bounding box (plus padding) and keeps only the variables of interest.
+    The result is a compact, chunked and compressed file with the same group layout as the original,
+    so it can be opened by the same readers (ex. `open_file_as_xr`).
+
+    Params:
+        file_path (Path): the path to the downloaded granule
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        variables (list): the variables of interest in the data group, keeps every variable if not specified
+        padding (float): the padding in latitude/longitude around the bounding box to keep
+        output_path (Path): the path to write the clipped granule to
+            Defaults to the same file name in a sibling `{directory}_AOI` directory
+        fmt (str): the output format, either "netcdf" (NetCDF4) or "zarr"
+            Zarr stores are not listed by `list_granules` or read by the NetCDF4 readers (ex. `read_variables`),
+            so the scripts and the pipeline only see NetCDF4 output
+
+    Returns:
+        Path: the path to the clipped granule, or None if the granule does not cover the bounding box
+    """
+    file_path = Path(file_path)
+    if output_path is None:
+        output_path = clipped_path(file_path, fmt=fmt)
+
+    with netCDF4.Dataset(file_path) as nc:
+        group_names = set(nc.groups)
+    nav_group = next(group for group in GROUP_LAYOUTS if group in group_names)
+    data_group, extra_groups = GROUP_LAYOUTS[nav_group]
+
+    with xr.open_dataset(file_path, group=nav_group) as nav:
+        window = compute_aoi_window(nav["longitude"].values, nav["latitude"].values, bbox, padding)
+        if window is None:
+            print(f"No data in the bounding box for {file_path.name}")
+            return None
+        row_dim, col_dim = nav["latitude"].dims
+        isel = {row_dim: window[0], col_dim: window[1]}
+        groups = {nav_group: _isel_present_dims(nav, isel).load()}
+
+    with xr.open_dataset(file_path, group=data_group) as data:
+        if variables is not None:
+            data = data[variables]
+        groups[data_group] = _isel_present_dims(data, isel).load()
+
+    for group in extra_groups:
+        if group in group_names:
+            with xr.open_dataset(file_path, group=group) as extra:
+                groups[group] = extra.load()
+
+    with xr.open_dataset(file_path) as root:
+        attrs = dict(root.attrs)
+    attrs[CLIP_PARAMETERS_ATTR] = _clip_parameters(bbox, variables, padding)
+
+    write_subset_granule(output_path, attrs, groups, fmt=fmt)
+    return output_path
+
+def clip_granules(data_dir: Path, bbox: tuple, variables: list[str] = None, padding: float = 0.5,
+                  output_dir: Path = None, fmt: str = "netcdf", verbose=True):
+    """
+    Clips every granule in a directory that has not been clipped yet (see `clip_granule`).
+    A granule is clipped again if it changed since, or if it was clipped with another bbox, padding or variables.
+
+    Params:
+        data_dir (Path): a directory with downloaded granules, ex. data/PACE_OCI_L2_BGC_NRT
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        variables (list): the variables of interest in the data group, keeps every variable if not specified
+        padding (float): the padding in latitude/longitude around the bounding box to keep
+        output_dir (Path): a directory to save the clipped granules in, defaults to `{data_dir}_AOI`
+        fmt (str): the output format, either "netcdf" (NetCDF4) or "zarr"
+            Zarr stores are not listed by `list_granules`, see `clip_granule`
+        verbose (bool): writes print statements about the progress if set to True
+
+    Returns:
+        list: the paths to the clipped granules
+    """
+    data_dir = Path(data_dir)
+    paths = []
+    parameters = _clip_parameters(bbox, variables, padding)
+    for file_path in list_granules(data_dir):
+        output_path = clipped_path(file_path, output_dir, fmt)
+        if (output_path.exists() and output_path.stat().st_mtime >= file_path.stat().st_mtime
+                and _read_clip_parameters(output_path, fmt) == parameters):
+            paths.append(output_path)
+            continue
+        if verbose: print("Clipping", file_path.name)
+        try:
+            output_path = clip_granule(file_path, bbox, variables, padding, output_path, fmt)
+        except Exception as e:
+            print(f"Error clipping {file_path.name}: {e}")
+            continue
+        if output_path is not None:
+            paths.append(output_path)
+    return paths
+
+def clipped_path(file_path: Path, output_dir: Path = None, fmt: str = "netcdf"):
+    """Returns the default path of the clipped version of a granule"""
+    file_path = Path(file_path)
+    if output_dir is None:
+        output_dir = file_path.parent.with_name(f"{file_path.parent.name}_AOI")
+    name = file_path.name if fmt == "netcdf" else f"{file_path.stem}.zarr"
+    return Path(output_dir) / name
+
+def _clip_parameters(bbox: tuple, variables: list[str], padding: float):
+    """Helper function to serialize the parameters of a clip to a string attribute"""
+    return json.dumps({
+        "bbox": [float(value) for value in bbox],
+        "padding": float(padding),
+        "variables": sorted(variables) if variables is not None else None,
+    })
+
+def _read_clip_parameters(output_path: Path, fmt: str = "netcdf"):
+    """Helper function to read the parameters a granule was clipped with, None if they were not saved"""
+    try:
+        with xr.open_dataset(output_path, engine="zarr" if fmt == "zarr" else None) as root:
+            return root.attrs.get(CLIP_PARAMETERS_ATTR)
+    except Exception as e:
+        print(f"Error reading {Path(output_path).name}: {e}")
+        return None
+
+def _isel_present_dims(ds: xr.Dataset, isel: dict):
+    """Helper function to index a dataset with only the dimensions it has"""
+    return ds.isel({dim: index for dim, index in isel.items() if dim in ds.dims})
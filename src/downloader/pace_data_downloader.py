@@ -1,14 +1,34 @@
+import time
+import threading
 import earthaccess
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.downloader.granule_catalog import GranuleCatalog, subset_key
+from src.downloader.remote_subset import subset_granule
+from src.downloader.granule_clipper import clip_granules
+from src.profiling.trace import span, count
+
+# Size of the blocks streamed to disk while downloading a granule
+CHUNK_SIZE = 1024 * 1024
+
+# Bytes per megabyte, for the download throughput printouts
+BYTES_PER_MB = 1024 * 1024
+
+# Authenticated requests sessions are not shared between download threads
+_thread_local = threading.local()
 
 class PaceDataDownloader:
-    def __init__(self, bounding_box, time_span: tuple[str, str]):
+    def __init__(self, bounding_box, time_span: tuple[str, str], catalog: GranuleCatalog = None):
         """
         bounding_box: (min longitude, min latitude, max longitude, max latitude)
         time_span: (start YYYY-mm-dd, end YYYY-mm-dd)
+        catalog: a local granule catalog, if specified only granules that are not already
+            downloaded are fetched and new downloads are recorded in it
         """
         self.bbox = bounding_box
         self.tspan = time_span
+        self.catalog = catalog
 
     def print_short_names_for_instrument(instr="oci"):
         """
@@ -20,19 +40,30 @@ class PaceDataDownloader:
             summary = item.summary()
             print(summary["short-name"])
 
+    def search(self, short_name, max_count=20, clouds=(0,100), version=None):
+        """
+        Searches for granules with the specified short name within the bounding box and time span.
+        Returns the list of earthaccess granule results.
+        """
+        with span("cmr_search", short_name=short_name) as s:
+            results = earthaccess.search_data(
+                short_name=short_name,
+                bounding_box=self.bbox,
+                temporal=self.tspan,
+                count=max_count,
+                cloud_cover=clouds,
+                version=version
+            )
+            s.set(granules=len(results))
+        return results
+
     def download_data(self, short_name, max_count=20, clouds=(0,100), version=None, save_dir=None):
         """
         Downloads data with the specified short name, bounding box, and time span.
         Saves the downloaded data to data/{short_name} by default if no directory is specified.
+        If the downloader has a catalog, only granules that are not already downloaded are fetched.
         """
-        results = earthaccess.search_data(
-            short_name=short_name,
-            bounding_box=self.bbox,
-            temporal=self.tspan,
-            count=max_count,
-            cloud_cover=clouds,
-            version=version
-        )
+        results = self.search(short_name, max_count=max_count, clouds=clouds, version=version)
 
         if len(results) == 0:
             print("No results found")
@@ -48,5 +79,253 @@ class PaceDataDownloader:
             save_dir = Path(f"data/{short_name}")
 
         save_dir.mkdir(exist_ok=True)
-        paths = earthaccess.download(results, str(Path(save_dir)))
+
+        if self.catalog is not None:
+            results = self.catalog.new_granules(results, short_name, save_dir, version=version)
+            print(f"{len(results)} new results to download")
+            if len(results) == 0:
+                return
+
+        with span("download", short_name=short_name, granules=len(results)):
+            paths = earthaccess.download(results, str(Path(save_dir)))
         # print(paths)
+
+        if self.catalog is not None:
+            self._record_downloads(results, short_name, save_dir, version)
+
+    def download_many(self, products, max_count=20, clouds=(0,100), max_workers=4, save_root=None, verbose=True):
+        """
+        Downloads granules for several data products at once.
+        All the products are searched concurrently, then every granule is downloaded through
+        a bounded pool of worker threads so the network stays busy between products.
+        Partially written files are resumed instead of being downloaded again.
+
+        Params:
+            products (list): short names to download, or (short name, version) tuples
+                ex. ["PACE_OCI_L2_AOP_NRT", ("PACE_OCI_L2_BGC_NRT", 3.0)]
+            max_count (int): the maximum number of granules to download per product
+            clouds (tuple): the (min, max) cloud cover percentage of the granules
+            max_workers (int): the maximum number of granules downloaded at the same time
+            save_root (Path): the directory to save the data in, defaults to `data`
+                Each product is saved in a subdirectory named after its short name
+            verbose (bool): writes print statements about the progress if set to True
+
+        Returns:
+            dict: the downloaded file paths for each short name (of every requested version)
+        """
+        # The same product can be requested at several versions, so the searches are keyed by (short name, version)
+        products = list(dict.fromkeys((product, None) if isinstance(product, str) else tuple(product)
+                                      for product in products))
+        save_root = Path("data") if save_root is None else Path(save_root)
+        if not products:
+            return {}
+
+        # Search every product concurrently, a failing search only skips its product
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(products)) as executor:
+            searches = {
+                (short_name, version): executor.submit(self.search, short_name, max_count, clouds, version)
+                for short_name, version in products
+            }
+            for (short_name, version), search in searches.items():
+                try:
+                    results[(short_name, version)] = search.result()
+                except Exception as e:
+                    print(f"Error searching {_product_name(short_name, version)}: {e}")
+
+        jobs, destinations = [], set()
+        for (short_name, version), granules in results.items():
+            name = _product_name(short_name, version)
+            if verbose: print(f"{name}: found {len(granules)} results")
+            save_dir = save_root / short_name
+            save_dir.mkdir(parents=True, exist_ok=True)
+            if self.catalog is not None:
+                granules = self.catalog.new_granules(granules, short_name, save_dir, version=version)
+                results[(short_name, version)] = granules
+                if verbose: print(f"{name}: {len(granules)} new results to download")
+            for granule in granules:
+                for url in granule.data_links():
+                    dest = save_dir / url.split("/")[-1]
+                    if dest not in destinations:
+                        destinations.add(dest)
+                        jobs.append((short_name, url, dest))
+
+        # Download the granules of every product through one bounded worker pool
+        paths = {short_name: [] for short_name, _ in results}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            downloads = {executor.submit(_download_file, url, dest): (short_name, dest)
+                         for short_name, url, dest in jobs}
+            for download in as_completed(downloads):
+                short_name, dest = downloads[download]
+                try:
+                    num_bytes, resumed_from, elapsed = download.result()
+                except Exception as e:
+                    print(f"Error downloading {dest.name}: {e}")
+                    continue
+                paths[short_name].append(dest)
+                if verbose and elapsed is not None:
+                    mb = num_bytes / BYTES_PER_MB
+                    resumed = f", resumed at {resumed_from / BYTES_PER_MB:.1f} MB" if resumed_from else ""
+                    print(f" {dest.name}: {mb:.1f} MB in {elapsed:.1f}s "
+                          f"({mb / max(elapsed, 1e-6):.1f} MB/s{resumed})")
+
+        if self.catalog is not None:
+            for (short_name, version), granules in results.items():
+                self._record_downloads(granules, short_name, save_root / short_name, version)
+        return paths
+
+    def subset_data(self, short_name, variables, padding=0.0, max_count=20, clouds=(0,100), version=None,
+                    save_dir=None, verbose=True):
+        """
+        Streams granules with the specified short name and saves only the area of interest.
+        Each granule is opened remotely with byte-range access, and only the window of the
+        navigation data and the variables of interest that covers the bounding box are saved.
+        Saves the subset files to data/{short_name}_SUBSET by default if no directory is specified, so they
+        are never mistaken for full granules. With a catalog, the subsets are recorded apart from the full
+        downloads (see `GranuleCatalog.add_subset`) and only the granules not subset yet for this AOI are streamed.
+
+        Params:
+            short_name (str): the short name of the data product
+            variables (list): the variables of interest in the `geophysical_data` group
+            padding (float): the padding in latitude/longitude around the bounding box to keep
+            max_count (int): the maximum number of granules to subset
+            clouds (tuple): the (min, max) cloud cover percentage of the granules
+            version: the version of the data product
+            save_dir (Path): a directory to save the subset files in
+            verbose (bool): writes print statements about the progress if set to True
+
+        Returns:
+            list: the paths to the subset files
+        """
+        results = self.search(short_name, max_count=max_count, clouds=clouds, version=version)
+        if verbose: print(f"Found {len(results)} results")
+
+        save_dir = Path(f"data/{short_name}_SUBSET") if save_dir is None else Path(save_dir)
+        save_dir.mkdir(parents=True, exist_ok=True)
+        key = subset_key(self.bbox, variables, padding)
+        if self.catalog is not None:
+            results = self.catalog.new_subsets(results, short_name, key)
+            if verbose: print(f"{len(results)} new results to subset")
+        if len(results) == 0:
+            return []
+
+        paths = []
+        for granule, remote_file in zip(results, earthaccess.open(results)):
+            output_path = save_dir / granule.data_links()[0].split("/")[-1]
+            if verbose: print(" Subsetting", output_path.name)
+            try:
+                with span("subset_granule", file=output_path.name):
+                    path = subset_granule(remote_file, output_path, variables, self.bbox, padding)
+            except Exception as e:
+                print(f"Error subsetting {output_path.name}: {e}")
+                continue
+            finally:
+                remote_file.close()
+            if path is not None:
+                paths.append(path)
+            if self.catalog is not None:
+                # Granules that don't cover the AOI are recorded too, so they aren't streamed again
+                self.catalog.add_subset(granule, short_name, key, path, version=version)
+        return paths
+
+    def clip_data(self, short_name, variables=None, padding=0.5, data_dir=None, output_dir=None, fmt="netcdf"):
+        """
+        Optional stage after `download_data`: crops every downloaded granule of a data product once
+        to the bounding box (plus padding) and keeps only the variables of interest.
+        The slim granules keep the same group layout, so they can be read from data/{short_name}_AOI
+        by the same plotting functions and notebooks as the full granules.
+
+        Params:
+            short_name (str): the short name of the data product
+            variables (list): the variables of interest, keeps every variable if not specified
+            padding (float): the padding in latitude/longitude around the bounding box to keep
+            data_dir (Path): the directory with the downloaded data, defaults to data/{short_name}
+            output_dir (Path): a directory to save the clipped data in, defaults to data/{short_name}_AOI
+            fmt (str): the output format, either "netcdf" (NetCDF4) or "zarr"
+
+        Returns:
+            list: the paths to the clipped granules
+        """
+        data_dir = Path(f"data/{short_name}") if data_dir is None else Path(data_dir)
+        return clip_granules(data_dir, self.bbox, variables, padding, output_dir, fmt)
+
+    def _record_downloads(self, granules, short_name, save_dir, version=None):
+        """Helper function to add the granules whose files are now on disk to the catalog"""
+        for granule in granules:
+            paths = [Path(save_dir) / url.split("/")[-1] for url in granule.data_links()]
+            if paths and all(path.exists() for path in paths):
+                self.catalog.add_granule(granule, short_name, paths[0], version=version)
+
+
+def _product_name(short_name: str, version=None):
+    """Helper function to name a product in the print statements, ex. PACE_OCI_L2_BGC_NRT (version 3.0)"""
+    return short_name if version is None else f"{short_name} (version {version})"
+
+def _get_session():
+    """Returns an authenticated earthaccess requests session for the current thread"""
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = earthaccess.get_requests_https_session()
+    return _thread_local.session
+
+def _download_file(url: str, dest: Path):
+    """
+    Helper function to download a single granule, resuming from a partially written file.
+    Data is streamed into `{dest}.part`, which is renamed to `dest` once it is complete.
+    A partial file that the server reports as complete but that doesn't have the size of the granule
+    is deleted and the granule is downloaded again.
+
+    Params:
+        url (str): the url of the granule to download
+        dest (Path): the path to save the granule to
+
+    Returns:
+        tuple: (bytes downloaded, byte offset the download resumed from, elapsed seconds)
+            The elapsed time is None if the file was already downloaded
+    """
+    if dest.exists():
+        return 0, 0, None
+
+    part = dest.with_name(dest.name + ".part")
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    start = time.perf_counter()
+    num_bytes = 0
+    with span("download_file", file=dest.name, resumed_from=offset) as s, \
+            _get_session().get(url, headers=headers, stream=True, timeout=60) as response:
+        restart = response.status_code == 416
+        if restart:
+            # The range starts at the end of the granule, so the partial file holds the whole granule
+            # unless it was truncated or corrupted (ex. a different version of the granule)
+            if _remote_size(url, response) == offset:
+                part.rename(dest)
+                return 0, offset, time.perf_counter() - start
+        else:
+            response.raise_for_status()
+            if response.status_code != 206:
+                # The server ignored the range request, so start again from the beginning
+                offset = 0
+            with open(part, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    num_bytes += len(chunk)
+            s.set(bytes_downloaded=num_bytes)
+    if restart:
+        print(f"Restarting the download of {dest.name}: the partial file doesn't match the granule size")
+        part.unlink()
+        return _download_file(url, dest)
+    count("bytes_downloaded", num_bytes)
+    part.rename(dest)
+    return num_bytes, offset, time.perf_counter() - start
+
+def _remote_size(url: str, response):
+    """
+    Helper function to find the size of a granule on the server, from the Content-Range of a 416 response
+    (ex. bytes */1048576) or else the Content-Length of a HEAD request. Returns None if it is unknown.
+    """
+    content_range = response.headers.get("Content-Range", "")
+    if content_range.startswith("bytes */") and content_range[8:].isdigit():
+        return int(content_range[8:])
+    with _get_session().head(url, allow_redirects=True, timeout=60) as head:
+        length = head.headers.get("Content-Length")
+        return int(length) if head.ok and length is not None and length.isdigit() else None
@@ -0,0 +1,124 @@
+import shutil
+import fsspec
+import xarray as xr
+from pathlib import Path
+
+from src.processing.aoi_window import compute_aoi_window
+
+# Block size for byte-range requests when reading granules over HTTP
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# Small groups that are copied whole into the subset file when the granule has them
+EXTRA_GROUPS = ("sensor_band_parameters",)
+
+
+def open_remote_file(url: str, fs=None):
+    """
+    Opens a granule over HTTP as a file-like object that only fetches the byte ranges that are read.
+
+    Params:
+        url (str): the url of the granule
+        fs: an fsspec filesystem to open the url with (ex. `earthaccess.get_fsspec_https_session()`)
+            Uses an unauthenticated HTTP filesystem if not specified
+
+    Returns:
+        file: a read-only file-like object for the granule
+    """
+    if fs is None:
+        fs = fsspec.filesystem("https" if url.startswith("https") else "http")
+    return fs.open(url, mode="rb", block_size=BLOCK_SIZE, cache_type="blockcache")
+
+def subset_granule(source, output_path: Path, variables: list[str], bbox: tuple, padding: float = 0.0,
+                   data_group: str = "geophysical_data", nav_group: str = "navigation_data"):
+    """
+    Reads only the window of a granule that covers a bounding box and writes it to a small local file.
+    The latitude/longitude in the navigation group are read first to compute the row/column window,
+    then only that hyperslab of the requested variables is fetched.
+    The subset file keeps the same group layout as the original granule.
+
+    Params:
+        source: a url, local path, or open file-like object (ex. from `earthaccess.open`) of the granule
+        output_path (Path): the path to write the subset file to
+        variables (list): the variables of interest in the data group
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        padding (float): the padding in latitude/longitude around the bounding box to keep
+        data_group (str): the group with the variables of interest
+        nav_group (str): the group with the latitude and longitude
+
+    Returns:
+        Path: the path to the subset file, or None if the granule does not cover the bounding box
+    """
+    if isinstance(source, str) and source.startswith("http"):
+        with open_remote_file(source) as remote_file:
+            return subset_granule(remote_file, output_path, variables, bbox, padding, data_group, nav_group)
+
+    with xr.open_dataset(source, engine="h5netcdf", group=nav_group) as nav:
+        lon = nav["longitude"].values
+        lat = nav["latitude"].values
+        window = compute_aoi_window(lon, lat, bbox, padding)
+        if window is None:
+            print(f"No data in the bounding box for {output_path.name}")
+            return None
+
+        row_dim, col_dim = nav["latitude"].dims
+        rows, cols = window
+        isel = {row_dim: rows, col_dim: cols}
+        groups = {nav_group: nav[["longitude", "latitude"]].isel(isel).load()}
+
+    with xr.open_dataset(source, engine="h5netcdf", group=data_group) as data:
+        groups[data_group] = data[variables].isel(isel).load()
+    for group in EXTRA_GROUPS:
+        try:
+            with xr.open_dataset(source, engine="h5netcdf", group=group) as extra:
+                groups[group] = extra.load()
+        except OSError:
+            continue
+
+    with xr.open_dataset(source, engine="h5netcdf") as root:
+        attrs = dict(root.attrs)
+    write_subset_granule(output_path, attrs, groups)
+    return output_path
+
+def write_subset_granule(output_path: Path, attrs: dict, groups: dict[str, xr.Dataset], complevel: int = 4,
+                         fmt: str = "netcdf"):
+    """
+    Writes the groups of a (subset) granule to a compressed file with the same group layout.
+
+    Params:
+        output_path (Path): the path to write the file to
+        attrs (dict): the global attributes of the granule
+        groups (dict): a mapping of group names to the datasets to write in them
+        complevel (int): the zlib compression level for the NetCDF4 variables
+        fmt (str): the output format, either "netcdf" (NetCDF4) or "zarr"
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+
+    if fmt == "zarr":
+        xr.Dataset(attrs=attrs).to_zarr(tmp_path, mode="w")
+        for name, ds in groups.items():
+            encoding = {var: _compact_encoding(ds[var], complevel=None) for var in ds.variables}
+            ds.to_zarr(tmp_path, mode="a", group=name, encoding=encoding)
+        if output_path.exists():
+            shutil.rmtree(output_path)
+    elif fmt == "netcdf":
+        xr.Dataset(attrs=attrs).to_netcdf(tmp_path, mode="w")
+        for name, ds in groups.items():
+            encoding = {var: _compact_encoding(ds[var], complevel) for var in ds.variables}
+            ds.to_netcdf(tmp_path, mode="a", group=name, encoding=encoding)
+    else:
+        raise ValueError(f"Unknown output format: {fmt}")
+    tmp_path.replace(output_path)
+
+def _compact_encoding(var: xr.DataArray, complevel: int = None):
+    """
+    Helper function to build the encoding of a subset variable.
+    Keeps the packing of the original variable, but drops its chunking so chunks fit the window.
+    Variables are zlib compressed if a compression level is specified.
+    """
+    encoding = {key: value for key, value in var.encoding.items()
+                if key in ("dtype", "_FillValue", "scale_factor", "add_offset", "units", "calendar")}
+    if complevel is not None and var.ndim > 0 and var.size > 0:
+        encoding.update(zlib=True, complevel=complevel, shuffle=True)
+    return encoding
@@ -0,0 +1,314 @@
+import json
+import time
+import inspect
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from src.processing.parallel import init_worker
+from src.profiling.trace import span, is_enabled, drain, merge
+
+# Size of the blocks read while hashing a file
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Statuses of the tasks after a run
+UP_TO_DATE, RAN, FAILED, SKIPPED, WOULD_RUN = "up to date", "ran", "failed", "skipped", "would run"
+
+
+class Task:
+    def __init__(self, name: str, function, kwargs: dict = None, inputs: list[Path] = (), outputs: list[Path] = ()):
+        """
+        A step of the pipeline, ex. rendering one variable of one granule.
+
+        name: a unique name for the task, ex. "render/PACE_OCI.20250104T202321.L2.OC_BGC.V3_0.NRT.nc/chlor_a"
+        function: a module level function, called as `function(**kwargs)` (in a worker process)
+            The source of its module is part of the key of the task, so editing the function (or a helper
+            in the same module) reruns the task
+        kwargs: the parameters of the function (ex. the variable, color map, vmin/vmax, bbox, padding),
+            they are part of the key of the task so changing one reruns the task
+        inputs: the files (or directories) the task reads, their contents are part of the key of the task
+            A task that reads the output of another task runs after it
+        outputs: the files (or directories) the task writes, the task reruns if one of them is deleted
+        """
+        self.name = name
+        self.function = function
+        self.kwargs = kwargs or {}
+        self.inputs = [Path(path) for path in inputs]
+        self.outputs = [Path(path) for path in outputs]
+
+    def key(self, file_hashes: dict):
+        """Returns the hash of the function and its code, parameters, and contents of the inputs of the task"""
+        key = {
+            "function": _param_value(self.function),
+            "code": _code_hash(self.function),
+            "kwargs": self.kwargs,
+            "inputs": {str(path): file_hashes[path] for path in self.inputs},
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=_param_value).encode()).hexdigest()
+
+
+class Pipeline:
+    def __init__(self, state_path: Path = Path("data/pipeline_state.json")):
+        """
+        A graph of tasks that is run incrementally: a task only runs when the contents of its inputs
+        or its parameters changed since its last successful run (or when one of its outputs is missing).
+        Independent tasks run in parallel in worker processes.
+
+        state_path: the JSON file with the keys of the last successful runs and the hashes of the input files
+        """
+        self.state_path = Path(state_path)
+        self.tasks = {}
+        self._producers = {}
+
+    def add(self, task: Task):
+        """Adds a task to the pipeline, the task names and outputs must be unique"""
+        if task.name in self.tasks:
+            raise ValueError(f"A task is already named {task.name}")
+        for output in task.outputs:
+            if output in self._producers:
+                raise ValueError(f"{output} is already written by {self._producers[output]}")
+            self._producers[output] = task.name
+        self.tasks[task.name] = task
+        return task
+
+    def run(self, max_workers: int = None, force=False, dry_run=False, verbose=True):
+        """
+        Runs the tasks that are not up to date, each one once the tasks writing its inputs are done.
+        A task is skipped if one of its input files (that no task writes) or all of its inputs don't exist,
+        and every task after a failing task is skipped. The tasks running when a worker process crashes fail.
+
+        Params:
+            max_workers (int): the number of worker processes, defaults to the number of CPUs
+                Runs the tasks one after another in this process if set to 1
+            force (bool): if set to True, runs every task even if it is up to date
+            dry_run (bool): if set to True, only prints the tasks that would run (and the tasks after them)
+            verbose (bool): writes print statements about the progress if set to True
+
+        Returns:
+            list: a (task name, status, elapsed seconds) tuple for each task, in completion order
+        """
+        start = time.perf_counter()
+        state = self._read_state()
+        upstream, downstream = self._graph()
+        waiting = {name: len(upstream[name]) for name in self.tasks}
+        ready = [name for name, count in waiting.items() if count == 0]
+        results, statuses, keys = [], {}, {}
+
+        # Hash the inputs that are already on disk in threads, reusing the hashes of unchanged files
+        file_hashes = {}
+        sources = {path for task in self.tasks.values() for path in task.inputs
+                   if path not in self._producers and path.exists()}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for path, file_hash in zip(sources, executor.map(lambda path: _hash_path(path, state["files"]),
+                                                              sources)):
+                file_hashes[path] = file_hash
+
+        def finish(name, status, elapsed=0.0, error=None):
+            statuses[name] = status
+            results.append((name, status, elapsed))
+            task = self.tasks[name]
+            if status == RAN:
+                # Save the progress after every task, so an interrupted run doesn't redo the finished tasks
+                state["tasks"][name] = {"key": keys[name],
+                                        "outputs": [str(path) for path in task.outputs if path.exists()]}
+                self._write_state(state)
+            if status == FAILED:
+                print(f"Error running {name}: {error}")
+            elif verbose and status in (RAN, WOULD_RUN):
+                timing = f" ({elapsed:.1f}s)" if status == RAN else ""
+                print(f"[{len(results)}/{len(self.tasks)}] {name}: {status}{timing}")
+            for dependent in downstream[name]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+
+        def schedule(name):
+            """Returns True if the task has to run, otherwise finishes it"""
+            task = self.tasks[name]
+            if any(statuses[dependency] == FAILED for dependency in upstream[name]):
+                finish(name, SKIPPED)
+                return False
+            if any(statuses[dependency] == WOULD_RUN for dependency in upstream[name]):
+                # The outputs of the upstream tasks would change, so this task would probably run too
+                finish(name, WOULD_RUN)
+                return False
+            # Another task may not write an output (ex. a granule outside the bounding box is not clipped),
+            # so those inputs are optional, but the task is skipped if none of its inputs exist
+            missing = [path for path in task.inputs if not path.exists()]
+            required = [path for path in missing if path not in self._producers]
+            if required or (missing and len(missing) == len(task.inputs)):
+                if verbose: print(f"Skipping {name}: missing {(required or missing)[0]}")
+                finish(name, SKIPPED)
+                return False
+            for path in task.inputs:
+                if path not in file_hashes or path in self._producers:
+                    file_hashes[path] = _hash_path(path, state["files"]) if path.exists() else None
+            keys[name] = task.key(file_hashes)
+            previous = state["tasks"].get(name, {})
+            up_to_date = (previous.get("key") == keys[name]
+                          and all(Path(path).exists() for path in previous.get("outputs", [])))
+            if up_to_date and not force:
+                finish(name, UP_TO_DATE)
+                return False
+            if dry_run:
+                finish(name, WOULD_RUN)
+                return False
+            return True
+
+        if max_workers == 1 or dry_run:
+            while ready:
+                name = ready.pop(0)
+                if schedule(name):
+                    task = self.tasks[name]
+                    elapsed, error, _ = _run_task(task.function, task.kwargs, name, traced=False)
+                    finish(name, RAN if error is None else FAILED, elapsed, error)
+        else:
+            # A crashed worker (ex. a segfault or OOM in netCDF4) breaks the whole pool,
+            # so the tasks that are still waiting run in a new pool
+            while ready:
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                         initargs=(is_enabled(),)) as executor:
+                    running = {}
+                    while ready or running:
+                        while ready:
+                            name = ready.pop(0)
+                            if schedule(name):
+                                task = self.tasks[name]
+                                running[executor.submit(_run_task, task.function, task.kwargs, name)] = name
+                        if not running:
+                            continue
+                        done, _ = wait(running, return_when=FIRST_COMPLETED)
+                        broken = False
+                        for job in done:
+                            try:
+                                elapsed, error, trace = job.result()
+                            except BrokenProcessPool:
+                                broken = True
+                                continue
+                            if trace is not None:
+                                merge(*trace)
+                            finish(running.pop(job), RAN if error is None else FAILED, elapsed, error)
+                        if broken:
+                            # Every task running in the broken pool fails, and the tasks after them are skipped
+                            for name in running.values():
+                                finish(name, FAILED, error="BrokenProcessPool: the worker process crashed")
+                            break
+
+        if not dry_run:
+            self._write_state(state)
+        if verbose:
+            counts = {status: sum(value == status for value in statuses.values())
+                      for status in (RAN, WOULD_RUN, UP_TO_DATE, SKIPPED, FAILED)}
+            summary = ", ".join(f"{count} {status}" for status, count in counts.items() if count)
+            print(f"{'Dry run' if dry_run else 'Pipeline'}: {summary} in {time.perf_counter() - start:.1f}s")
+        return results
+
+    def _graph(self):
+        """
+        Helper function to link each task to the tasks writing its inputs.
+
+        Returns:
+            tuple: (the upstream task names of each task, the downstream task names of each task)
+        """
+        upstream = {name: sorted({self._producers[path] for path in task.inputs if path in self._producers})
+                    for name, task in self.tasks.items()}
+        downstream = {name: [] for name in self.tasks}
+        for name, dependencies in upstream.items():
+            for dependency in dependencies:
+                downstream[dependency].append(name)
+
+        # Check that the tasks can be ordered (no task depends on its own outputs)
+        waiting = {name: len(dependencies) for name, dependencies in upstream.items()}
+        ready = [name for name, count in waiting.items() if count == 0]
+        for name in ready:
+            for dependent in downstream[name]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        if len(ready) < len(self.tasks):
+            cycle = sorted(name for name, count in waiting.items() if count > 0)
+            raise ValueError(f"The tasks have a dependency cycle: {', '.join(cycle[:5])}")
+        return upstream, downstream
+
+    def _read_state(self):
+        if self.state_path.exists():
+            state = json.loads(self.state_path.read_text())
+            return {"files": state.get("files", {}), "tasks": state.get("tasks", {})}
+        return {"files": {}, "tasks": {}}
+
+    def _write_state(self, state: dict):
+        """Helper function to write the state to a temporary file first, so an interrupted write keeps the old one"""
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(state, indent=1))
+        tmp_path.replace(self.state_path)
+
+
+def _run_task(function, kwargs: dict, name: str, traced: bool = True):
+    """
+    Helper function to run one task in a worker, isolating its failure.
+
+    Returns:
+        tuple: (elapsed seconds, error message or None, the spans and counters recorded by the task
+            or None if tracing is disabled or `traced` is False)
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        with span("task", task=name):
+            function(**kwargs)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return time.perf_counter() - start, error, drain() if traced and is_enabled() else None
+
+def _hash_path(path: Path, known: dict):
+    """
+    Helper function to hash the contents of a file, or of every file in a directory (ex. a Zarr store).
+    The hashes are saved with the size and modification time of the files, so unchanged files
+    aren't read again on the next run.
+    """
+    path = Path(path)
+    if path.is_dir():
+        digest = hashlib.sha256()
+        for file_path in sorted(file_path for file_path in path.rglob("*") if file_path.is_file()):
+            digest.update(f"{file_path.relative_to(path)}:{_hash_path(file_path, known)}".encode())
+        return digest.hexdigest()
+
+    stat = path.stat()
+    signature = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    entry = known.get(str(path))
+    if entry is not None and {key: entry[key] for key in signature} == signature:
+        return entry["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    known[str(path)] = {**signature, "sha256": digest.hexdigest()}
+    return known[str(path)]["sha256"]
+
+def _code_hash(function):
+    """
+    Helper function to hash the code of a task function: the source of its module, or the bytecode
+    of the function if the source isn't available (ex. a function defined in a notebook cell)
+    """
+    function = getattr(function, "func", function)  # functools.partial
+    try:
+        source = inspect.getsource(inspect.getmodule(function)).encode()
+    except (TypeError, OSError):
+        code = getattr(function, "__code__", None)
+        if code is None:
+            return None
+        source = code.co_code + repr(code.co_consts).encode()
+    return hashlib.sha256(source).hexdigest()
+
+def _param_value(value):
+    """Helper function to turn the parameters of a task that JSON can't encode (ex. np.log) into stable strings"""
+    if isinstance(value, Path):
+        return str(value)
+    if callable(value):
+        module = getattr(value, "__module__", None) or type(value).__module__
+        return f"{module}.{getattr(value, '__qualname__', getattr(value, '__name__', repr(value)))}"
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return repr(value)
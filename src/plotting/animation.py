@@ -0,0 +1,179 @@
+import numpy as np
+from PIL import Image, GifImagePlugin
+from pathlib import Path
+
+from src.profiling.trace import span
+
+# The number of frames the shared GIF palette is computed from
+PALETTE_SAMPLE_SIZE = 8
+
+# Pixel stride when sampling frames for the palette
+PALETTE_PIXEL_STRIDE = 4
+
+
+class AnimationWriter:
+    def __init__(self, output_path: Path, duration: int = 200, loop: int = 0, sample_size: int = PALETTE_SAMPLE_SIZE,
+                 palette_frames: list = None, extra_outputs: list[Path] = (), fps: float = None):
+        """
+        Writes an animated GIF one frame at a time, so memory does not grow with the number of frames.
+        Every frame is quantized against one palette computed from a sample of the frames
+        (the first `sample_size` frames, or `palette_frames` if given).
+        The frames can also be written to MP4 or WebP files at the same time (requires imageio[ffmpeg]).
+
+        output_path: the path of the GIF
+        duration: the duration of each frame in milliseconds
+        loop: the number of loops (0 for infinite)
+        sample_size: the number of frames buffered to compute the palette from
+        palette_frames: frames (arrays or image paths) to compute the palette from instead of the first frames
+        extra_outputs: paths of other animations to write the frames to (ex. anim.mp4, anim.webp)
+        fps: the frame rate of the extra outputs, defaults to 1000 / duration
+        """
+        self.output_path = Path(output_path)
+        self.duration = duration
+        self.loop = loop
+        self.sample_size = max(sample_size, 1)
+        self.n_frames = 0
+
+        self._buffer = []
+        self._palette = None
+        self._size = None
+        self._fp = None
+        if palette_frames is not None:
+            self._palette = _shared_palette([_to_rgb(frame) for frame in palette_frames])
+
+        fps = fps or 1000 / duration
+        self._extra_writers = [_open_video_writer(Path(path), fps) for path in extra_outputs]
+
+    def add(self, frame):
+        """
+        Adds a frame to the animation.
+
+        Params:
+            frame: an RGB(A) uint8 array, a 2-D array of values in [0, 1] (grayscale), a PIL image,
+                or the path to an image
+        """
+        frame = _to_rgb(frame)
+        if self._palette is None:
+            self._buffer.append(frame)
+            if len(self._buffer) >= self.sample_size:
+                self._flush_buffer()
+        else:
+            self._write(frame)
+
+    def close(self):
+        """Writes the remaining frames and the end of the animation"""
+        self._flush_buffer()
+        if self._fp is not None:
+            self._fp.write(b";")  # GIF trailer
+            self._fp.close()
+            self._fp = None
+        for writer in self._extra_writers:
+            writer.close()
+        self._extra_writers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _flush_buffer(self):
+        """Helper function to compute the palette from the buffered frames and write them"""
+        if not self._buffer:
+            return
+        if self._palette is None:
+            self._palette = _shared_palette(self._buffer)
+        buffer, self._buffer = self._buffer, []
+        for frame in buffer:
+            self._write(frame)
+
+    def _write(self, frame: Image.Image):
+        """Helper function to quantize a frame against the shared palette and append it to the files"""
+        if self._size is None:
+            self._size = frame.size
+        elif frame.size != self._size:
+            raise ValueError(f"Frame {self.n_frames} is {frame.size}, but the animation is {self._size}")
+
+        indexed = frame.quantize(palette=self._palette, dither=Image.Dither.NONE)
+        if self._fp is None:
+            self.output_path.parent.mkdir(parents=True, exist_ok=True)
+            self._fp = open(self.output_path, "wb")
+            header, _ = GifImagePlugin.getheader(indexed, info={"loop": self.loop, "duration": self.duration,
+                                                                "optimize": False})
+            self._fp.write(b"".join(header))
+        self._fp.write(b"".join(GifImagePlugin.getdata(indexed, duration=self.duration)))
+
+        for writer in self._extra_writers:
+            writer.append_data(np.asarray(frame))
+        self.n_frames += 1
+
+
+def write_animation(frames, output_path: Path, duration: int = 200, loop: int = 0,
+                    sample_size: int = PALETTE_SAMPLE_SIZE, extra_outputs: list[Path] = (), fps: float = None):
+    """
+    Writes frames to an animated GIF (and optionally MP4/WebP) without keeping them all in memory.
+    If the frames are a list, the palette is sampled evenly across the whole animation,
+    otherwise it is computed from the first frames of the iterator.
+
+    Params:
+        frames: a list or iterator of frames (arrays, PIL images, or image paths, see `AnimationWriter.add`)
+        output_path (Path): the path of the GIF
+        duration (int): the duration of each frame in milliseconds
+        loop (int): the number of loops (0 for infinite)
+        sample_size (int): the number of frames the palette is computed from
+        extra_outputs (list): paths of other animations to write the frames to (ex. anim.mp4, anim.webp)
+        fps (float): the frame rate of the extra outputs, defaults to 1000 / duration
+
+    Returns:
+        int: the number of frames written
+    """
+    palette_frames = None
+    if isinstance(frames, (list, tuple)) and frames:
+        sample = np.unique(np.linspace(0, len(frames) - 1, min(sample_size, len(frames))).astype(int))
+        palette_frames = [frames[i] for i in sample]
+
+    with span("write_animation", file=output_path) as s, \
+            AnimationWriter(output_path, duration, loop, sample_size, palette_frames, extra_outputs, fps) as writer:
+        for frame in frames:
+            writer.add(frame)
+        s.set(frames=writer.n_frames)
+    return writer.n_frames
+
+def figure_frame(fig):
+    """Returns the current image of a matplotlib figure as an RGB array, without saving it to a file"""
+    fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba())[..., :3].copy()
+
+def _to_rgb(frame):
+    """Helper function to convert a frame to an RGB PIL image"""
+    if isinstance(frame, (str, Path)):
+        with Image.open(frame) as image:
+            return image.convert("RGB")
+    if isinstance(frame, Image.Image):
+        return frame.convert("RGB")
+
+    frame = np.asarray(frame)
+    if frame.dtype != np.uint8:
+        # Values in [0, 1], ex. normalized reflectances
+        frame = (np.clip(np.nan_to_num(frame), 0, 1) * 255).round().astype(np.uint8)
+    if frame.ndim == 2:
+        return Image.fromarray(frame, mode="L").convert("RGB")
+    return Image.fromarray(np.ascontiguousarray(frame[..., :3]), mode="RGB")
+
+def _shared_palette(frames: list[Image.Image]):
+    """Helper function to compute one 256 color palette for a sample of frames"""
+    sample = np.concatenate([np.asarray(frame)[::PALETTE_PIXEL_STRIDE, ::PALETTE_PIXEL_STRIDE].reshape(-1, 3)
+                             for frame in frames])
+    sample = Image.fromarray(sample[np.newaxis])
+    return sample.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+
+def _open_video_writer(path: Path, fps: float):
+    """Helper function to open a streaming MP4/WebP writer with imageio's ffmpeg plugin"""
+    try:
+        import imageio.v2 as imageio
+    except ImportError:
+        raise ImportError(f"Writing {path.suffix} animations requires imageio[ffmpeg] (pip install imageio[ffmpeg])")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() == ".webp":
+        return imageio.get_writer(path, format="FFMPEG", fps=fps, codec="libwebp_anim", output_params=["-loop", "0"])
+    return imageio.get_writer(path, format="FFMPEG", fps=fps, macro_block_size=1)
@@ -0,0 +1,154 @@
+import numpy as np
+import cartopy.crs as ccrs
+from pathlib import Path
+from collections import OrderedDict
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from src.profiling.trace import span
+
+# The maximum number of figure templates kept open
+TEMPLATE_CACHE_SIZE = 16
+
+_templates = OrderedDict()
+
+
+class MapTemplate:
+    def __init__(self, extent: list, layers: list[dict], colorbar_kwargs: dict = None,
+                 colorbar_fontsize: float = None, axis_labels: bool = True, figsize: tuple = (10, 6)):
+        """
+        A reusable map figure for an area of interest and a set of variable styles.
+        The figure, the GeoAxes, the coastlines, the gridlines and the colorbars are created once,
+        and each frame only swaps the data and the title before saving the image.
+
+        extent: the [min lon, max lon, min lat, max lat] extent of the map
+        layers: a dictionary for each variable drawn on the map with the keys
+            label (colorbar label), and optionally color_map, vmin, vmax, and alpha
+        colorbar_kwargs: keyword arguments for the colorbars (ex. orientation, shrink, pad)
+        colorbar_fontsize: the font size of the colorbar labels, uses the default if not specified
+        axis_labels: if set to True, labels the axes with Longitude and Latitude
+        figsize: the size of the figure in inches
+        """
+        self.extent = extent
+        self.layers = [{"color_map": "viridis", "vmin": None, "vmax": None, "alpha": None} | layer
+                       for layer in layers]
+        self.colorbar_kwargs = colorbar_kwargs or {}
+        self.colorbar_fontsize = colorbar_fontsize
+        self.axis_labels = axis_labels
+
+        # The figure is not managed by pyplot, so it stays open between frames
+        self.fig = Figure(figsize=figsize)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(projection=ccrs.PlateCarree())
+        self.meshes = []
+        self.colorbars = []
+        self._lon = None
+        self._lat = None
+
+    def render(self, lon: np.ndarray, lat: np.ndarray, values: list[np.ndarray], title: str, save_path: Path):
+        """
+        Draws a frame with new data and a new title, and saves it.
+
+        Params:
+            lon (np.ndarray): the 2-D longitude values
+            lat (np.ndarray): the 2-D latitude values
+            values (list): the 2-D values of each layer
+            title (str): the title for the plot
+            save_path (Path): the path to save the image of the plot to
+        """
+        first_frame = not self.meshes
+        if first_frame:
+            self._draw_first_frame(lon, lat, values)
+        elif self._same_geometry(lon, lat):
+            # Only the data changes, so update the arrays of the meshes
+            for mesh, var, layer in zip(self.meshes, values, self.layers):
+                mesh.set_array(var)
+                # Rescale the colors like pcolormesh does when there is no fixed vmin/vmax
+                mesh.norm.vmin, mesh.norm.vmax = layer["vmin"], layer["vmax"]
+                mesh.autoscale_None()
+        else:
+            # Replace the meshes, keeping the axes, coastlines, gridlines and colorbars
+            for i, (mesh, var, layer) in enumerate(zip(self.meshes, values, self.layers)):
+                mesh.remove()
+                self.meshes[i] = self._pcolormesh(lon, lat, var, layer)
+            self.ax.set_extent(self.extent, crs=ccrs.PlateCarree())
+        for mesh, colorbar in zip(self.meshes, self.colorbars):
+            colorbar.update_normal(mesh)
+
+        self._lon, self._lat = lon, lat
+        self.ax.set_title(title)
+        with span("savefig", file=save_path, first_frame=first_frame):
+            self.fig.savefig(save_path)
+
+    def close(self):
+        self.fig.clear()
+
+    def _draw_first_frame(self, lon, lat, values):
+        """Helper function to draw the meshes and the static parts of the figure"""
+        self.meshes = [self._pcolormesh(lon, lat, var, layer) for var, layer in zip(values, self.layers)]
+
+        # Set the map extent to the bounding box
+        self.ax.set_extent(self.extent, crs=ccrs.PlateCarree())
+
+        # Add a coordinate grid and coastlines to the plot
+        self.ax.coastlines()
+        gl = self.ax.gridlines(draw_labels=True, linestyle="--", alpha=0.5)
+        gl.top_labels = False  # Remove top labels
+        gl.right_labels = False  # Remove right labels
+
+        # Label the plot
+        for mesh, layer in zip(self.meshes, self.layers):
+            colorbar = self.fig.colorbar(mesh, ax=self.ax, **self.colorbar_kwargs)
+            if self.colorbar_fontsize is None:
+                colorbar.set_label(layer["label"])
+            else:
+                colorbar.set_label(layer["label"], fontsize=self.colorbar_fontsize)
+            self.colorbars.append(colorbar)
+        if self.axis_labels:
+            self.ax.set_xlabel("Longitude")
+            self.ax.set_ylabel("Latitude")
+
+    def _pcolormesh(self, lon, lat, var, layer):
+        """Helper function to draw one layer on the map"""
+        return self.ax.pcolormesh(lon, lat, var, cmap=layer["color_map"], shading='auto',
+                                  transform=ccrs.PlateCarree(), alpha=layer["alpha"],
+                                  vmin=layer["vmin"], vmax=layer["vmax"])
+
+    def _same_geometry(self, lon, lat):
+        """Helper function to check if a frame has the same coordinates as the previous frame"""
+        return (self._lon is not None and lon.shape == self._lon.shape
+                and np.array_equal(lon, self._lon, equal_nan=True)
+                and np.array_equal(lat, self._lat, equal_nan=True))
+
+
+def get_map_template(extent: list, layers: list[dict], **kwargs):
+    """
+    Returns the map template for an area of interest and a set of variable styles,
+    creating it the first time it is requested. Templates are kept open and the least
+    recently used ones are closed once there are more than TEMPLATE_CACHE_SIZE.
+
+    Params:
+        extent (list): the [min lon, max lon, min lat, max lat] extent of the map
+        layers (list): the styles of the variables drawn on the map (see `MapTemplate`)
+        kwargs: other keyword arguments for `MapTemplate`
+
+    Returns:
+        MapTemplate: the map template
+    """
+    key = repr((extent, layers, sorted(kwargs.items())))
+    if key in _templates:
+        _templates.move_to_end(key)
+        return _templates[key]
+
+    template = MapTemplate(extent, layers, **kwargs)
+    _templates[key] = template
+    if len(_templates) > TEMPLATE_CACHE_SIZE:
+        _, oldest = _templates.popitem(last=False)
+        oldest.close()
+    return template
+
+def clear_templates():
+    """Closes every cached map template"""
+    for template in _templates.values():
+        template.close()
+    _templates.clear()
@@ -7,11 +7,27 @@ import numpy as np
 from pathlib import Path
 from datetime import datetime
 
+from src.plotting.figure_templates import get_map_template
+from src.plotting.quicklook import render_quicklook
+from src.processing.aoi_window import geometry_key
+from src.processing.granule_reader import open_groups, aoi_isel, read_variables
+from src.profiling.trace import span, array_info
+
+# Default options for the variables plotted with `plot_variables`
+DEFAULT_VAR_SPEC = {
+    "color_map": "viridis",
+    "transformation": None,
+    "save_dir": None,
+    "vmin": None,
+    "vmax": None,
+}
+
 
 def plot_variable(file_path: Path, var_of_interest: str, var_label: str, plot_title: str,
                   color_map='viridis', transformation: 'function'=None, save_dir: Path=None,
                   min_lon=-118.75, max_lon=-118.45, min_lat=33.99, max_lat=34.15,
-                  zoomed_map: bool=True, vmin: float=None, vmax: float = None, padding: float = 0.5):
+                  zoomed_map: bool=True, vmin: float=None, vmax: float = None, padding: float = 0.5,
+                  quicklook: bool=False):
     """
     Plots a variable of interest from the data from the file path with the specified parameters.
     Saves the image of the plot in a subdirectory.
@@ -34,62 +50,124 @@ def plot_variable(file_path: Path, var_of_interest: str, var_label: str, plot_ti
         vmin (float): the minimum value for the colorbar, for consistency across different plots
         vmax (float): the maximum value for the colorbar, for consistency across different plots
         padding (float): the padding in latitude/longitude around the bounding box to show in the plot
+        quicklook (bool): if set to True, writes a fast quicklook image without gridlines, labels,
+            or a colorbar instead of the matplotlib plot (see `src/plotting/quicklook.py`)
+    """
+    var_spec = {
+        "var_of_interest": var_of_interest,
+        "var_label": var_label,
+        "plot_title": plot_title,
+        "color_map": color_map,
+        "transformation": transformation,
+        "save_dir": save_dir,
+        "vmin": vmin,
+        "vmax": vmax,
+    }
+    plot_variables(file_path, [var_spec], min_lon=min_lon, max_lon=max_lon, min_lat=min_lat, max_lat=max_lat,
+                   zoomed_map=zoomed_map, padding=padding, quicklook=quicklook)
+
+def plot_variables(file_path: Path, var_specs: list[dict],
+                   min_lon=-118.75, max_lon=-118.45, min_lat=33.99, max_lat=34.15,
+                   zoomed_map: bool=True, padding: float = 0.5, quicklook: bool=False):
+    """
+    Plots several variables of interest from the same data file.
+    The file is opened once, the window of the area of interest is computed once,
+    and only the variables of interest are read before rendering a plot for each of them.
+    Saves the image of each plot in a subdirectory.
+
+    Params:
+        file_path (Path): the path to the downloaded PACE data file
+        var_specs (list): a dictionary for each variable to plot with the keys
+            var_of_interest, var_label, and plot_title, and optionally
+            color_map, transformation, save_dir, vmin, and vmax (same as in `plot_variable`)
+        min_lon (float): the minimum longitude value for the area of interest (AOI)
+        max_lon (float): the maximum longitude value for the AOI
+        min_lat (float): the minimum latitude value for the AOI
+        max_lat (float): the maximum latitude value for the AOI (default for Pacific Palisades)
+        zoomed_map (bool): if set to True, will subset the data and plot based on the min/max lat/lon
+            Else will use the full area provided in the data file
+        padding (float): the padding in latitude/longitude around the bounding box to show in the plot
+        quicklook (bool): if set to True, writes fast quicklook images without gridlines, labels,
+            or colorbars instead of the matplotlib plots (see `src/plotting/quicklook.py`)
     """
-    # Open the file and extract relevant information
-    ds = open_file_as_xr(file_path, var_of_interest)
+    # Open the file once and read only the variables of interest in the AOI
+    variables = [var_spec["var_of_interest"] for var_spec in var_specs]
+    bbox = (min_lon, min_lat, max_lon, max_lat) if zoomed_map else None
+    lon, lat, data = read_variables(file_path, variables, bbox, padding)
     date_str = _extract_date_from_file(file_path)
-    
-    var = ds[var_of_interest].values
-    lon = ds['longitude'].values
-    lat = ds['latitude'].values
 
+    extent = None
     if zoomed_map:
-        min_lon -= padding
-        min_lat -= padding
-        max_lon += padding
-        max_lat += padding
-
-        # Create a mask for the bounding box
-        lon_mask = (lon >= min_lon) & (lon <= max_lon)
-        lat_mask = (lat >= min_lat) & (lat <= max_lat)
-
-        # Apply the mask using array slicing
-        valid_rows = np.where(lat_mask.any(axis=1))[0]  # Get valid row indices
-        valid_cols = np.where(lon_mask.any(axis=0))[0]  # Get valid col indices
-
-        # Subset the data using row and column indices
-        lon = lon[np.min(valid_rows):np.max(valid_rows)+1, np.min(valid_cols):np.max(valid_cols)+1]
-        lat = lat[np.min(valid_rows):np.max(valid_rows)+1, np.min(valid_cols):np.max(valid_cols)+1]
-        var = var[np.min(valid_rows):np.max(valid_rows)+1, np.min(valid_cols):np.max(valid_cols)+1]
-
-    if transformation:
-        var = transformation(var)
+        extent = [min_lon - padding, max_lon + padding, min_lat - padding, max_lat + padding]
+    elif quicklook:
+        extent = [np.nanmin(lon), np.nanmax(lon), np.nanmin(lat), np.nanmax(lat)]
+
+    for var_spec in var_specs:
+        var_spec = DEFAULT_VAR_SPEC | var_spec
+        var = data[var_spec["var_of_interest"]]
+        if var_spec["transformation"]:
+            var = var_spec["transformation"](var)
+
+        save_dir = var_spec["save_dir"]
+        if save_dir == None:
+            subdir_name = var_spec["var_of_interest"] + ("_quicklook" if quicklook else "")
+            save_dir = _create_image_subdir(file_path.parent.name, subdir_name)
+        title = f"{var_spec['plot_title']} {date_str}"
+        mode = "quicklook" if quicklook else "template" if zoomed_map else "full"
+        with span("render", file=file_path, variable=var_spec["var_of_interest"], mode=mode, **array_info(var)):
+            if quicklook:
+                # The pixel index is shared by the variables (and products) of the same pass
+                cache_key = (geometry_key(file_path), lon.shape, bbox, padding)
+                render_quicklook(lon, lat, var, save_dir / date_str, extent, color_map=var_spec["color_map"],
+                                 vmin=var_spec["vmin"], vmax=var_spec["vmax"], cache_key=cache_key)
+            elif zoomed_map:
+                # Reuse the figure of the AOI and variable style across files, only swapping the data
+                layer = {key: var_spec[key] for key in ("color_map", "vmin", "vmax")} | {"label": var_spec["var_label"]}
+                get_map_template(extent, [layer]).render(lon, lat, [var], title, save_dir / date_str)
+            else:
+                _render_map(lon, lat, var, var_spec["var_label"], title, save_dir / date_str,
+                            color_map=var_spec["color_map"], vmin=var_spec["vmin"], vmax=var_spec["vmax"])
+
+def _render_map(lon: np.ndarray, lat: np.ndarray, var: np.ndarray, var_label: str, title: str, save_path: Path,
+                color_map='viridis', vmin: float=None, vmax: float=None):
+    """
+    Helper function to plot a variable over the full area of the data on a map
+    with coastlines and gridlines and save the image.
 
+    Params:
+        lon (np.ndarray): the 2-D longitude values
+        lat (np.ndarray): the 2-D latitude values
+        var (np.ndarray): the 2-D values of the variable
+        var_label (str): the label for the colorbar
+        title (str): the title for the plot
+        save_path (Path): the path to save the image of the plot to
+        color_map (str): the color map for the plot
+        vmin (float): the minimum value for the colorbar
+        vmax (float): the maximum value for the colorbar
+    """
     # Create the plot
     plt.figure(figsize=(10, 6))
     ax = plt.axes(projection=ccrs.PlateCarree())
-    plt.pcolormesh(lon, lat, var, cmap=color_map, shading='auto', transform=ccrs.PlateCarree(), vmin=vmin, vmax=vmax)
-
-    if zoomed_map:
-        # Set the map extent to the bounding box
-        ax.set_extent([min_lon, max_lon, min_lat, max_lat], crs=ccrs.PlateCarree())
+    with span("pcolormesh", **array_info(var)):
+        plt.pcolormesh(lon, lat, var, cmap=color_map, shading='auto', transform=ccrs.PlateCarree(),
+                       vmin=vmin, vmax=vmax)
 
     # Add a coordinate grid and coastlines to the plot
-    ax.coastlines()
+    with span("coastlines"):
+        ax.coastlines()
     gl = ax.gridlines(draw_labels=True, linestyle="--", alpha=0.5)
     gl.top_labels = False  # Remove top labels
     gl.right_labels = False  # Remove right labels
 
     # Label the plot
     plt.colorbar(label=var_label)
-    plt.title(f"{plot_title} {date_str}")
+    plt.title(title)
     plt.xlabel("Longitude")
     plt.ylabel("Latitude")
 
-    # Save the plot in a subdirectory
-    if save_dir == None:
-        save_dir = _create_image_subdir(file_path.parent.name, var_of_interest)
-    plt.savefig(save_dir / date_str)
+    # Save the plot (drawing the coastlines and gridlines happens here)
+    with span("savefig", file=save_path):
+        plt.savefig(save_path)
     plt.close()
 
 def print_metadata(file_path: Path):
@@ -98,28 +176,40 @@ def print_metadata(file_path: Path):
     print(ds.attrs)
     print(ds.variables)
 
-def open_file_as_xr(file_path: Path, var_of_interest: str):
+def open_file_as_xr(file_path: Path, var_of_interest: str | list[str], bbox: tuple=None, padding: float=0,
+                    chunks: dict=None):
     """
     Given a file path to PACE data, creates an xarray dataset with a variable
     of interest merged with corresponding latitude and longitude coordinates.
+    The data is loaded lazily, and if a bounding box is specified only the window of the swath
+    that covers it is kept, so only that hyperslab is read from the file once the values are used.
 
     Params:
         file_path (Path): a file path to downloaded PACE data
-        var_of_interest (str): A string of the variable of interest in the data
+        var_of_interest (str | list): A string of the variable of interest in the data,
+            or a list of variables of interest (2-D or 3-D, ex. Rrs with a wavelength dimension)
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude) of the area of interest
+        padding (float): the padding in latitude/longitude around the bounding box to keep
+        chunks (dict): dask chunks for the variables (ex. {} or "auto"), the variables are lazily
+            indexed xarray arrays if not specified
 
     Returns:
-        dataset: an xarray dataset with the variable of interest and lat/lon coorindates
+        dataset: an xarray dataset with the variable(s) of interest and lat/lon coorindates
     """
-    # Include group="geophysical_data" to merge data from different layers and access the variables
-    ds = xr.open_dataset(file_path, group="geophysical_data")
-    variable = ds[var_of_interest]
-
-    # Open using group="navigation_data" to get the latitude and longitude
-    dataset = xr.open_dataset(file_path, group="navigation_data")
-    dataset = dataset.set_coords(("longitude", "latitude"))
-
-    # Merge the coordinates and variable of interest
-    dataset = xr.merge((variable, dataset.coords))
+    # Open the "geophysical_data" group for the variables and the "navigation_data" group
+    # for the latitude and longitude
+    with span("open_file_as_xr", file=file_path) as s:
+        ds, dataset = open_groups(file_path, ("geophysical_data", "navigation_data"), chunks)
+        isel = aoi_isel(file_path, dataset, bbox, padding)
+        variable = ds[var_of_interest]
+        variable = variable.isel({dim: index for dim, index in isel.items() if dim in variable.dims})
+        dataset = dataset.isel(isel).set_coords(("longitude", "latitude"))
+
+        # Merge the coordinates and variable of interest
+        dataset = xr.merge((variable, dataset.coords))
+        # The values are read lazily, so the span only times opening the file and this is the decoded size
+        # of the values once they are used (the read and decompression are timed by the span using them)
+        s.set(lazy=True, decoded_bytes=int(dataset.nbytes), sizes=dict(dataset.sizes))
     # print(dataset)
     return dataset
 
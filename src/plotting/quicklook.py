@@ -0,0 +1,176 @@
+import numpy as np
+import matplotlib
+from PIL import Image
+from pathlib import Path
+from collections import OrderedDict
+from scipy.spatial import cKDTree
+
+# The maximum number of swath to image indexes kept in memory
+INDEX_CACHE_SIZE = 64
+
+# The color of the pixels without data and of the coastlines
+MISSING_COLOR = (255, 255, 255)
+COASTLINE_COLOR = (0, 0, 0)
+
+_index_cache = OrderedDict()
+_coastline_cache = {}
+
+
+def render_quicklook(lon: np.ndarray, lat: np.ndarray, values: np.ndarray, save_path: Path, extent: list,
+                     width: int = 800, color_map: str = "viridis", vmin: float = None, vmax: float = None,
+                     coastlines: bool = True, cache_key=None):
+    """
+    Renders a 2-D variable of a swath to a PNG image without matplotlib figures or cartopy projections.
+    The swath is resampled onto the image grid with a nearest pixel index, the colors come from a
+    lookup table of the color map, and the coastlines are burned in from a cached mask.
+
+    Params:
+        lon (np.ndarray): the 2-D longitude values
+        lat (np.ndarray): the 2-D latitude values
+        values (np.ndarray): the 2-D values of the variable
+        save_path (Path): the path to save the PNG image to
+        extent (list): the [min lon, max lon, min lat, max lat] extent of the image
+        width (int): the width of the image in pixels, the height follows the aspect of the extent
+        color_map (str): the color map for the image (ex. viridis, cividis, plasma)
+        vmin (float): the value of the lowest color, defaults to the minimum of the values
+        vmax (float): the value of the highest color, defaults to the maximum of the values
+        coastlines (bool): if set to True, draws the coastlines on the image
+        cache_key: a hashable key of the swath geometry (ex. the granule and window) to reuse
+            the pixel index for other variables and passes with the same geometry, not cached if None
+
+    Returns:
+        Path: the path to the saved image
+    """
+    size = image_size(extent, width)
+    index = image_index(lon, lat, extent, size, cache_key)
+
+    values = np.asarray(values).ravel()
+    pixels = np.where(index >= 0, values[np.maximum(index, 0)], np.nan)
+    rgb = apply_colormap(pixels, color_map, vmin, vmax)
+    if coastlines:
+        rgb[coastline_mask(extent, size)] = COASTLINE_COLOR
+
+    save_path = Path(save_path).with_suffix(".png")
+    Image.fromarray(rgb).save(save_path, compress_level=1)
+    return save_path
+
+def image_size(extent: list, width: int = 800):
+    """Returns the (width, height) of an image of an extent, keeping the aspect of the map at its latitude"""
+    min_lon, max_lon, min_lat, max_lat = extent
+    aspect = (max_lat - min_lat) / ((max_lon - min_lon) * np.cos(np.radians((min_lat + max_lat) / 2)))
+    return width, max(int(round(width * aspect)), 1)
+
+def image_index(lon: np.ndarray, lat: np.ndarray, extent: list, size: tuple, cache_key=None):
+    """
+    Returns the flat index of the nearest swath pixel for each image pixel, or -1 for image pixels
+    that are further than about one and a half swath pixels from the swath.
+
+    Params:
+        lon (np.ndarray): the 2-D longitude values of the swath
+        lat (np.ndarray): the 2-D latitude values of the swath
+        extent (list): the [min lon, max lon, min lat, max lat] extent of the image
+        size (tuple): the (width, height) of the image
+        cache_key: a hashable key of the swath geometry, the index is computed every time if None
+
+    Returns:
+        np.ndarray: a (height, width) array of indexes into the flattened swath
+    """
+    key = None if cache_key is None else (cache_key, tuple(extent), tuple(size))
+    if key in _index_cache:
+        _index_cache.move_to_end(key)
+        return _index_cache[key]
+
+    min_lon, max_lon, min_lat, max_lat = extent
+    width, height = size
+    scale = np.cos(np.radians((min_lat + max_lat) / 2))
+
+    # Use scaled longitudes, so distances are about the same in both directions
+    lon = np.asarray(lon, dtype=np.float64).ravel()
+    lat = np.asarray(lat, dtype=np.float64).ravel()
+    valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+    index = np.full((height, width), -1, dtype=np.int64)
+    if valid.size:
+        points = np.column_stack((lon[valid] * scale, lat[valid]))
+        tree = cKDTree(points)
+
+        # The centers of the image pixels, from the top (max latitude) row down
+        x = min_lon + (np.arange(width) + 0.5) * (max_lon - min_lon) / width
+        y = max_lat - (np.arange(height) + 0.5) * (max_lat - min_lat) / height
+        grid_x, grid_y = np.meshgrid(x * scale, y)
+        distance, nearest = tree.query(np.column_stack((grid_x.ravel(), grid_y.ravel())),
+                                       distance_upper_bound=1.5 * _pixel_spacing(tree, points))
+        found = np.isfinite(distance)
+        index.ravel()[found] = valid[nearest[found]]
+
+    if key is not None:
+        _index_cache[key] = index
+        if len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+def apply_colormap(values: np.ndarray, color_map: str = "viridis", vmin: float = None, vmax: float = None):
+    """
+    Colors an array of values with a 256 color lookup table of a color map.
+
+    Returns:
+        np.ndarray: an RGB array (uint8) with the shape of the values, missing values are MISSING_COLOR
+    """
+    valid = np.isfinite(values)
+    if vmin is None:
+        vmin = np.min(values[valid]) if valid.any() else 0
+    if vmax is None:
+        vmax = np.max(values[valid]) if valid.any() else 1
+    span = (vmax - vmin) or 1
+
+    with np.errstate(invalid="ignore"):
+        levels = np.clip((values - vmin) / span * 256, 0, 255)
+    rgb = colormap_lut(color_map)[np.where(valid, levels, 0).astype(np.uint8)]
+    rgb[~valid] = MISSING_COLOR
+    return rgb
+
+def colormap_lut(color_map: str):
+    """Returns a (256, 3) uint8 RGB lookup table of a matplotlib color map"""
+    return (matplotlib.colormaps[color_map](np.arange(256))[:, :3] * 255).round().astype(np.uint8)
+
+def coastline_mask(extent: list, size: tuple):
+    """
+    Returns a boolean (height, width) mask of the image pixels that the coastlines pass through.
+    The mask is rasterized from the cartopy coastlines once per extent and image size.
+    """
+    key = (tuple(extent), tuple(size))
+    if key in _coastline_cache:
+        return _coastline_cache[key]
+
+    import cartopy.feature as cfeature
+    min_lon, max_lon, min_lat, max_lat = extent
+    width, height = size
+    mask = np.zeros((height, width), dtype=bool)
+    for geometry in cfeature.COASTLINE.intersecting_geometries(extent):
+        lines = getattr(geometry, "geoms", [geometry])
+        for line in lines:
+            coords = np.asarray(line.coords)
+            # Sample each segment at about every half image pixel
+            cols = (coords[:, 0] - min_lon) / (max_lon - min_lon) * width
+            rows = (max_lat - coords[:, 1]) / (max_lat - min_lat) * height
+            steps = np.maximum(np.ceil(2 * np.hypot(np.diff(cols), np.diff(rows))), 1).astype(int)
+            t = np.concatenate([np.arange(n) / n for n in steps] + [[1.0]])
+            segment = np.concatenate([np.full(n, i) for i, n in enumerate(steps)] + [[len(steps) - 1]])
+            cols = np.floor(cols[segment] + t * (cols[segment + 1] - cols[segment])).astype(int)
+            rows = np.floor(rows[segment] + t * (rows[segment + 1] - rows[segment])).astype(int)
+            inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+            mask[rows[inside], cols[inside]] = True
+
+    _coastline_cache[key] = mask
+    return mask
+
+def clear_quicklook_caches():
+    """Removes every cached pixel index and coastline mask"""
+    _index_cache.clear()
+    _coastline_cache.clear()
+
+def _pixel_spacing(tree: cKDTree, points: np.ndarray, n_samples: int = 1000):
+    """Helper function to estimate the spacing of swath pixels from the distance to their nearest neighbors"""
+    sample = points[np.linspace(0, len(points) - 1, min(n_samples, len(points))).astype(int)]
+    distance, _ = tree.query(sample, k=2)
+    spacing = np.median(distance[:, 1]) if len(points) > 1 else 0
+    return spacing if np.isfinite(spacing) and spacing > 0 else np.inf
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from functools import partial
+
+from src.processing.aoi_window import get_aoi_window
+from src.processing.granule_index import granule_timestamp
+from src.processing.granule_reader import read_variables, identity
+from src.processing.parallel import run_in_parallel
+
+# The percentiles computed for each variable (the median is always computed)
+DEFAULT_PERCENTILES = (5, 25, 75, 95)
+
+
+def summarize_granule(file_path: Path, variables: list[str], bbox: tuple, transformations: dict = None,
+                      percentiles: tuple = DEFAULT_PERCENTILES):
+    """
+    Computes the statistics of variables over the pixels of a granule that are in a bounding box.
+    Only the window of the granule covering the bounding box is read, and every variable is
+    summarized in one vectorized pass.
+
+    Params:
+        file_path (Path): the path to the granule
+        variables (list): the variables to summarize
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        transformations (dict): a mapping of variable names to transformations applied before summarizing
+            (ex. {"chlor_a": np.log})
+        percentiles (tuple): the percentiles to compute besides the median
+
+    Returns:
+        list: a dictionary of statistics for each variable with the keys time, variable, mean_value, median,
+            std, p{percentile}, valid_pixels and nan_pixels
+    """
+    file_path = Path(file_path)
+    time = granule_timestamp(file_path)
+    transformations = transformations or {}
+
+    window = get_aoi_window(file_path, bbox)
+    if window is None:
+        values = np.empty((len(variables), 0))
+    else:
+        _, _, data = read_variables(file_path, variables, bbox, coords=False)
+        values = np.stack([np.asarray(transformations.get(var, identity)(data[var]), dtype=np.float64)[window.mask]
+                           for var in variables])
+
+    # One pass over the (variables, pixels) array for every statistic, with the infinite values
+    # (ex. the log of 0) masked like NaN so that the statistics only use the valid pixels
+    valid = np.isfinite(values)
+    values = np.where(valid, values, np.nan)
+    valid_pixels = valid.sum(axis=1)
+    has_values = valid_pixels > 0
+    stats = np.full((len(variables), len(percentiles) + 3), np.nan)
+    if has_values.any():
+        with np.errstate(all="ignore"):
+            subset = values[has_values]
+            stats[has_values, 0] = np.nanmean(subset, axis=1)
+            stats[has_values, 1] = np.nanstd(subset, axis=1, ddof=1)
+            stats[has_values, 2:] = np.nanpercentile(subset, (50, *percentiles), axis=1).T
+
+    rows = []
+    for i, var in enumerate(variables):
+        row = {"time": time, "variable": var, "mean_value": stats[i, 0], "median": stats[i, 2], "std": stats[i, 1]}
+        row.update({f"p{p:g}": stats[i, 3 + j] for j, p in enumerate(percentiles)})
+        row.update({"valid_pixels": int(valid_pixels[i]), "nan_pixels": int(values.shape[1] - valid_pixels[i])})
+        rows.append(row)
+    return rows
+
+def summarize_granules(file_paths: list[Path], variables: list[str], bbox: tuple, transformations: dict = None,
+                       percentiles: tuple = DEFAULT_PERCENTILES, max_workers: int = None, verbose=True):
+    """
+    Computes the AOI statistics of variables for every granule (see `summarize_granule`),
+    streaming the granule files in parallel instead of merging them into one dataset first.
+    Files that fail to be read are skipped.
+
+    Params:
+        file_paths (list): the paths to the granules (ex. every file in data/PACE_OCI_L2_BGC_NRT)
+        variables (list): the variables to summarize
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        transformations (dict): a mapping of variable names to transformations applied before summarizing
+            The transformations must be picklable (ex. numpy functions) to run in parallel
+        percentiles (tuple): the percentiles to compute besides the median
+        max_workers (int): the number of processes reading files in parallel, defaults to the number of CPUs
+            Reads the files one after another in this process if set to 1
+        verbose (bool): writes print statements about the progress if set to True
+
+    Returns:
+        pd.DataFrame: the statistics indexed by (time, variable), sorted by time
+    """
+    summarize = partial(summarize_granule, variables=variables, bbox=bbox, transformations=transformations,
+                        percentiles=percentiles)
+    results = run_in_parallel(summarize, [Path(file_path) for file_path in file_paths], max_workers, verbose=verbose)
+    rows = [row for _, _, error, file_rows in results if error is None for row in file_rows]
+
+    columns = ["time", "variable", "mean_value", "median", "std", *(f"p{p:g}" for p in percentiles),
+               "valid_pixels", "nan_pixels"]
+    return pd.DataFrame(rows, columns=columns).set_index(["time", "variable"]).sort_index()
+
+def write_statistics(table: pd.DataFrame, output_path: Path):
+    """Writes a statistics table to a Parquet file (.parquet) or a CSV file (any other suffix)"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.suffix == ".parquet":
+        table.to_parquet(output_path, index=False)
+    else:
+        table.to_csv(output_path, index=False)
+    return output_path
@@ -0,0 +1,151 @@
+import hashlib
+import numpy as np
+import xarray as xr
+from pathlib import Path
+from typing import NamedTuple
+from collections import OrderedDict
+
+# The maximum number of AOI windows kept in memory
+WINDOW_CACHE_SIZE = 256
+
+_window_cache = OrderedDict()
+_sidecar_dir = None
+
+
+class AOIWindow(NamedTuple):
+    """
+    The window of a swath that covers an area of interest.
+
+    rows (slice): the rows of the rectangular window (including the padding)
+    cols (slice): the columns of the rectangular window (including the padding)
+    mask (np.ndarray): a boolean mask of the pixels in the window that are exactly in the bounding box
+    """
+    rows: slice
+    cols: slice
+    mask: np.ndarray
+
+    @property
+    def slices(self):
+        return self.rows, self.cols
+
+
+def compute_aoi_window(lon: np.ndarray, lat: np.ndarray, bbox: tuple, padding: float = 0.0):
+    """
+    Computes the rectangular row/column window of a 2-D swath that covers a bounding box.
+
+    Params:
+        lon (np.ndarray): the 2-D longitude array of the swath
+        lat (np.ndarray): the 2-D latitude array of the swath
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        padding (float): the padding in latitude/longitude to add around the bounding box
+
+    Returns:
+        tuple: (row slice, column slice) of the window, or None if no pixel is in the bounding box
+    """
+    mask = in_bbox(lon, lat, bbox, padding)
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0:
+        return None
+    return slice(int(rows[0]), int(rows[-1]) + 1), slice(int(cols[0]), int(cols[-1]) + 1)
+
+def get_aoi_window(file_path: Path, bbox: tuple, padding: float = 0.0, nav: xr.Dataset = None):
+    """
+    Returns the AOI window of a granule, computing it only the first time it is requested.
+    Windows are cached in memory (least recently used are evicted first) and, if a sidecar
+    directory is set with `set_sidecar_dir`, in small files that are reused across runs.
+    Granules from the same pass (ex. the BGC, AOP, and LANDVI granules of one timestamp) share
+    their geometry, so one window serves every product and variable of the pass.
+
+    Params:
+        file_path (Path): the path to the granule
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        padding (float): the padding in latitude/longitude to add around the bounding box
+        nav (xr.Dataset): the lazily opened navigation group of the granule, opened from the file if not given
+            The latitude/longitude are only read if the window is not cached
+
+    Returns:
+        AOIWindow: the window of the granule, or None if no pixel is in the bounding box
+    """
+    close_nav = nav is None
+    if nav is None:
+        nav = xr.open_dataset(file_path, group="navigation_data")
+    try:
+        key = (geometry_key(file_path), nav["latitude"].shape, tuple(float(v) for v in bbox), float(padding))
+        if key in _window_cache:
+            _window_cache.move_to_end(key)
+            return _window_cache[key]
+
+        sidecar = _sidecar_path(key)
+        if sidecar is not None and sidecar.exists():
+            window = _load_window(sidecar)
+        else:
+            window = _compute_window(nav["longitude"].values, nav["latitude"].values, bbox, padding)
+            if sidecar is not None:
+                _save_window(sidecar, window)
+    finally:
+        if close_nav:
+            nav.close()
+
+    _window_cache[key] = window
+    if len(_window_cache) > WINDOW_CACHE_SIZE:
+        _window_cache.popitem(last=False)
+    return window
+
+def geometry_key(file_path: Path):
+    """
+    Returns the part of a granule's file name shared by every product of the same pass,
+    ex. PACE_OCI.20250104T202321 for PACE_OCI.20250104T202321.L2.OC_BGC.V3_0.NRT.nc
+    """
+    return ".".join(Path(file_path).name.split(".")[:2])
+
+def set_sidecar_dir(directory: Path = None):
+    """Sets a directory to store AOI windows in across runs, or disables storing them if None"""
+    global _sidecar_dir
+    _sidecar_dir = None if directory is None else Path(directory)
+    if _sidecar_dir is not None:
+        _sidecar_dir.mkdir(parents=True, exist_ok=True)
+
+def clear_window_cache():
+    """Removes every AOI window cached in memory"""
+    _window_cache.clear()
+
+def in_bbox(lon: np.ndarray, lat: np.ndarray, bbox: tuple, padding: float = 0.0):
+    """Creates a mask of the pixels in a bounding box (plus padding)"""
+    # Compared in float64 like the region polygons, so a float32 pixel rounded onto an edge (ex. 34.15) stays out
+    min_lon, min_lat, max_lon, max_lat = (np.float64(value) for value in bbox)
+    return (
+        (lon >= min_lon - padding) & (lon <= max_lon + padding) &
+        (lat >= min_lat - padding) & (lat <= max_lat + padding)
+    )
+
+def _compute_window(lon: np.ndarray, lat: np.ndarray, bbox: tuple, padding: float):
+    """Helper function to compute the AOI window with the exact bounding box mask"""
+    window = compute_aoi_window(lon, lat, bbox, padding)
+    if window is None:
+        return None
+    rows, cols = window
+    return AOIWindow(rows, cols, in_bbox(lon[rows, cols], lat[rows, cols], bbox))
+
+def _sidecar_path(key: tuple):
+    """Helper function to get the path of the sidecar file of a cached window"""
+    if _sidecar_dir is None:
+        return None
+    digest = hashlib.sha1(repr(key[1:]).encode()).hexdigest()[:12]
+    return _sidecar_dir / f"{key[0]}_{digest}.npz"
+
+def _save_window(path: Path, window: AOIWindow):
+    """Helper function to save an AOI window to a sidecar file"""
+    if window is None:
+        np.savez(path, empty=True)
+    else:
+        np.savez(path, empty=False, window=[window.rows.start, window.rows.stop, window.cols.start, window.cols.stop],
+                 mask=window.mask)
+
+def _load_window(path: Path):
+    """Helper function to load an AOI window from a sidecar file"""
+    with np.load(path) as saved:
+        if saved["empty"]:
+            return None
+        row_start, row_stop, col_start, col_stop = (int(v) for v in saved["window"])
+        return AOIWindow(slice(row_start, row_stop), slice(col_start, col_stop), saved["mask"])
@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from functools import partial
+from collections import OrderedDict
+from sklearn.neighbors import BallTree
+
+from src.processing.aoi_window import get_aoi_window, geometry_key
+from src.processing.granule_index import granule_timestamp
+from src.processing.granule_reader import read_variables, identity
+from src.processing.parallel import run_in_parallel
+
+EARTH_RADIUS_KM = 6371.0
+
+# The distance (km) below which pixels get the same weight, so a pixel on top of a station doesn't take all the weight
+MIN_WEIGHT_DISTANCE_KM = 0.5
+
+# The maximum number of pixel trees kept in memory
+TREE_CACHE_SIZE = 16
+
+_tree_cache = OrderedDict()
+
+
+def build_pixel_tree(lon: np.ndarray, lat: np.ndarray):
+    """
+    Builds a BallTree with the haversine metric over the pixels of a swath.
+
+    Params:
+        lon (np.ndarray): the longitude of the pixels
+        lat (np.ndarray): the latitude of the pixels
+
+    Returns:
+        tuple: (the BallTree, the flat indices of the pixels in the tree), pixels without a position are left out
+    """
+    # In float64, since float32 radians are only accurate to about a meter on the ground
+    lon, lat = np.ravel(lon).astype(np.float64), np.ravel(lat).astype(np.float64)
+    pixels = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+    return BallTree(np.radians(np.column_stack((lat[pixels], lon[pixels]))), metric="haversine"), pixels
+
+def get_pixel_tree(file_path: Path, lon: np.ndarray, lat: np.ndarray, bbox: tuple):
+    """
+    Returns the pixel tree of a window of a granule, building it only the first time it is requested.
+    Trees are cached in memory (least recently used are evicted first), and granules of the same
+    pass (ex. the BGC, AOP, and LANDVI granules of one timestamp) share one tree.
+
+    Params:
+        file_path (Path): the path to the granule
+        lon (np.ndarray): the longitude of the window
+        lat (np.ndarray): the latitude of the window
+        bbox (tuple): the bounding box the window was read for
+
+    Returns:
+        tuple: (the BallTree, the flat indices of the pixels in the tree), see `build_pixel_tree`
+    """
+    key = (geometry_key(file_path), lon.shape, tuple(float(v) for v in bbox))
+    if key in _tree_cache:
+        _tree_cache.move_to_end(key)
+        return _tree_cache[key]
+
+    tree = build_pixel_tree(lon, lat)
+    _tree_cache[key] = tree
+    if len(_tree_cache) > TREE_CACHE_SIZE:
+        _tree_cache.popitem(last=False)
+    return tree
+
+def clear_tree_cache():
+    """Removes every pixel tree cached in memory"""
+    _tree_cache.clear()
+
+def collocate_granule(file_path: Path, stations: pd.DataFrame, variables: list[str], radius_km: float = 5.0,
+                      max_hours: float = 3.0, transformations: dict = None):
+    """
+    Finds the pixels of a granule within `radius_km` of every station observation within `max_hours`
+    of the granule, and computes their statistics. The tree of the pixels is built once, and every
+    station observation is queried in one batch.
+
+    Params:
+        file_path (Path): the path to the granule
+        stations (pd.DataFrame): the station observations with the columns station, latitude, longitude, and time
+            (daily observations can use the date at noon local time with a max_hours of 12 or more)
+            Times with a time zone are converted to UTC, naive times are taken as UTC like the granule times
+        variables (list): the variables of the granule to collocate
+        radius_km (float): the search radius around each station in km
+        max_hours (float): the maximum time difference between the granule and an observation in hours
+        transformations (dict): a mapping of variable names to transformations applied before computing
+            the statistics (ex. {"chlor_a": np.log})
+
+    Returns:
+        list: a dictionary for each (observation, variable) with pixels in range, with the keys station,
+            station_time (naive UTC), granule_time, time_diff_hours, variable, n_pixels, valid_pixels, nearest_km,
+            nearest_value, mean_value, weighted_mean, and std
+    """
+    file_path = Path(file_path)
+    time = pd.Timestamp(granule_timestamp(file_path))
+    transformations = transformations or {}
+
+    station_times = pd.to_datetime(stations["time"])
+    if station_times.dt.tz is not None:
+        # The granule times are naive UTC
+        station_times = station_times.dt.tz_convert(None)
+    time_diff = (station_times - time).dt.total_seconds() / 3600
+    in_time = time_diff.abs() <= max_hours
+    if not in_time.any():
+        return []
+    obs = stations[in_time]
+    obs_lat = obs["latitude"].to_numpy(dtype=np.float64)
+    obs_lon = obs["longitude"].to_numpy(dtype=np.float64)
+
+    # Only read the window covering the stations (and the search radius around them)
+    pad_lat = radius_km / 111.0
+    pad_lon = pad_lat / max(np.cos(np.radians(np.abs(obs_lat).max())), 0.01)
+    bbox = (obs_lon.min() - pad_lon, obs_lat.min() - pad_lat, obs_lon.max() + pad_lon, obs_lat.max() + pad_lat)
+    if get_aoi_window(file_path, bbox) is None:
+        return []  # No pixel near the stations
+    lon, lat, data = read_variables(file_path, variables, bbox)
+    tree, tree_pixels = get_pixel_tree(file_path, lon, lat, bbox)
+
+    # Query every observation at once, then flatten the matchups into (observation, pixel) pairs
+    indices, distances = tree.query_radius(np.radians(np.column_stack((obs_lat, obs_lon))),
+                                           r=radius_km / EARTH_RADIUS_KM, return_distance=True)
+    n_pixels = np.array([len(ind) for ind in indices])
+    matched = np.flatnonzero(n_pixels)
+    if matched.size == 0:
+        return []
+    groups = np.repeat(np.arange(len(obs)), n_pixels)
+    pixels = tree_pixels[np.concatenate(indices)]
+    distances = np.concatenate(distances) * EARTH_RADIUS_KM
+    weights = 1 / np.maximum(distances, MIN_WEIGHT_DISTANCE_KM)
+
+    rows = []
+    for var in variables:
+        values = np.ravel(np.asarray(transformations.get(var, identity)(data[var]), dtype=np.float64))[pixels]
+        stats = _matchup_statistics(values, distances, weights, groups, len(obs))
+        for i in matched:
+            row = {
+                "station": obs["station"].iloc[i],
+                "station_time": station_times[in_time].iloc[i],
+                "granule_time": time,
+                "time_diff_hours": float(time_diff[in_time].iloc[i]),
+                "variable": var,
+                "n_pixels": int(n_pixels[i]),
+            }
+            row.update({stat: stat_values[i] for stat, stat_values in stats.items()})
+            row["valid_pixels"] = int(row["valid_pixels"])
+            rows.append(row)
+    return rows
+
+def collocate(file_paths: list[Path], stations: pd.DataFrame, variables: list[str], radius_km: float = 5.0,
+              max_hours: float = 3.0, transformations: dict = None, max_workers: int = None, verbose=True):
+    """
+    Creates a matchup table of satellite pixels and station observations (see `collocate_granule`) for
+    many granules, reading the granules in parallel. Files that fail to be read are skipped.
+
+    Params:
+        file_paths (list): the paths to the granules (ex. every file in data/PACE_OCI_L2_AOP_NRT)
+        stations (pd.DataFrame): the station observations with the columns station, latitude, longitude, and time
+        variables (list): the variables of the granules to collocate
+        radius_km (float): the search radius around each station in km
+        max_hours (float): the maximum time difference between a granule and an observation in hours
+        transformations (dict): a mapping of variable names to transformations applied before computing
+            the statistics. The transformations must be picklable (ex. numpy functions) to run in parallel
+        max_workers (int): the number of processes reading files in parallel, defaults to the number of CPUs
+            Reads the files one after another in this process if set to 1
+        verbose (bool): writes print statements about the progress if set to True
+
+    Returns:
+        pd.DataFrame: a row per (observation, granule, variable) with pixels in range, sorted by station time
+    """
+    missing = {"station", "latitude", "longitude", "time"} - set(stations.columns)
+    if missing:
+        raise KeyError(f"The stations are missing the columns {', '.join(sorted(missing))}")
+    collocate_file = partial(collocate_granule, stations=stations, variables=variables, radius_km=radius_km,
+                             max_hours=max_hours, transformations=transformations)
+    results = run_in_parallel(collocate_file, [Path(file_path) for file_path in file_paths], max_workers,
+                              verbose=verbose)
+    rows = [row for _, _, error, file_rows in results if error is None for row in file_rows]
+
+    columns = ["station", "station_time", "granule_time", "time_diff_hours", "variable", "n_pixels",
+               "valid_pixels", "nearest_km", "nearest_value", "mean_value", "weighted_mean", "std"]
+    table = pd.DataFrame(rows, columns=columns)
+    return table.sort_values(["station_time", "station", "granule_time", "variable"], ignore_index=True)
+
+def _matchup_statistics(values: np.ndarray, distances: np.ndarray, weights: np.ndarray, groups: np.ndarray,
+                        n_groups: int):
+    """Helper function to compute the statistics of the valid pixels of every observation with grouped reductions"""
+    valid = np.isfinite(values)
+    values, distances, weights, groups = values[valid], distances[valid], weights[valid], groups[valid]
+    count = np.bincount(groups, minlength=n_groups)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(groups, weights=values, minlength=n_groups) / count
+        weighted_mean = (np.bincount(groups, weights=weights * values, minlength=n_groups) /
+                         np.bincount(groups, weights=weights, minlength=n_groups))
+        squares = np.bincount(groups, weights=(values - mean[groups]) ** 2, minlength=n_groups)
+        std = np.where(count > 1, np.sqrt(squares / (count - 1)), np.nan)
+
+    # The nearest valid pixel is the first one of each observation after sorting by distance
+    nearest_km = np.full(n_groups, np.nan)
+    nearest_value = np.full(n_groups, np.nan)
+    order = np.lexsort((distances, groups))
+    first = order[np.r_[True, groups[order][1:] != groups[order][:-1]]] if order.size else order
+    nearest_km[groups[first]] = distances[first]
+    nearest_value[groups[first]] = values[first]
+
+    return {"valid_pixels": count, "nearest_km": nearest_km, "nearest_value": nearest_value,
+            "mean_value": mean, "weighted_mean": weighted_mean, "std": std}
@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from pathlib import Path
+from datetime import datetime, timedelta
+
+from src.processing.granule_reader import read_variables
+from src.processing.granule_index import granule_timestamp
+
+
+class AOIGrid:
+    def __init__(self, bbox: tuple, resolution: float = 0.01):
+        """
+        A fixed, regular latitude/longitude grid over an area of interest.
+
+        bbox: (min longitude, min latitude, max longitude, max latitude)
+        resolution: the size of a grid cell in degrees
+        """
+        self.bbox = tuple(float(v) for v in bbox)
+        self.resolution = resolution
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        self.n_lon = max(int(np.ceil(round((max_lon - min_lon) / resolution, 6))), 1)
+        self.n_lat = max(int(np.ceil(round((max_lat - min_lat) / resolution, 6))), 1)
+        self.lon = min_lon + (np.arange(self.n_lon) + 0.5) * resolution
+        self.lat = min_lat + (np.arange(self.n_lat) + 0.5) * resolution
+
+    @property
+    def shape(self):
+        return self.n_lat, self.n_lon
+
+    @property
+    def size(self):
+        return self.n_lat * self.n_lon
+
+    def cell_index(self, lon: np.ndarray, lat: np.ndarray):
+        """
+        Returns the flat index of the grid cell of each pixel, or -1 for pixels outside of the grid.
+        """
+        min_lon, min_lat, _, _ = self.bbox
+        col = np.floor((np.asarray(lon, dtype=np.float64) - min_lon) / self.resolution)
+        row = np.floor((np.asarray(lat, dtype=np.float64) - min_lat) / self.resolution)
+        inside = (col >= 0) & (col < self.n_lon) & (row >= 0) & (row < self.n_lat)
+        index = np.full(col.shape, -1, dtype=np.int64)
+        index[inside] = row[inside].astype(np.int64) * self.n_lon + col[inside].astype(np.int64)
+        return index
+
+
+class Compositor:
+    def __init__(self, grid: AOIGrid, variables: list[str], median: bool = False, reservoir_size: int = 16,
+                 seed: int = 0):
+        """
+        Bins the valid pixels of granules onto a fixed AOI grid, keeping running sum/count/min/max
+        accumulators for each variable (and optionally a bounded reservoir of samples for a median).
+        The accumulators are preallocated, so memory does not grow with the number of granules.
+
+        grid: the AOI grid to bin the pixels onto
+        variables: the variables to composite
+        median: if set to True, also keeps up to reservoir_size samples per cell to estimate a median
+        reservoir_size: the maximum number of samples kept per cell for the median
+        seed: the seed of the random replacement in the reservoirs
+        """
+        self.grid = grid
+        self.variables = list(variables)
+        self.median = median
+        self.reservoir_size = reservoir_size
+        self._rng = np.random.default_rng(seed)
+
+        n = grid.size
+        self._sum = {var: np.zeros(n) for var in self.variables}
+        self._count = {var: np.zeros(n, dtype=np.int64) for var in self.variables}
+        self._min = {var: np.full(n, np.inf) for var in self.variables}
+        self._max = {var: np.full(n, -np.inf) for var in self.variables}
+        if median:
+            self._reservoir = {var: np.full((n, reservoir_size), np.nan, dtype=np.float32) for var in self.variables}
+        self.n_granules = 0
+
+    def reset(self):
+        """Clears the accumulators to start a new composite"""
+        for var in self.variables:
+            self._sum[var][:] = 0
+            self._count[var][:] = 0
+            self._min[var][:] = np.inf
+            self._max[var][:] = -np.inf
+            if self.median:
+                self._reservoir[var][:] = np.nan
+        self.n_granules = 0
+
+    def add(self, lon: np.ndarray, lat: np.ndarray, values: dict[str, np.ndarray]):
+        """
+        Bins the valid (finite) pixels of one granule into the accumulators.
+
+        Params:
+            lon (np.ndarray): the 2-D longitude of the pixels
+            lat (np.ndarray): the 2-D latitude of the pixels
+            values (dict): the 2-D values of each variable
+        """
+        index = self.grid.cell_index(lon, lat).ravel()
+        for var in self.variables:
+            var_values = np.asarray(values[var], dtype=np.float64).ravel()
+            valid = (index >= 0) & np.isfinite(var_values)
+            cells, var_values = index[valid], var_values[valid]
+
+            if self.median:
+                # Rank before counting, the number of samples seen per cell is the count so far
+                self._add_to_reservoir(var, cells, var_values)
+            self._sum[var] += np.bincount(cells, weights=var_values, minlength=self.grid.size)
+            self._count[var] += np.bincount(cells, minlength=self.grid.size)
+            np.minimum.at(self._min[var], cells, var_values)
+            np.maximum.at(self._max[var], cells, var_values)
+        self.n_granules += 1
+
+    def result(self, time: datetime = None):
+        """
+        Returns the composite of the granules added so far.
+
+        Params:
+            time (datetime): the start of the composite period, added as a time coordinate if specified
+
+        Returns:
+            xr.Dataset: {var}_mean, {var}_count, {var}_min, {var}_max (and {var}_median) on the lat/lon grid,
+                and the number of granules in the composite
+        """
+        data_vars = {}
+        for var in self.variables:
+            count = self._count[var]
+            empty = count == 0
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = self._sum[var] / count
+            data_vars[f"{var}_mean"] = np.where(empty, np.nan, mean)
+            data_vars[f"{var}_count"] = count
+            data_vars[f"{var}_min"] = np.where(empty, np.nan, self._min[var])
+            data_vars[f"{var}_max"] = np.where(empty, np.nan, self._max[var])
+            if self.median:
+                with np.errstate(all="ignore"):
+                    reservoir = self._reservoir[var]
+                    median = np.full(self.grid.size, np.nan)
+                    median[~empty] = np.nanmedian(reservoir[~empty], axis=1)
+                data_vars[f"{var}_median"] = median
+
+        ds = xr.Dataset(
+            {name: (("lat", "lon"), values.reshape(self.grid.shape)) for name, values in data_vars.items()},
+            coords={"lat": self.grid.lat, "lon": self.grid.lon},
+            attrs={"resolution": self.grid.resolution},
+        )
+        ds["n_granules"] = self.n_granules
+        if time is not None:
+            ds = ds.expand_dims(time=[pd.Timestamp(time)])
+        return ds
+
+    def _add_to_reservoir(self, var: str, cells: np.ndarray, values: np.ndarray):
+        """
+        Helper function to sample the values of a granule into the bounded reservoirs of their cells.
+        Each cell keeps its first reservoir_size samples, then replaces a random one with probability
+        reservoir_size / (number of samples seen), so the reservoir stays a uniform sample of the cell.
+        """
+        if cells.size == 0:
+            return
+        # The rank of each sample within its cell in this granule
+        order = np.argsort(cells, kind="stable")
+        sorted_cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+        rank = np.arange(cells.size) - np.repeat(starts, np.diff(np.r_[starts, cells.size]))
+
+        seen = self._count[var][sorted_cells] + rank
+        slot = np.where(seen < self.reservoir_size, seen,
+                        (self._rng.random(cells.size) * (seen + 1)).astype(np.int64))
+        keep = slot < self.reservoir_size
+        self._reservoir[var][sorted_cells[keep], slot[keep]] = values[order][keep]
+
+
+def iter_composites(file_paths: list[Path], variables: list[str], bbox: tuple, resolution: float = 0.01,
+                    days: int = 1, start: datetime = None, median: bool = False, reservoir_size: int = 16,
+                    verbose=True):
+    """
+    Streams granules one at a time in time order and yields a composite for each period of `days` days.
+    Only the window of each granule covering the bounding box is read.
+
+    Params:
+        file_paths (list): the paths to the granules (ex. every file in data/PACE_OCI_L2_BGC_NRT)
+        variables (list): the variables to composite
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude) of the grid
+        resolution (float): the size of a grid cell in degrees
+        days (int): the length of a composite period in days (1 for daily composites)
+        start (datetime): the start of the first period, defaults to the day of the first granule
+        median (bool): if set to True, also estimates a median per cell with bounded reservoirs
+        reservoir_size (int): the maximum number of samples kept per cell for the median
+        verbose (bool): writes print statements about the progress if set to True
+
+    Yields:
+        xr.Dataset: the composite of a period, with the start of the period as its time coordinate
+    """
+    timed_paths = sorted((granule_timestamp(file_path), Path(file_path)) for file_path in file_paths)
+    if not timed_paths:
+        return
+    if start is None:
+        start = datetime.combine(timed_paths[0][0].date(), datetime.min.time())
+
+    compositor = Compositor(AOIGrid(bbox, resolution), variables, median, reservoir_size)
+    period = None
+    for time, file_path in timed_paths:
+        file_period = start + timedelta(days=days * ((time - start).days // days))
+        if period is not None and file_period != period and compositor.n_granules:
+            yield compositor.result(period)
+            compositor.reset()
+        period = file_period
+
+        try:
+            lon, lat, values = read_variables(file_path, variables, bbox)
+        except Exception as e:
+            print(f"Skipping file {file_path.name}: {e}")
+            continue
+        if verbose: print("Compositing", file_path.name)
+        compositor.add(lon, lat, values)
+
+    if compositor.n_granules:
+        yield compositor.result(period)
+
+def composite_granules(file_paths: list[Path], variables: list[str], bbox: tuple, resolution: float = 0.01,
+                       days: int = 1, **kwargs):
+    """
+    Creates daily (or N-day) composites of granules on a fixed AOI grid (see `iter_composites`).
+
+    Returns:
+        xr.Dataset: the composites stacked along a time dimension, or None if no granule has data in the AOI
+    """
+    composites = list(iter_composites(file_paths, variables, bbox, resolution, days, **kwargs))
+    if not composites:
+        return None
+    return xr.concat(composites, dim="time")
@@ -0,0 +1,77 @@
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+
+
+def granule_timestamp(file_path: Path):
+    """
+    Returns the start time of a granule from its file name,
+    ex. 2025-01-04 20:23:21 for PACE_OCI.20250104T202321.L2.OC_BGC.V3_0.NRT.nc
+    """
+    return datetime.strptime(Path(file_path).name.split(".")[1][:15], "%Y%m%dT%H%M%S")
+
+def list_granules(data_dir: Path, pattern: str = "*.nc"):
+    """
+    Lists the granules in a directory of downloaded granules, in time order. The other files that
+    match the pattern are left out: the `{granule}_derived.nc` files saved next to the HARP2 granules
+    and the `.part` files of unfinished downloads. Granules clipped to Zarr stores (`{granule}.zarr`) are
+    not listed, since the readers only open NetCDF4 files.
+
+    Params:
+        data_dir (Path): a directory of downloaded granules, ex. data/PACE_OCI_L2_BGC_NRT
+        pattern (str): the glob pattern of the granule files in the directory
+
+    Returns:
+        list: the paths to the granules, empty if the directory doesn't exist
+    """
+    data_dir = Path(data_dir)
+    if not data_dir.is_dir():
+        return []
+    return sorted(file_path for file_path in data_dir.glob(pattern)
+                  if not file_path.name.endswith(("_derived.nc", ".part")))
+
+def index_granules(data_dirs: dict[str, Path], pattern: str = "*.nc"):
+    """
+    Indexes the granules of several products by their pass timestamp.
+
+    Params:
+        data_dirs (dict): a mapping of product names to directories of downloaded granules
+            (ex. {"bgc": Path("data/PACE_OCI_L2_BGC_NRT"), "aop": Path("data/PACE_OCI_L2_AOP_NRT")})
+        pattern (str): the glob pattern of the granule files in the directories
+
+    Returns:
+        pd.DataFrame: the path of each product's granule (or NaN if missing) indexed by timestamp
+    """
+    columns = {}
+    for product, data_dir in data_dirs.items():
+        paths = {}
+        for file_path in list_granules(data_dir, pattern):
+            try:
+                paths[granule_timestamp(file_path)] = file_path
+            except (ValueError, IndexError):
+                print(f"Skipping file {file_path.name}: no timestamp in the file name")
+        columns[product] = pd.Series(paths, dtype=object)
+    index = pd.DataFrame(columns)
+    index.index.name = "time"
+    return index.sort_index()
+
+def join_granules(data_dirs: dict[str, Path], pattern: str = "*.nc", verbose=True):
+    """
+    Joins the granules of several products by their pass timestamp, keeping only the passes
+    that every product has a granule for.
+
+    Params:
+        data_dirs (dict): a mapping of product names to directories of downloaded granules
+        pattern (str): the glob pattern of the granule files in the directories
+        verbose (bool): prints the passes that are missing a product if set to True
+
+    Returns:
+        list: a (timestamp, {product: path}) tuple for each complete pass, in time order
+    """
+    index = index_granules(data_dirs, pattern)
+    complete = index.notna().all(axis=1)
+    if verbose:
+        for time, row in index[~complete].iterrows():
+            missing = ", ".join(row.index[row.isna()])
+            print(f"Skipping pass {time:%Y-%m-%dT%H:%M:%S}: missing {missing}")
+    return [(time, row.to_dict()) for time, row in index[complete].iterrows()]
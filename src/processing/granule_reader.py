@@ -0,0 +1,129 @@
+import itertools
+import netCDF4
+import xarray as xr
+from pathlib import Path
+
+from src.processing.aoi_window import get_aoi_window
+from src.profiling.trace import span, count, is_enabled
+
+
+def open_groups(file_path: Path, groups: tuple[str, ...], chunks: dict=None):
+    """
+    Opens several groups of a data file as lazily loaded xarray datasets.
+    NetCDF files are only opened once and shared by the groups, so closing one of the
+    datasets closes the file for all of them.
+
+    Params:
+        file_path (Path): a file path to downloaded PACE data
+        groups (tuple): the names of the groups to open
+        chunks (dict): dask chunks for the variables, uses lazily indexed arrays if not specified
+
+    Returns:
+        list: an xarray dataset for each group
+    """
+    if Path(file_path).is_dir():
+        # Zarr stores (ex. clipped granules) are opened by group
+        return [xr.open_dataset(file_path, group=group, chunks=chunks) for group in groups]
+    nc = netCDF4.Dataset(file_path)
+    return [xr.open_dataset(xr.backends.NetCDF4DataStore(nc[group]), chunks=chunks) for group in groups]
+
+def aoi_isel(file_path: Path, nav: xr.Dataset, bbox: tuple=None, padding: float=0):
+    """
+    Gets the row/column indexers of the window of a file that covers a bounding box.
+    The window is cached, so the full latitude/longitude are only read the first time.
+
+    Returns:
+        dict: the row and column slices by dimension name, empty if no bounding box is specified
+    """
+    if bbox is None:
+        return {}
+    with span("aoi_window", file=file_path):
+        window = get_aoi_window(file_path, bbox, padding, nav)
+    if window is None:
+        raise ValueError(f"No data in the bounding box for {Path(file_path).name}")
+    return dict(zip(nav["latitude"].dims, window.slices))
+
+def read_variables(file_path: Path, variables: list[str], bbox: tuple=None, padding: float=0, coords: bool=True):
+    """
+    Reads the latitude, longitude, and variables of interest from a data file.
+    If a bounding box is specified, only the window of the data that covers it is read.
+
+    Params:
+        file_path (Path): a file path to downloaded PACE data
+        variables (list): the variables of interest in the "geophysical_data" group
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+        padding (float): the padding in latitude/longitude around the bounding box
+        coords (bool): if set to False, skips reading the latitude/longitude (ex. when another product
+            of the same pass already has them) and returns None for them
+
+    Returns:
+        tuple: (longitude, latitude, a dictionary of the values of each variable)
+    """
+    with span("read_variables", file=file_path, variables=variables) as s:
+        with span("open_groups", file=file_path):
+            data, nav = open_groups(file_path, ("geophysical_data", "navigation_data"))
+        try:
+            isel = aoi_isel(file_path, nav, bbox, padding)
+            lon = lat = None
+            if coords:
+                lon = nav["longitude"].isel(isel).values
+                lat = nav["latitude"].isel(isel).values
+            values = {var: data[var].isel(isel).values for var in variables}
+            read = {("geophysical_data", var): data[var].dims for var in variables}
+            if coords:
+                read.update({("navigation_data", var): nav[var].dims for var in ("longitude", "latitude")})
+        finally:
+            # The groups share the opened file, so closing one group closes the file
+            data.close()
+        # The decoded (decompressed) size of the values, and the size of the compressed chunks they were
+        # read from on disk, so the time spent reading the file can be told apart from decompressing it
+        decoded_bytes = sum(array.nbytes for array in [lon, lat, *values.values()] if array is not None)
+        s.set(decoded_bytes=decoded_bytes, shape=list(next(iter(values.values())).shape) if values else [])
+    count("decoded_bytes", decoded_bytes)
+    if is_enabled():
+        # Measured after the read, so it isn't part of the time of the read_variables span
+        with span("stored_chunk_bytes", file=file_path) as s:
+            stored_bytes = stored_chunk_bytes(file_path, read, isel)
+            s.set(stored_bytes=stored_bytes)
+        if stored_bytes is not None:
+            count("stored_bytes", stored_bytes)
+    return lon, lat, values
+
+def stored_chunk_bytes(file_path: Path, variables: dict[tuple[str, str], tuple], isel: dict):
+    """
+    Sums the size on disk (compressed) of the chunks of variables that a window of the data intersects,
+    which is what the library reads from the file to decode the window.
+
+    Params:
+        file_path (Path): a file path to downloaded PACE data (NetCDF4/HDF5)
+        variables (dict): the dimension names of each (group, variable) that was read
+        isel (dict): the row and column slices of the window by dimension name (see `aoi_isel`)
+
+    Returns:
+        int: the number of bytes, or None if the file isn't an HDF5 file (ex. a Zarr store)
+    """
+    try:
+        import h5py
+        f = h5py.File(file_path, "r")
+    except (ImportError, OSError):
+        return None
+    total = 0
+    with f:
+        for (group, var), dims in variables.items():
+            dataset = f[group][var]
+            if dataset.chunks is None:
+                total += dataset.id.get_storage_size()
+                continue
+            # The indices of the chunks along each dimension that the window intersects
+            ranges = []
+            for dim, length, chunk in zip(dims, dataset.shape, dataset.chunks):
+                start, stop, _ = isel.get(dim, slice(None)).indices(length)
+                ranges.append(range(start // chunk, -(-stop // chunk)) if stop > start else range(0))
+            for index in itertools.product(*ranges):
+                info = dataset.id.get_chunk_info_by_coord(tuple(i * c for i, c in zip(index, dataset.chunks)))
+                total += info.size if info.byte_offset is not None else 0
+    return total
+
+def identity(values):
+    """The default transformation of a variable, returns the values unchanged"""
+    return values
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from pathlib import Path
+
+from src.processing.aoi_window import in_bbox
+from src.processing.l1c_reader import open_l1c
+
+# The number of along track rows read at a time
+CHUNK_ROWS = 64
+
+# The value range and number of bins of the histogram sketch of each variable, used for the percentiles
+SKETCH_RANGES = {
+    "dolp": (0.0, 1.0, 2000),
+    "reflectance": (0.0, 2.0, 4000),
+    "i": (0.0, 1000.0, 4000),
+}
+
+
+class RunningStats:
+    def __init__(self, n_views: int, value_range: tuple):
+        """
+        Running count, mean and variance (merged with Chan's parallel algorithm) and a fixed-bin
+        histogram sketch for percentiles, for each view of a multi-angle variable.
+        Values outside of the sketch range are counted in the first or last bin.
+
+        n_views: the number of views
+        value_range: the (min value, max value, number of bins) of the histogram sketch
+        """
+        self.n_views = n_views
+        self.lo, self.hi, self.n_bins = value_range
+        self.count = np.zeros(n_views, dtype=np.int64)
+        self.mean = np.zeros(n_views)
+        self.m2 = np.zeros(n_views)
+        self.histogram = np.zeros((n_views, self.n_bins), dtype=np.int64)
+
+    def update(self, values: np.ndarray):
+        """
+        Adds a chunk of values to the statistics.
+
+        Params:
+            values (np.ndarray): a (pixels, views) array of values, NaN for missing values
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1, self.n_views)
+        valid = np.isfinite(values)
+        count = valid.sum(axis=0)
+        has_values = count > 0
+        if not has_values.any():
+            return
+
+        zeroed = np.where(valid, values, 0)
+        mean = np.divide(zeroed.sum(axis=0), count, out=np.zeros(self.n_views), where=has_values)
+        m2 = (np.where(valid, values - mean, 0) ** 2).sum(axis=0)
+
+        # Merge the chunk statistics into the running statistics
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = np.where(has_values, self.mean + delta * count / total, self.mean)
+            self.m2 = np.where(has_values, self.m2 + m2 + delta ** 2 * self.count * count / total, self.m2)
+        self.count = total
+
+        # Add the values to the histogram of their view
+        width = (self.hi - self.lo) / self.n_bins
+        bins = np.clip(((zeroed - self.lo) / width).astype(np.int64, copy=False), 0, self.n_bins - 1)
+        views = np.broadcast_to(np.arange(self.n_views), values.shape)
+        flat = (views * self.n_bins + bins)[valid]
+        self.histogram += np.bincount(flat, minlength=self.n_views * self.n_bins).reshape(self.n_views, self.n_bins)
+
+    def merge(self, other: "RunningStats"):
+        """Merges the statistics of another RunningStats (ex. from another worker) into these"""
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = np.where(total > 0, self.mean + delta * other.count / total, 0)
+            self.m2 = np.where(total > 0, self.m2 + other.m2 + delta ** 2 * self.count * other.count / total, 0)
+        self.count = total
+        self.histogram += other.histogram
+
+    @property
+    def std(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def percentiles(self, percentiles: tuple):
+        """
+        Estimates percentiles of each view from the histogram sketch, interpolating within a bin.
+
+        Returns:
+            np.ndarray: a (views, percentiles) array
+        """
+        width = (self.hi - self.lo) / self.n_bins
+        cumulative = np.cumsum(self.histogram, axis=1)
+        result = np.full((self.n_views, len(percentiles)), np.nan)
+        for view in np.flatnonzero(self.count):
+            targets = np.asarray(percentiles) / 100 * self.count[view]
+            bins = np.searchsorted(cumulative[view], targets, side="left").clip(0, self.n_bins - 1)
+            before = np.where(bins > 0, cumulative[view][bins - 1], 0)
+            in_bin = np.maximum(self.histogram[view][bins], 1)
+            result[view] = self.lo + (bins + np.clip((targets - before) / in_bin, 0, 1)) * width
+        return result
+
+
+def angular_statistics(file_paths: list[Path], variables: tuple = ("dolp", "reflectance"), bbox: tuple = None,
+                       percentiles: tuple = (5, 25, 50, 75, 95), chunk_rows: int = CHUNK_ROWS, verbose=True):
+    """
+    Aggregates the angular signatures (statistics per view angle and wavelength) of HARP2 L1C granules.
+    Each granule is read `chunk_rows` along track rows at a time, so only one chunk is in memory.
+
+    Params:
+        file_paths (list): the paths to HARP2 L1C granules
+        variables (tuple): the variables to aggregate, any of "dolp", "reflectance" and "i"
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude) to restrict the pixels to,
+            uses every pixel if not specified
+        percentiles (tuple): the percentiles to estimate
+        chunk_rows (int): the number of along track rows read at a time
+        verbose (bool): writes print statements about the progress if set to True
+
+    Returns:
+        pd.DataFrame: a row per (variable, view) with the view angle, wavelength, count, mean, std, and percentiles
+    """
+    stats, views = {}, None
+    for file_path in file_paths:
+        file_path = Path(file_path)
+        try:
+            with xr.open_dataset(file_path, group="sensor_views_bands") as view_group:
+                file_views = view_group[["sensor_view_angle", "intensity_wavelength", "intensity_f0"]].load().squeeze()
+            if views is None:
+                views = file_views
+                stats = {var: RunningStats(views.sizes["number_of_views"], SKETCH_RANGES[var]) for var in variables}
+            if verbose: print("Aggregating", file_path.name)
+            _aggregate_granule(file_path, file_views, stats, bbox, chunk_rows)
+        except Exception as e:
+            print(f"Skipping file {file_path.name}: {e}")
+            continue
+
+    rows = []
+    for var, var_stats in stats.items():
+        var_percentiles = var_stats.percentiles(percentiles)
+        for view in range(var_stats.n_views):
+            row = {
+                "variable": var,
+                "view": view,
+                "view_angle": float(views["sensor_view_angle"][view]),
+                "wavelength": float(views["intensity_wavelength"][view]),
+                "count": int(var_stats.count[view]),
+                "mean": var_stats.mean[view] if var_stats.count[view] else np.nan,
+                "std": var_stats.std[view],
+            }
+            row.update({f"p{p:g}": var_percentiles[view, i] for i, p in enumerate(percentiles)})
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+def radiance_to_reflectance(rad, f0, sza, r):
+    """
+    Convert radiance to reflectance.
+
+    Params:
+        rad: Radiance.
+        f0: Solar irradiance.
+        sza: Solar zenith angle.
+        r: Sun-Earth distance (in AU).
+
+    Returns: Reflectance.
+    """
+    return (r**2) * np.pi * rad / np.cos(sza * np.pi / 180) / f0
+
+def _aggregate_granule(file_path: Path, views: xr.Dataset, stats: dict[str, RunningStats], bbox: tuple,
+                       chunk_rows: int):
+    """Helper function to add the pixels of one granule to the running statistics, one chunk of rows at a time"""
+    variables = {"i", "solar_zenith_angle"} if "reflectance" in stats else set()
+    variables.update(var for var in stats if var != "reflectance")
+    try:
+        ds = open_l1c(file_path, sorted(variables), bbox)
+    except ValueError:
+        return  # No pixel in the bounding box
+    f0 = views["intensity_f0"].values.astype(np.float32)
+
+    try:
+        n_rows = ds.sizes["bins_along_track"]
+        for start in range(0, n_rows, chunk_rows):
+            chunk = ds.isel(bins_along_track=slice(start, min(start + chunk_rows, n_rows)))
+            mask = None
+            if bbox is not None:
+                mask = in_bbox(chunk["longitude"].values, chunk["latitude"].values, bbox)
+
+            for var, var_stats in stats.items():
+                if var == "reflectance":
+                    values = radiance_to_reflectance(_read_views(chunk["i"]), f0,
+                                                     _read_views(chunk["solar_zenith_angle"]),
+                                                     float(ds.attrs["sun_earth_distance"]))
+                else:
+                    values = _read_views(chunk[var])
+                if mask is not None:
+                    values = values[mask]
+                var_stats.update(values)
+    finally:
+        # Release the granule's file before the next one is opened
+        ds.close()
+
+def _read_views(var: xr.DataArray):
+    """Helper function to read a chunk of a (rows, columns, views) variable as float32"""
+    return var.values.astype(np.float32, copy=False)
@@ -0,0 +1,85 @@
+import netCDF4
+import numpy as np
+import xarray as xr
+from pathlib import Path
+
+from src.processing.aoi_window import get_aoi_window
+
+# The groups of HARP2 and SPEXone L1C granules
+VIEW_GROUP = "sensor_views_bands"
+GEOLOCATION_GROUP = "geolocation_data"
+OBSERVATION_GROUP = "observation_data"
+
+
+def open_l1c(file_path: Path, variables: list[str] = None, bbox: tuple = None, padding: float = 0.0,
+             views: list[int] | slice = None, wavelengths: list[float] = None, chunks: dict = None):
+    """
+    Opens a multi-angle L1C granule (HARP2 or SPEXone) lazily as one dataset.
+    The file is opened once, and only the variables, window, views, and wavelengths of interest are
+    read when their values are used.
+
+    Params:
+        file_path (Path): the path to the L1C granule
+        variables (list): the variables of interest from the observation_data group (ex. i, dolp)
+            or the geolocation_data group (ex. solar_zenith_angle), uses every observation variable if not specified
+        bbox (tuple): (min longitude, min latitude, max longitude, max latitude) to keep only the window
+            of the granule that covers it
+        padding (float): the padding in latitude/longitude around the bounding box to keep
+        views (list | slice): the indices of the views to keep, keeps every view if not specified
+        wavelengths (list): the wavelengths (nm) to keep. For HARP2 these select the views with those
+            wavelengths, for SPEXone the closest bands of each view
+        chunks (dict): dask chunks for the variables, {} uses the chunks of the file and None uses
+            lazily indexed arrays without dask
+
+    Returns:
+        xr.Dataset: the variables of interest with longitude/latitude coordinates, the sensor view and band
+            variables (ex. sensor_view_angle, intensity_wavelength, intensity_f0) as view coordinates,
+            and the global attributes of the granule
+    """
+    nc = netCDF4.Dataset(file_path)
+    root, view, geo, obs = [
+        xr.open_dataset(xr.backends.NetCDF4DataStore(nc if group is None else nc[group]), chunks=chunks)
+        for group in (None, VIEW_GROUP, GEOLOCATION_GROUP, OBSERVATION_GROUP)
+    ]
+
+    if variables is None:
+        variables = list(obs.data_vars)
+    missing = [var for var in variables if var not in obs and var not in geo]
+    if missing:
+        nc.close()
+        raise KeyError(f"{', '.join(missing)} not in {Path(file_path).name}")
+
+    dataset = xr.Dataset(
+        {var: obs[var] if var in obs else geo[var] for var in variables},
+        coords={"longitude": geo["longitude"], "latitude": geo["latitude"], **view.variables},
+        attrs=root.attrs,
+    )
+    # The dataset is built from the groups, so closing it has to close the file opened above
+    dataset.set_close(nc.close)
+
+    if bbox is not None:
+        # The window is cached, so the full latitude/longitude are only read the first time
+        window = get_aoi_window(file_path, bbox, padding, geo)
+        if window is None:
+            nc.close()
+            raise ValueError(f"No data in the bounding box for {Path(file_path).name}")
+        dataset = dataset.isel(dict(zip(geo["latitude"].dims, window.slices)))
+    if views is not None:
+        dataset = dataset.isel(number_of_views=views)
+
+    # Drop the band dimension of instruments with one band per view (HARP2)
+    single_bands = [dim for dim, size in dataset.sizes.items() if dim.endswith("_bands_per_view") and size == 1]
+    dataset = dataset.squeeze(single_bands)
+    if wavelengths is not None:
+        dataset = _select_wavelengths(dataset, wavelengths)
+    return dataset
+
+def _select_wavelengths(dataset: xr.Dataset, wavelengths: list[float]):
+    """Helper function to keep the views (one band per view) or the closest bands (several bands per view)"""
+    wavelength = dataset["intensity_wavelength"]
+    if wavelength.ndim == 1:
+        return dataset.isel(number_of_views=np.flatnonzero(np.isin(wavelength.values, wavelengths)))
+    band_dim = wavelength.dims[-1]
+    bands = wavelength.isel(number_of_views=0).values
+    closest = [int(np.argmin(np.abs(bands - wv))) for wv in wavelengths]
+    return dataset.isel({band_dim: closest})
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+from pathlib import Path
+from multiprocessing import SimpleQueue
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from src.profiling.trace import span, is_enabled, drain, merge
+
+# The queue the worker processes put the index of each job they start on,
+# to find the jobs that were running when a worker process crashed
+_started_jobs = None
+
+
+def run_in_parallel(worker, items: list, max_workers: int = None, verbose=True):
+    """
+    Runs a job for each item (ex. each data file) in a pool of worker processes, which render plots with
+    the headless Agg backend. A failing job is reported and skipped without stopping the other jobs,
+    also when it crashes its worker process (ex. a segfault in a C library).
+
+    Params:
+        worker (function): a module level function called as `worker(item)`
+            (ex. `functools.partial(plot_variables, var_specs=BGC_VARIABLES)`)
+        items (list): the items to process, ex. file paths
+            Only the items are sent to the workers, each worker reads its own file
+        max_workers (int): the number of worker processes, defaults to the number of CPUs
+            Runs the jobs one after another in this process if set to 1
+        verbose (bool): writes print statements about the progress and timing if set to True
+
+    Returns:
+        list: a (item, elapsed seconds, error message or None, value returned by the worker or None) tuple
+            for each item, in completion order
+    """
+    items = list(items)
+    max_workers = max_workers or os.cpu_count()
+    start = time.perf_counter()
+    results = []
+
+    if max_workers == 1:
+        for item in items:
+            elapsed, error, value, _ = _run_job(worker, item, traced=False)
+            results.append((item, elapsed, error, value))
+            _report_progress(results, len(items), verbose)
+    else:
+        pending = list(range(len(items)))
+        while pending:
+            crashed, not_run = _run_pool(worker, items, pending, max_workers, results, verbose)
+            if not crashed and not_run == pending:
+                # No job was reported as started, so every pending job could have crashed the worker
+                crashed, not_run = not_run, []
+            # A crashed worker breaks the whole pool, so the jobs that were running are retried one at a time
+            # to find the one that crashed it, and the jobs that never started are run in a new pool
+            for index in crashed:
+                # The single worker can also crash before the job is reported as started
+                if any(_run_pool(worker, items, [index], 1, results, verbose)):
+                    results.append((items[index], 0.0, "BrokenProcessPool: the worker process crashed", None))
+                    _report_progress(results, len(items), verbose)
+            pending = not_run
+
+    if verbose:
+        failed = sum(error is not None for _, _, error, _ in results)
+        print(f"Processed {len(results) - failed}/{len(items)} items in {time.perf_counter() - start:.1f}s "
+              f"with {max_workers} workers")
+    return results
+
+def init_worker(tracing: bool = False, started_jobs: SimpleQueue = None):
+    """
+    Sets up a worker process: headless rendering with the Agg backend (without importing matplotlib
+    if the jobs don't use it), and tracing if it is enabled in the main process.
+    Pass it as the `initializer` of a ProcessPoolExecutor.
+
+    Params:
+        tracing (bool): if set to True, records the spans of the jobs to send them back to the main process
+        started_jobs (SimpleQueue): if specified, the worker puts the index of each job on it when it starts
+    """
+    global _started_jobs
+    os.environ["MPLBACKEND"] = "Agg"
+    if "matplotlib" in sys.modules:
+        # Forked workers may have matplotlib imported already
+        sys.modules["matplotlib"].use("Agg")
+    if tracing:
+        # Forked workers start with a copy of the spans recorded so far, which the main process already has
+        from src.profiling.trace import enable, reset
+        enable()
+        reset()
+    _started_jobs = started_jobs
+
+def _run_pool(worker, items: list, indices: list[int], max_workers: int, results: list, verbose: bool):
+    """
+    Helper function to run the jobs of some items in a new pool of worker processes.
+
+    Returns:
+        tuple: (the indices of the jobs that were running when a worker process crashed,
+            the indices of the jobs that didn't start because of the crash)
+    """
+    started_jobs = SimpleQueue()
+    broken = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                             initargs=(is_enabled(), started_jobs)) as executor:
+        jobs = {executor.submit(_run_job, worker, items[index], index=index): index for index in indices}
+        for job in as_completed(jobs):
+            try:
+                elapsed, error, value, trace = job.result()
+            except BrokenProcessPool:
+                broken.append(jobs[job])
+                continue
+            if trace is not None:
+                # Add the spans recorded in the worker to the trace of this process
+                merge(*trace)
+            results.append((items[jobs[job]], elapsed, error, value))
+            _report_progress(results, len(items), verbose)
+
+    started = set()
+    while not started_jobs.empty():
+        started.add(started_jobs.get())
+    started_jobs.close()
+    broken.sort()
+    return [index for index in broken if index in started], [index for index in broken if index not in started]
+
+def _run_job(worker, item, traced: bool = True, index: int = None):
+    """
+    Helper function to run one job in a worker, isolating its failure.
+
+    Returns:
+        tuple: (elapsed seconds, error message or None, the value returned by the worker or None,
+            the spans and counters recorded by the job or None if tracing is disabled or `traced` is False)
+    """
+    if _started_jobs is not None and index is not None:
+        _started_jobs.put(index)
+    start = time.perf_counter()
+    error = value = None
+    try:
+        with span("job", item=item[0] if isinstance(item, (tuple, list)) and item else item):
+            value = worker(item)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - start
+    return elapsed, error, value, drain() if traced and is_enabled() else None
+
+def _report_progress(results: list, total: int, verbose: bool):
+    """Helper function to print the progress after a job completes"""
+    item, elapsed, error, _ = results[-1]
+    if isinstance(item, (tuple, list)) and item:
+        # Name a group of files (ex. the granules of a pass) by its first file
+        item = item[0]
+    name = Path(item).name if isinstance(item, (str, Path)) else str(item)
+    if error is not None:
+        print(f"[{len(results)}/{total}] Error processing {name}: {error}")
+    elif verbose:
+        print(f"[{len(results)}/{total}] {name} ({elapsed:.1f}s)")
@@ -0,0 +1,232 @@
+import numpy as np
+import pandas as pd
+import shapely
+from pathlib import Path
+from functools import partial
+from collections import OrderedDict
+
+from src.processing.aoi_stats import DEFAULT_PERCENTILES
+from src.processing.aoi_window import get_aoi_window, geometry_key
+from src.processing.granule_index import granule_timestamp
+from src.processing.granule_reader import read_variables, identity
+from src.processing.parallel import run_in_parallel
+
+# The maximum number of label maps kept in memory
+LABEL_CACHE_SIZE = 64
+
+_label_cache = OrderedDict()
+
+
+class RegionSet:
+    def __init__(self, geometries: list, names: list[str] = None):
+        """
+        A set of regions (polygons) evaluated together against each granule.
+        The regions are put in a spatial index (STRtree), so finding the regions of every pixel
+        is one query instead of one point in polygon test per region. Regions may overlap.
+
+        geometries: the shapely polygons of the regions, in longitude/latitude
+        names: the names of the regions, defaults to region_0, region_1, ...
+        """
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.names = list(names) if names is not None else [f"region_{i}" for i in range(len(self.geometries))]
+        if len(self.names) != len(self.geometries):
+            raise ValueError("There must be one name per region")
+        self.tree = shapely.STRtree(self.geometries)
+        self.bounds = tuple(float(v) for v in shapely.total_bounds(self.geometries))
+        # Identifies the regions in the label map cache
+        self.key = hash((tuple(self.names), tuple(shapely.to_wkb(self.geometries))))
+
+    @classmethod
+    def from_file(cls, file_path: Path, name_column: str = "name"):
+        """
+        Reads the regions from a file readable by geopandas (ex. GeoJSON, shapefile, GeoPackage).
+
+        Params:
+            file_path (Path): the path to the file of the regions
+            name_column (str): the column with the names of the regions, uses the row numbers if missing
+
+        Returns:
+            RegionSet: the regions, in longitude/latitude
+        """
+        import geopandas as gpd
+
+        regions = gpd.read_file(file_path).to_crs(epsg=4326)
+        names = regions[name_column].astype(str) if name_column in regions else None
+        return cls(regions.geometry.values, names)
+
+    @classmethod
+    def from_bboxes(cls, bboxes: dict[str, tuple]):
+        """Creates regions from bounding boxes, ex. {"pacific_palisades": (-118.75, 33.99, -118.45, 34.15)}"""
+        return cls([shapely.box(*bbox) for bbox in bboxes.values()], bboxes.keys())
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def label_map(self, lon: np.ndarray, lat: np.ndarray):
+        """
+        Finds the regions of every pixel of a swath with one query of the spatial index.
+
+        Params:
+            lon (np.ndarray): the longitude of the pixels
+            lat (np.ndarray): the latitude of the pixels
+
+        Returns:
+            tuple: (flat pixel indices, region indices) of every (pixel, region) pair, sorted by region
+        """
+        lon, lat = np.ravel(lon), np.ravel(lat)
+        # Only the pixels in the bounds of the regions are tested
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+        candidates = np.flatnonzero((lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat))
+        points = shapely.points(lon[candidates], lat[candidates])
+        point_idx, region_idx = self.tree.query(points, predicate="intersects")
+        order = np.argsort(region_idx, kind="stable")
+        return candidates[point_idx[order]], region_idx[order].astype(np.int32)
+
+
+def get_label_map(file_path: Path, lon: np.ndarray, lat: np.ndarray, regions: RegionSet):
+    """
+    Returns the label map of the regions for a granule, computing it only the first time it is requested.
+    Label maps are cached in memory (least recently used are evicted first), and granules of the same
+    pass (ex. the BGC, AOP, and LANDVI granules of one timestamp) share one label map.
+
+    Params:
+        file_path (Path): the path to the granule
+        lon (np.ndarray): the longitude of the window of the granule covering the regions
+        lat (np.ndarray): the latitude of the window of the granule covering the regions
+        regions (RegionSet): the regions
+
+    Returns:
+        tuple: (flat pixel indices, region indices), see `RegionSet.label_map`
+    """
+    key = (geometry_key(file_path), lon.shape, regions.key)
+    if key in _label_cache:
+        _label_cache.move_to_end(key)
+        return _label_cache[key]
+
+    labels = regions.label_map(lon, lat)
+    _label_cache[key] = labels
+    if len(_label_cache) > LABEL_CACHE_SIZE:
+        _label_cache.popitem(last=False)
+    return labels
+
+def clear_label_cache():
+    """Removes every label map cached in memory"""
+    _label_cache.clear()
+
+def grouped_statistics(values: np.ndarray, groups: np.ndarray, n_groups: int,
+                       percentiles: tuple = DEFAULT_PERCENTILES):
+    """
+    Computes the statistics of the values of every group in one pass, ignoring NaN values.
+    The percentiles are interpolated linearly like `np.nanpercentile`.
+
+    Params:
+        values (np.ndarray): the values
+        groups (np.ndarray): the group (0 to n_groups - 1) of each value
+        n_groups (int): the number of groups
+        percentiles (tuple): the percentiles to compute besides the median
+
+    Returns:
+        dict: arrays of length n_groups with the keys mean_value, median, std, p{percentile},
+            valid_pixels and nan_pixels
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values)
+    total = np.bincount(groups, minlength=n_groups)
+    values, groups = values[valid], groups[valid]
+    count = np.bincount(groups, minlength=n_groups)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(groups, weights=values, minlength=n_groups) / count
+        squares = np.bincount(groups, weights=(values - mean[groups]) ** 2, minlength=n_groups)
+        std = np.where(count > 1, np.sqrt(squares / (count - 1)), np.nan)
+
+    # Sort the values of each group to read the percentiles at their positions
+    order = np.lexsort((values, groups))
+    values = values[order]
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    stats = {"mean_value": mean, "std": std}
+    for p in (50, *percentiles):
+        position = p / 100 * np.maximum(count - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        has_values = count > 0
+        result = np.full(n_groups, np.nan)
+        lo = values[(starts + lower)[has_values]]
+        hi = values[(starts + upper)[has_values]]
+        result[has_values] = lo + (hi - lo) * (position - lower)[has_values]
+        stats["median" if p == 50 else f"p{p:g}"] = result
+
+    stats["valid_pixels"] = count
+    stats["nan_pixels"] = total - count
+    return stats
+
+def summarize_regions_granule(file_path: Path, variables: list[str], regions: RegionSet,
+                              transformations: dict = None, percentiles: tuple = DEFAULT_PERCENTILES):
+    """
+    Computes the statistics of variables over the pixels of a granule in each region.
+    Only the window of the granule covering every region is read once, and the statistics of every
+    region are computed together with grouped reductions.
+
+    Params:
+        file_path (Path): the path to the granule
+        variables (list): the variables to summarize
+        regions (RegionSet): the regions
+        transformations (dict): a mapping of variable names to transformations applied before summarizing
+            (ex. {"chlor_a": np.log})
+        percentiles (tuple): the percentiles to compute besides the median
+
+    Returns:
+        list: a dictionary of statistics for each (region, variable) with the keys time, region, variable,
+            mean_value, median, std, p{percentile}, valid_pixels and nan_pixels
+    """
+    file_path = Path(file_path)
+    time = granule_timestamp(file_path)
+    transformations = transformations or {}
+
+    if get_aoi_window(file_path, regions.bounds) is None:
+        # No pixel in the bounds of the regions
+        data = {var: np.empty(0) for var in variables}
+        pixels, labels = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+    else:
+        lon, lat, data = read_variables(file_path, variables, regions.bounds)
+        pixels, labels = get_label_map(file_path, lon, lat, regions)
+
+    rows = []
+    for var in variables:
+        values = np.ravel(np.asarray(transformations.get(var, identity)(data[var]), dtype=np.float64))[pixels]
+        stats = grouped_statistics(values, labels, len(regions), percentiles)
+        for i, name in enumerate(regions.names):
+            row = {"time": time, "region": name, "variable": var}
+            row.update({stat: stat_values[i] for stat, stat_values in stats.items()})
+            row["valid_pixels"], row["nan_pixels"] = int(row["valid_pixels"]), int(row["nan_pixels"])
+            rows.append(row)
+    return rows
+
+def summarize_regions(file_paths: list[Path], variables: list[str], regions: RegionSet, transformations: dict = None,
+                      percentiles: tuple = DEFAULT_PERCENTILES, max_workers: int = None, verbose=True):
+    """
+    Computes the statistics of variables in every region for every granule (see `summarize_regions_granule`),
+    one pass per granule instead of one pass per region. Files that fail to be read are skipped.
+
+    Params:
+        file_paths (list): the paths to the granules (ex. every file in data/PACE_OCI_L2_BGC_NRT)
+        variables (list): the variables to summarize
+        regions (RegionSet): the regions, ex. RegionSet.from_file("data/regions.geojson")
+        transformations (dict): a mapping of variable names to transformations applied before summarizing
+            The transformations must be picklable (ex. numpy functions) to run in parallel
+        percentiles (tuple): the percentiles to compute besides the median
+        max_workers (int): the number of processes reading files in parallel, defaults to the number of CPUs
+            Reads the files one after another in this process if set to 1
+        verbose (bool): writes print statements about the progress if set to True
+
+    Returns:
+        pd.DataFrame: the statistics indexed by (time, region, variable), sorted by time
+    """
+    summarize = partial(summarize_regions_granule, variables=variables, regions=regions,
+                        transformations=transformations, percentiles=percentiles)
+    results = run_in_parallel(summarize, [Path(file_path) for file_path in file_paths], max_workers, verbose=verbose)
+    rows = [row for _, _, error, file_rows in results if error is None for row in file_rows]
+
+    columns = ["time", "region", "variable", "mean_value", "median", "std", *(f"p{p:g}" for p in percentiles),
+               "valid_pixels", "nan_pixels"]
+    return pd.DataFrame(rows, columns=columns).set_index(["time", "region", "variable"]).sort_index()
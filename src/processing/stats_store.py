@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as pds
+from pathlib import Path
+from datetime import datetime, timezone
+
+from src.processing.aoi_stats import summarize_granules
+from src.processing.granule_index import granule_timestamp, list_granules
+
+# The version of the statistics, change it when the way they are computed changes
+# so the granules are summarized again into a new partition
+STATS_VERSION = "1"
+
+# The partition columns, in the order of the directories
+PARTITIONS = ("product", "aoi", "version")
+
+# The columns that identify a row of the store
+KEY_COLUMNS = (*PARTITIONS, "time", "variable")
+
+
+class AOIStatsStore:
+    def __init__(self, root: Path = Path("data/aoi_stats")):
+        """
+        An append-only store of per-granule AOI statistics in partitioned Parquet files,
+        keyed by (product, AOI, processing version, granule timestamp, variable).
+        Each refresh only summarizes the granules (and variables) that are not in the store yet,
+        and writes them to a new file in `{root}/product=.../aoi=.../version=...`.
+
+        root: the directory of the store
+        """
+        self.root = Path(root)
+
+    def refresh(self, product: str, data_dir: Path, variables: list[str], bbox: tuple, aoi: str = None,
+                transformations: dict = None, version: str = STATS_VERSION, max_workers: int = None, verbose=True):
+        """
+        Summarizes the granules of a product that are not in the store yet and appends their statistics.
+
+        Params:
+            product (str): the name of the product, ex. PACE_OCI_L2_BGC_NRT
+            data_dir (Path): the directory with the downloaded granules of the product
+            variables (list): the variables to summarize
+            bbox (tuple): (min longitude, min latitude, max longitude, max latitude)
+            aoi (str): the name of the AOI (ex. pacific_palisades), defaults to a name made from the bbox
+            transformations (dict): transformations applied before summarizing (ex. {"chlor_a": np.log})
+                Use another version (or AOI name) when these change, they are not part of the key
+            version (str): the processing version of the statistics
+            max_workers (int): the number of processes summarizing granules in parallel
+            verbose (bool): writes print statements about the progress if set to True
+
+        Returns:
+            int: the number of granules summarized
+        """
+        aoi = aoi or aoi_name(bbox)
+        existing = self.read(product, aoi=aoi, version=version, columns=["time", "variable"])
+        existing = set(zip(existing["time"], existing["variable"]))
+
+        # Group the new granules by the variables they are missing
+        missing = {}
+        for file_path in list_granules(data_dir):
+            try:
+                time = pd.Timestamp(granule_timestamp(file_path))
+            except (ValueError, IndexError):
+                continue
+            missing_vars = tuple(var for var in variables if (time, var) not in existing)
+            if missing_vars:
+                missing.setdefault(missing_vars, []).append(file_path)
+
+        if verbose:
+            n_new = sum(len(files) for files in missing.values())
+            print(f"{product}: {n_new} granules to summarize for {aoi} (version {version})")
+        summaries = [summarize_granules(files, list(missing_vars), bbox, transformations, max_workers=max_workers,
+                                        verbose=verbose).reset_index()
+                     for missing_vars, files in missing.items()]
+        summaries = [summary for summary in summaries if not summary.empty]
+        if summaries:
+            self._append(pd.concat(summaries, ignore_index=True), product, aoi, version)
+        return sum(len(files) for files in missing.values())
+
+    def read(self, product: str = None, variables: list[str] = None, aoi: str = None, version: str = STATS_VERSION,
+             start: datetime = None, end: datetime = None, columns: list[str] = None):
+        """
+        Reads statistics from the store, only reading the partitions and rows that match the filters.
+
+        Params:
+            product (str): the product to read, reads every product if not specified
+            variables (list): the variables to read, reads every variable if not specified
+            aoi (str): the name of the AOI to read, reads every AOI if not specified
+            version (str): the processing version to read, reads every version if None
+            start (datetime): the earliest granule time to read
+            end (datetime): the latest granule time to read
+            columns (list): the columns to read, reads every column if not specified
+
+        Returns:
+            pd.DataFrame: the statistics, with a row per (product, aoi, version, time, variable), sorted by time
+        """
+        filters = [(key, "==", value) for key, value in zip(PARTITIONS, (product, aoi, version)) if value is not None]
+        if variables is not None:
+            filters.append(("variable", "in", list(variables)))
+        if start is not None:
+            filters.append(("time", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("time", "<=", pd.Timestamp(end)))
+
+        if not any(self.root.rglob("*.parquet")):
+            return pd.DataFrame(columns=columns or list(KEY_COLUMNS))
+        # Read the partition values as strings (ex. version=1 isn't a number)
+        partitioning = pds.partitioning(pa.schema([(column, pa.string()) for column in PARTITIONS]), flavor="hive")
+        read_columns = None if columns is None else list(dict.fromkeys([*columns, *KEY_COLUMNS]))
+        table = pd.read_parquet(self.root, columns=read_columns, filters=filters or None, partitioning=partitioning)
+        for column in PARTITIONS:
+            table[column] = table[column].astype(str)
+        # An interrupted `compact` can leave both the merged file and the files it merged,
+        # so only the row of the newest file is kept for each key
+        table = table.drop_duplicates(list(KEY_COLUMNS), keep="last")
+        return table.sort_values("time", ignore_index=True)[columns or table.columns]
+
+    def compact(self):
+        """
+        Merges the files of each partition into one file, after many small refreshes.
+        The merged file is written before the old files are removed, if it is interrupted in between
+        the rows that are in both are read once (see `read`) and merged again by the next compaction.
+        """
+        for partition in {path.parent for path in self.root.rglob("*.parquet")}:
+            parts = sorted(partition.glob("*.parquet"))
+            if len(parts) < 2:
+                continue
+            table = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+            table = table.drop_duplicates(["time", "variable"], keep="last")
+            self._write(table.sort_values(["time", "variable"], ignore_index=True), partition)
+            for part in parts:
+                part.unlink()
+
+    def _append(self, table: pd.DataFrame, product: str, aoi: str, version: str):
+        """Helper function to write new statistics to a new file in their partition"""
+        partition = self.root / f"product={product}" / f"aoi={aoi}" / f"version={version}"
+        self._write(table, partition)
+
+    def _write(self, table: pd.DataFrame, partition: Path):
+        """Helper function to write a table to a new file of a partition"""
+        partition.mkdir(parents=True, exist_ok=True)
+        name = f"part-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}.parquet"
+        tmp_path = partition / f".{name}.tmp"
+        table.drop(columns=[column for column in PARTITIONS if column in table]).to_parquet(tmp_path, index=False)
+        tmp_path.replace(partition / name)
+
+
+def aoi_name(bbox: tuple):
+    """Returns a name for a bounding box, ex. -118.75_33.99_-118.45_34.15"""
+    return "_".join(f"{np.round(value, 4):g}" for value in bbox)
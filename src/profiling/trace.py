@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+from pathlib import Path
+from collections import defaultdict
+
+# Tracing is off by default. Set PACE_TRACE to a directory (ex. PACE_TRACE=data/traces) to trace a whole run
+# without changing any code, the summary and Chrome trace are written there when the run ends
+TRACE_ENV_VAR = "PACE_TRACE"
+
+_enabled = False
+_trace_dir = None
+_events = []
+_counters = defaultdict(float)
+_lock = threading.Lock()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        event = {
+            "name": self.name, "ph": "X", "ts": self.start / 1000, "dur": (end - self.start) / 1000,
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": self.args,
+        }
+        with _lock:
+            _events.append(event)
+
+    def set(self, **args):
+        """Adds information to the span while it runs, ex. the decoded bytes or the shape of an array"""
+        self.args.update(args)
+
+
+class _NullSpan:
+    """The span used when tracing is disabled, it does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **args):
+    """
+    Times a block of code when tracing is enabled, ex.
+
+        with span("read_variables", file=file_path.name) as s:
+            values = ...
+            s.set(nbytes=values.nbytes)
+
+    Params:
+        name (str): the name of the span
+        args: information about the span (ex. the file name), shown in the Chrome trace
+
+    Returns:
+        a context manager, which does nothing when tracing is disabled
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, {key: _json_value(value) for key, value in args.items()})
+
+def traced(name: str = None):
+    """Decorator that runs a function in a span (named after the function if no name is given)"""
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Span(span_name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name: str, value: float = 1):
+    """Adds a value to a counter (ex. decoded_bytes) when tracing is enabled"""
+    if _enabled:
+        with _lock:
+            _counters[name] += value
+
+def enable(trace_dir: Path = None):
+    """
+    Enables tracing.
+
+    Params:
+        trace_dir (Path): if specified, writes the summary and the Chrome trace to this directory
+            when the program exits (see `write_trace`)
+    """
+    global _enabled, _trace_dir
+    _enabled = True
+    if trace_dir is not None:
+        if _trace_dir is None:
+            atexit.register(_write_at_exit)
+        _trace_dir = Path(trace_dir)
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Removes every recorded span and counter"""
+    with _lock:
+        _events.clear()
+        _counters.clear()
+
+def drain():
+    """
+    Returns and removes the recorded spans and counters, ex. to send them from a worker process to the main process.
+
+    Returns:
+        tuple: (the list of span events, a dictionary of the counters)
+    """
+    with _lock:
+        events, counters = list(_events), dict(_counters)
+        _events.clear()
+        _counters.clear()
+    return events, counters
+
+def merge(events: list, counters: dict):
+    """Adds the spans and counters recorded in another process (see `drain`)"""
+    with _lock:
+        _events.extend(events)
+        for name, value in counters.items():
+            _counters[name] += value
+
+def summary():
+    """
+    Summarizes the recorded spans and counters.
+
+    Returns:
+        dict: the calls, total, mean, and max seconds of each span name (slowest total first), and the counters
+    """
+    with _lock:
+        events, counters = list(_events), dict(_counters)
+    durations = defaultdict(list)
+    for event in events:
+        durations[event["name"]].append(event["dur"] / 1e6)
+    spans = {
+        name: {"calls": len(times), "total_s": sum(times), "mean_s": sum(times) / len(times), "max_s": max(times)}
+        for name, times in sorted(durations.items(), key=lambda item: -sum(item[1]))
+    }
+    return {"spans": spans, "counters": counters}
+
+def write_summary(output_path: Path):
+    """Writes the summary of the spans and counters (see `summary`) to a JSON file"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(summary(), indent=2))
+    return output_path
+
+def write_chrome_trace(output_path: Path):
+    """Writes the spans to a Chrome trace file, which can be opened in chrome://tracing or https://ui.perfetto.dev"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with _lock:
+        events = list(_events)
+        counters = dict(_counters)
+    end = max((event["ts"] + event["dur"] for event in events), default=0)
+    counter_events = [{"name": name, "ph": "C", "ts": end, "pid": os.getpid(), "args": {name: value}}
+                      for name, value in counters.items()]
+    output_path.write_text(json.dumps({"traceEvents": events + counter_events, "displayTimeUnit": "ms"}))
+    return output_path
+
+def write_trace(trace_dir: Path, name: str = None):
+    """
+    Writes the summary (`{name}_summary.json`) and the Chrome trace (`{name}_trace.json`) to a directory.
+
+    Params:
+        trace_dir (Path): the directory to write the files to
+        name (str): the prefix of the file names, defaults to the current time
+
+    Returns:
+        tuple: the paths to the summary and the Chrome trace
+    """
+    name = name or time.strftime("%Y%m%dT%H%M%S")
+    return (write_summary(Path(trace_dir) / f"{name}_summary.json"),
+            write_chrome_trace(Path(trace_dir) / f"{name}_trace.json"))
+
+def array_info(array):
+    """Returns the shape and size in bytes of an array, to add to a span"""
+    return {"shape": list(getattr(array, "shape", ())), "nbytes": int(getattr(array, "nbytes", 0))}
+
+def _write_at_exit():
+    """Helper function to write the trace of the main process when it exits"""
+    if _trace_dir is not None and _events:
+        summary_path, trace_path = write_trace(_trace_dir)
+        print(f"Trace written to {trace_path} (summary in {summary_path})")
+
+def _json_value(value):
+    """Helper function to keep span arguments JSON serializable"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, Path):
+        return value.name
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    return str(value)
+
+
+if os.environ.get(TRACE_ENV_VAR):
+    enable(os.environ[TRACE_ENV_VAR])
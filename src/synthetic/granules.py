@@ -0,0 +1,253 @@
+import netCDF4
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy.ndimage import zoom
+
+# The center of the synthetic swaths (Pacific Palisades), so the AOI of the scripts is always covered
+DEFAULT_CENTER = (-118.6, 34.07)
+
+# The size of a full OCI L2 swath (number_of_lines, pixels_per_line) and a HARP2 L1C 5km granule
+# (bins_along_track, bins_across_track)
+OCI_SWATH_SIZE = (1710, 1272)
+HARP2_GRANULE_SIZE = (395, 519)
+
+FILL_VALUE = -32767.0
+
+# The variables of each synthetic OCI L2 product (every variable the scripts plot or summarize),
+# with the file name part and directory of the product
+OCI_PRODUCTS = {
+    "BGC": (["chlor_a", "poc", "carbon_phyto"], "OC_BGC", "PACE_OCI_L2_BGC_NRT"),
+    "AOP": (["aot_865", "angstrom", "nflh", "avw", "Rrs"], "OC_AOP", "PACE_OCI_L2_AOP_NRT"),
+    "LANDVI": (["ndvi", "evi", "ndwi", "ndii", "pri", "cci", "cire"], "LANDVI", "PACE_OCI_L2_LANDVI_NRT"),
+}
+HARP2_DIR = "PACE_HARP2_L1C_SCI"
+
+
+def write_oci_l2(file_path: Path, variables: list[str], size: tuple = OCI_SWATH_SIZE, time: str = "2025-01-04T20:23:21",
+                 center: tuple = DEFAULT_CENTER, cloud_fraction: float = 0.3, n_wavelengths: int = 172,
+                 pixel_size: float = 0.01, seed: int = 0):
+    """
+    Writes a synthetic OCI L2 granule with the structure of the real files: the geophysical_data,
+    navigation_data, and sensor_band_parameters groups, a slightly rotated and curved swath,
+    spatially smooth fields, clouds, a coastline (ocean products are NaN over land and the land products
+    over the ocean), and a 3-D Rrs (number_of_lines, pixels_per_line, wavelength_3d).
+
+    Params:
+        file_path (Path): the path of the file to write
+        variables (list): the variables of the geophysical_data group, any of the OCI_PRODUCTS variables
+        size (tuple): (number_of_lines, pixels_per_line) of the swath
+        time (str): the start time of the granule
+        center (tuple): (longitude, latitude) of the center of the swath
+        cloud_fraction (float): the fraction of the swath covered by clouds
+        n_wavelengths (int): the number of Rrs wavelengths
+        pixel_size (float): the size of a pixel in degrees
+        seed (int): the seed of the random fields
+
+    Returns:
+        Path: the path to the written file
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n_lines, n_pixels = size
+    lon, lat = swath_geometry(size, center, pixel_size)
+
+    # Ocean products are only valid over the ocean and land products over land, both without clouds
+    land = lat - 34.0 > -0.6 * (lon + 118.5)
+    cloud_field = smooth_field(rng, size, scale=40)
+    clouds = cloud_field > np.quantile(cloud_field, 1 - cloud_fraction)
+    ocean_valid = ~land & ~clouds
+    land_valid = land & ~clouds
+
+    chunks = (min(n_lines, 256), min(n_pixels, 256))
+    with netCDF4.Dataset(file_path, "w") as nc:
+        nc.product_name = file_path.name
+        nc.instrument = "OCI"
+        nc.platform = "PACE"
+        nc.processing_level = "L2"
+        nc.time_coverage_start = f"{pd.Timestamp(time):%Y-%m-%dT%H:%M:%S.000Z}"
+        nc.time_coverage_end = f"{pd.Timestamp(time) + pd.Timedelta(minutes=5):%Y-%m-%dT%H:%M:%S.000Z}"
+        nc.createDimension("number_of_lines", n_lines)
+        nc.createDimension("pixels_per_line", n_pixels)
+        nc.createDimension("wavelength_3d", n_wavelengths)
+
+        bands = nc.createGroup("sensor_band_parameters")
+        wavelengths = np.linspace(346, 719, n_wavelengths).astype(np.float32)
+        bands.createVariable("wavelength_3d", "f4", ("wavelength_3d",))[:] = wavelengths
+
+        nav = nc.createGroup("navigation_data")
+        for name, values in (("longitude", lon), ("latitude", lat)):
+            var = nav.createVariable(name, "f4", ("number_of_lines", "pixels_per_line"), zlib=True,
+                                     chunksizes=chunks, fill_value=-999.0)
+            var[:] = values
+
+        geo = nc.createGroup("geophysical_data")
+        for name in variables:
+            dims = ("number_of_lines", "pixels_per_line")
+            if name == "Rrs":
+                dims += ("wavelength_3d",)
+                var = geo.createVariable(name, "f4", dims, zlib=True, fill_value=FILL_VALUE,
+                                         chunksizes=chunks + (min(n_wavelengths, 16),))
+                # Write Rrs a block of lines at a time, a full swath doesn't fit in memory
+                spectrum = np.exp(-((wavelengths - 440) / 120) ** 2) * 0.01
+                for start in range(0, n_lines, chunks[0]):
+                    rows = slice(start, start + chunks[0])
+                    amplitude = np.where(ocean_valid[rows], 1 + 0.3 * rng.standard_normal(ocean_valid[rows].shape), np.nan)
+                    var[rows] = np.ma.masked_invalid((amplitude[..., np.newaxis] * spectrum).astype(np.float32))
+                continue
+            var = geo.createVariable(name, "f4", dims, zlib=True, fill_value=FILL_VALUE, chunksizes=chunks)
+            var[:] = np.ma.masked_invalid(_variable_values(name, rng, size, ocean_valid, land_valid))
+    return file_path
+
+def write_harp2_l1c(file_path: Path, size: tuple = HARP2_GRANULE_SIZE, time: str = "2025-01-04T20:23:21",
+                    center: tuple = DEFAULT_CENTER, pixel_size: float = 0.05, seed: int = 0):
+    """
+    Writes a synthetic HARP2 L1C granule with the structure of the real files: the sensor_views_bands,
+    geolocation_data, and observation_data groups, 90 views (10 at 441, 549, and 867 nm and 60 at 669 nm)
+    with one intensity band per view, and the i, q, u, and dolp variables with fill values at the edges.
+
+    Params:
+        file_path (Path): the path of the file to write
+        size (tuple): (bins_along_track, bins_across_track) of the granule
+        time (str): the start time of the granule
+        center (tuple): (longitude, latitude) of the center of the granule
+        pixel_size (float): the size of a bin in degrees
+        seed (int): the seed of the random fields
+
+    Returns:
+        Path: the path to the written file
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n_along, n_across = size
+    angles = np.r_[np.linspace(-50, 50, 10), np.linspace(-57, 57, 60), np.linspace(-50, 50, 10), np.linspace(-50, 50, 10)]
+    wavelengths = np.r_[np.full(10, 549.0), np.full(60, 669.0), np.full(10, 867.0), np.full(10, 441.0)]
+    n_views = len(angles)
+    lon, lat = swath_geometry(size, center, pixel_size)
+
+    # Bins without a view of every angle at the start and the edge of the granule
+    valid = np.ones(size, dtype=bool)
+    valid[:n_along // 40 + 1] = False
+    valid[:, -(n_across // 70 + 1):] = False
+    view_dims = ("bins_along_track", "bins_across_track", "number_of_views")
+
+    with netCDF4.Dataset(file_path, "w") as nc:
+        nc.product_name = file_path.name
+        nc.instrument = "HARP2"
+        nc.platform = "PACE"
+        nc.processing_level = "L1C"
+        nc.time_coverage_start = f"{pd.Timestamp(time):%Y-%m-%dT%H:%M:%S.000Z}"
+        nc.sun_earth_distance = 0.985
+
+        views = nc.createGroup("sensor_views_bands")
+        views.createDimension("number_of_views", n_views)
+        views.createDimension("intensity_bands_per_view", 1)
+        views.createVariable("sensor_view_angle", "f4", ("number_of_views",))[:] = angles
+        band_dims = ("number_of_views", "intensity_bands_per_view")
+        views.createVariable("intensity_wavelength", "f4", band_dims)[:] = wavelengths[:, np.newaxis]
+        views.createVariable("intensity_f0", "f4", band_dims)[:] = (1500 + wavelengths)[:, np.newaxis]
+
+        for group_name in ("geolocation_data", "observation_data"):
+            group = nc.createGroup(group_name)
+            group.createDimension("bins_along_track", n_along)
+            group.createDimension("bins_across_track", n_across)
+            group.createDimension("number_of_views", n_views)
+        nc["observation_data"].createDimension("intensity_bands_per_view", 1)
+
+        geo = nc["geolocation_data"]
+        for name, values in (("longitude", lon), ("latitude", lat)):
+            geo.createVariable(name, "f4", view_dims[:2], zlib=True, fill_value=-999.0)[:] = values
+        sza = geo.createVariable("solar_zenith_angle", "f4", view_dims, zlib=True, fill_value=-999.0)
+        sza[:] = (45 + 10 * smooth_field(rng, size, scale=50))[..., np.newaxis] + 0.1 * angles
+
+        obs = nc["observation_data"]
+        scene = np.where(valid, 1 + 0.3 * smooth_field(rng, size, scale=20), np.nan).astype(np.float32)
+        for name, scale in (("i", 100.0), ("q", 10.0), ("u", 10.0)):
+            var = obs.createVariable(name, "f4", view_dims + ("intensity_bands_per_view",), zlib=True,
+                                     fill_value=np.float32(-999.0), chunksizes=(min(n_along, 64), n_across, 1, 1))
+            var[:] = np.ma.masked_invalid((scale * scene[..., np.newaxis] *
+                                           (1 + 0.2 * np.cos(np.radians(angles))))[..., np.newaxis])
+        dolp = obs.createVariable("dolp", "f4", view_dims, zlib=True, fill_value=np.float32(-999.0),
+                                  chunksizes=(min(n_along, 64), n_across, 1))
+        dolp[:] = np.ma.masked_invalid(np.clip(0.2 * scene[..., np.newaxis] * np.abs(np.sin(np.radians(angles))) +
+                                               0.02 * rng.standard_normal((1, 1, n_views)), 0, 1))
+    return file_path
+
+def write_granules(data_dir: Path, product: str, n_granules: int, start: str = "2025-01-01T20:23:21",
+                   seed: int = 0, **kwargs):
+    """
+    Writes a series of daily synthetic granules of a product to `{data_dir}/{product directory}`,
+    named like the real files (ex. PACE_OCI.20250101T202321.L2.OC_BGC.V3_0.NRT.nc).
+    Granules written for the same times share their geometry across products, like the passes of real granules.
+
+    Params:
+        data_dir (Path): the data directory, ex. data
+        product (str): BGC, AOP, LANDVI, or HARP2
+        n_granules (int): the number of granules (one per day)
+        start (str): the time of the first granule
+        seed (int): the seed of the first granule, the others use the next seeds
+        kwargs: passed to `write_oci_l2` (ex. size, variables, cloud_fraction) or `write_harp2_l1c`
+
+    Returns:
+        list: the paths to the written granules
+    """
+    times = pd.date_range(start, periods=n_granules, freq="D")
+    paths = []
+    for i, time in enumerate(times):
+        if product == "HARP2":
+            file_path = Path(data_dir) / HARP2_DIR / f"PACE_HARP2.{time:%Y%m%dT%H%M%S}.L1C.V3.5km.nc"
+            paths.append(write_harp2_l1c(file_path, time=str(time), seed=seed + i, **kwargs))
+            continue
+        variables, name_part, directory = OCI_PRODUCTS[product]
+        file_path = Path(data_dir) / directory / f"PACE_OCI.{time:%Y%m%dT%H%M%S}.L2.{name_part}.V3_0.NRT.nc"
+        kwargs.setdefault("variables", variables)
+        paths.append(write_oci_l2(file_path, time=str(time), seed=seed + i, **kwargs))
+    return paths
+
+def swath_geometry(size: tuple, center: tuple, pixel_size: float):
+    """
+    Creates the longitude/latitude of a swath, rotated a little from north and curved across track
+    like a real swath.
+
+    Returns:
+        tuple: (longitude, latitude) float32 arrays
+    """
+    n_lines, n_pixels = size
+    rows, cols = np.mgrid[0:n_lines, 0:n_pixels].astype(np.float64)
+    along = (rows - n_lines / 2) * pixel_size
+    across = (cols - n_pixels / 2) * pixel_size
+    lat = center[1] + along + 0.1 * across - 0.02 * across ** 2 / max(n_pixels * pixel_size, 1)
+    lon = center[0] + (across - 0.1 * along) / np.cos(np.radians(lat))
+    return lon.astype(np.float32), lat.astype(np.float32)
+
+def smooth_field(rng: np.random.Generator, size: tuple, scale: int = 30):
+    """Creates a spatially smooth random field with unit variance, ex. for clouds and blooms"""
+    coarse = rng.standard_normal((max(size[0] // scale, 2) + 1, max(size[1] // scale, 2) + 1))
+    field = zoom(coarse, (size[0] / coarse.shape[0], size[1] / coarse.shape[1]), order=1)[:size[0], :size[1]]
+    field = np.pad(field, ((0, size[0] - field.shape[0]), (0, size[1] - field.shape[1])), mode="edge")
+    return (field - field.mean()) / (field.std() + 1e-12)
+
+def _variable_values(name: str, rng: np.random.Generator, size: tuple, ocean_valid: np.ndarray,
+                     land_valid: np.ndarray):
+    """Helper function to create the values of a synthetic OCI L2 variable, NaN where it isn't valid"""
+    field = smooth_field(rng, size) + 0.3 * rng.standard_normal(size)
+    values = {
+        "chlor_a": lambda: np.exp(-1 + field),
+        "poc": lambda: np.exp(4 + 0.5 * field),
+        "carbon_phyto": lambda: np.exp(2.5 + 0.6 * field),
+        "aot_865": lambda: np.clip(0.1 + 0.05 * field, 0, None),
+        "angstrom": lambda: 1 + 0.3 * field,
+        "nflh": lambda: np.clip(0.05 + 0.03 * field, 0, None),
+        "avw": lambda: np.clip(500 + 15 * field, 400, 700),
+        "ndvi": lambda: np.clip(0.4 + 0.2 * field, -1, 1),
+        "evi": lambda: np.clip(0.3 + 0.15 * field, -1, 1),
+        "ndwi": lambda: np.clip(-0.1 + 0.2 * field, -1, 1),
+        "ndii": lambda: np.clip(0.1 + 0.2 * field, -1, 1),
+        "pri": lambda: np.clip(0.02 + 0.05 * field, -1, 1),
+        "cci": lambda: np.clip(0.05 + 0.1 * field, -1, 1),
+        "cire": lambda: np.clip(1.5 + 0.8 * field, 0, None),
+    }.get(name, lambda: field)()
+    valid = land_valid if name in OCI_PRODUCTS["LANDVI"][0] else ocean_valid
+    return np.where(valid, values, np.nan).astype(np.float32)
@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from src.synthetic.granules import write_oci_l2, write_granules, OCI_PRODUCTS
+
+# The AOI of the scripts (Pacific Palisades), covered by every synthetic granule
+PACIFIC_PAL_BBOX = (-118.75, 33.99, -118.45, 34.15)
+
+# The size of the synthetic granules of the tests, small enough to write in a fraction of a second
+OCI_TEST_SIZE = (300, 240)
+HARP2_TEST_SIZE = (60, 50)
+
+# The number of days of synthetic granules in `synthetic_data`
+N_DAYS = 3
+
+
+@pytest.fixture(scope="session")
+def oci_granule(tmp_path_factory):
+    """A small synthetic OCI L2 BGC granule"""
+    data_dir = tmp_path_factory.mktemp("granule")
+    variables, name_part, product_dir = OCI_PRODUCTS["BGC"]
+    return write_oci_l2(data_dir / product_dir / f"PACE_OCI.20250104T202321.L2.{name_part}.V3_0.NRT.nc",
+                        variables, size=OCI_TEST_SIZE)
+
+
+@pytest.fixture(scope="session")
+def synthetic_data(tmp_path_factory):
+    """
+    A data directory with `N_DAYS` daily synthetic granules of every product (see `write_granules`),
+    laid out like the downloads (ex. {data_dir}/PACE_OCI_L2_BGC_NRT/PACE_OCI.20250101T202321.L2.OC_BGC.V3_0.NRT.nc).
+
+    Returns:
+        tuple: (the data directory, a dictionary of the granule paths of each product: BGC, AOP, LANDVI, and HARP2)
+    """
+    data_dir = tmp_path_factory.mktemp("data")
+    granules = {product: write_granules(data_dir, product, N_DAYS, size=OCI_TEST_SIZE, n_wavelengths=8)
+                for product in OCI_PRODUCTS}
+    granules["HARP2"] = write_granules(data_dir, "HARP2", N_DAYS, size=HARP2_TEST_SIZE)
+    return data_dir, granules
@@ -0,0 +1,29 @@
+import numpy as np
+
+from conftest import PACIFIC_PAL_BBOX
+from src.processing.aoi_stats import summarize_granule
+from src.processing.aoi_window import get_aoi_window
+from src.processing.granule_reader import read_variables
+
+
+def _log_with_zeros(values):
+    """A transformation that turns some pixels into -inf, like np.log of a zero concentration"""
+    values = np.array(values, dtype=np.float64)
+    values.flat[::5] = 0
+    with np.errstate(divide="ignore"):
+        return np.log(values)
+
+
+def test_infinite_values_are_not_valid_pixels(oci_granule):
+    row, = summarize_granule(oci_granule, ["chlor_a"], PACIFIC_PAL_BBOX, {"chlor_a": _log_with_zeros})
+
+    _, _, data = read_variables(oci_granule, ["chlor_a"], PACIFIC_PAL_BBOX)
+    values = _log_with_zeros(data["chlor_a"])[get_aoi_window(oci_granule, PACIFIC_PAL_BBOX).mask]
+    finite = values[np.isfinite(values)]
+    assert np.isneginf(values).any()
+    assert row["valid_pixels"] == finite.size
+    assert row["nan_pixels"] == values.size - finite.size
+    assert np.isclose(row["mean_value"], finite.mean())
+    assert np.isclose(row["std"], finite.std(ddof=1))
+    assert np.isclose(row["median"], np.median(finite))
+    assert np.isclose(row["p5"], np.percentile(finite, 5))
@@ -0,0 +1,93 @@
+"""
+Benchmarks of the reading, statistics, and analysis functions on the synthetic granules (see `conftest.py`),
+so they run offline. Time them with `python -m pytest tests/test_benchmarks.py` (add `--benchmark-autosave`
+to compare the runs with `--benchmark-compare`), or run them once as plain tests with `--benchmark-disable`.
+The map rendering is timed by `scripts/run_benchmarks.py`, since it needs the cartopy coastlines.
+"""
+import numpy as np
+import pytest
+
+from conftest import PACIFIC_PAL_BBOX
+from src.analysis.cross_correlation import lagged_correlation
+from src.downloader.granule_clipper import clip_granule
+from src.plotting.plotting_functions import open_file_as_xr
+from src.plotting.quicklook import image_index, image_size, apply_colormap
+from src.processing.aoi_stats import summarize_granules
+from src.processing.aoi_window import clear_window_cache
+from src.processing.composite import composite_granules
+from src.processing.granule_reader import read_variables
+from src.synthetic.granules import OCI_PRODUCTS
+from scripts.harp2_data import HARP2
+
+pytest.importorskip("pytest_benchmark")
+
+BGC_VARIABLES = OCI_PRODUCTS["BGC"][0]
+
+
+def test_read_variables(benchmark, synthetic_data):
+    _, granules = synthetic_data
+    lon, _, values = benchmark(read_variables, granules["BGC"][0], BGC_VARIABLES, PACIFIC_PAL_BBOX)
+    assert all(values[var].shape == lon.shape for var in BGC_VARIABLES)
+
+
+def test_read_variables_cold_window(benchmark, synthetic_data):
+    # Computing the AOI window reads the full latitude/longitude of the swath
+    _, granules = synthetic_data
+    benchmark.pedantic(read_variables, (granules["BGC"][0], BGC_VARIABLES, PACIFIC_PAL_BBOX),
+                       setup=clear_window_cache, rounds=10)
+
+
+def test_open_file_as_xr(benchmark, synthetic_data):
+    _, granules = synthetic_data
+    dataset = benchmark(lambda: open_file_as_xr(granules["BGC"][0], "chlor_a", PACIFIC_PAL_BBOX).load())
+    assert "chlor_a" in dataset
+
+
+def test_summarize_granules(benchmark, synthetic_data):
+    _, granules = synthetic_data
+    table = benchmark(summarize_granules, granules["BGC"], BGC_VARIABLES, PACIFIC_PAL_BBOX, {"chlor_a": np.log},
+                      max_workers=1, verbose=False)
+    assert len(table) == len(granules["BGC"]) * len(BGC_VARIABLES)
+
+
+def test_clip_granule(benchmark, synthetic_data, tmp_path):
+    _, granules = synthetic_data
+    output_path = tmp_path / granules["BGC"][0].name
+    benchmark(clip_granule, granules["BGC"][0], PACIFIC_PAL_BBOX, BGC_VARIABLES, output_path=output_path)
+    assert output_path.exists()
+
+
+def test_composite_granules(benchmark, synthetic_data):
+    _, granules = synthetic_data
+    composites = benchmark(composite_granules, granules["BGC"], ["chlor_a"], PACIFIC_PAL_BBOX, 0.01)
+    assert composites.sizes["time"] == len(granules["BGC"])
+
+
+def test_quicklook_image(benchmark, synthetic_data):
+    _, granules = synthetic_data
+    lon, lat, values = read_variables(granules["BGC"][0], ["chlor_a"], PACIFIC_PAL_BBOX, padding=0.5)
+    extent = [PACIFIC_PAL_BBOX[0] - 0.5, PACIFIC_PAL_BBOX[2] + 0.5, PACIFIC_PAL_BBOX[1] - 0.5,
+              PACIFIC_PAL_BBOX[3] + 0.5]
+
+    def render():
+        index = image_index(lon, lat, extent, image_size(extent))
+        return apply_colormap(np.log(values["chlor_a"]).ravel()[index], vmin=-6, vmax=6)
+
+    assert benchmark(render).shape[-1] in (3, 4)
+
+
+def test_lagged_correlation(benchmark):
+    rng = np.random.default_rng(0)
+    driver = rng.normal(size=365)
+    stack = rng.normal(size=(365, 100, 100)).astype(np.float32)
+    stack[rng.random(stack.shape) < 0.3] = np.nan
+    correlation, _ = benchmark(lagged_correlation, driver, stack, np.arange(-30, 31))
+    assert correlation.shape == (61, 100, 100)
+
+
+def test_harp2_reflectance(benchmark, synthetic_data, tmp_path, monkeypatch):
+    # HARP2 creates the directory of its images in the working directory
+    monkeypatch.chdir(tmp_path)
+    _, granules = synthetic_data
+    reflectance = benchmark(lambda: HARP2(granules["HARP2"][0]).reflectance)
+    assert np.isfinite(reflectance).any()
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from src.processing.collocation import collocate_granule, _matchup_statistics, EARTH_RADIUS_KM
+from src.processing.granule_index import granule_timestamp
+from src.processing.granule_reader import read_variables
+
+
+def _haversine_km(lon, lat, station_lon, station_lat):
+    """The great circle distance of pixels to a station, computed directly"""
+    lon, lat = np.radians(lon), np.radians(lat)
+    station_lon, station_lat = np.radians(station_lon), np.radians(station_lat)
+    a = (np.sin((lat - station_lat) / 2) ** 2 +
+         np.cos(lat) * np.cos(station_lat) * np.sin((lon - station_lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _brute_force(values, distances):
+    """The statistics of the valid pixels of one observation, computed one at a time"""
+    valid = np.isfinite(values)
+    values, distances = values[valid], distances[valid]
+    weights = 1 / np.maximum(distances, 0.5)
+    return {
+        "valid_pixels": values.size,
+        "nearest_km": distances.min(),
+        "nearest_value": values[np.argmin(distances)],
+        "mean_value": values.mean(),
+        "weighted_mean": np.sum(weights * values) / np.sum(weights),
+        "std": values.std(ddof=1),
+    }
+
+
+def test_matchup_statistics_match_brute_force():
+    rng = np.random.default_rng(0)
+    lon, lat = np.meshgrid(np.linspace(-118.7, -118.5, 12), np.linspace(34.0, 34.1, 10))
+    values = rng.normal(size=lon.shape)
+    values[::3, ::4] = np.nan
+    stations = [(-118.62, 34.05), (-118.55, 34.02), (-118.69, 34.09)]
+
+    groups, pixels, distances = [], [], []
+    for i, (station_lon, station_lat) in enumerate(stations):
+        distance = _haversine_km(lon.ravel(), lat.ravel(), station_lon, station_lat)
+        in_range = np.flatnonzero(distance <= 4.0)
+        groups.append(np.full(in_range.size, i))
+        pixels.append(in_range)
+        distances.append(distance[in_range])
+    groups, pixels, distances = np.concatenate(groups), np.concatenate(pixels), np.concatenate(distances)
+
+    stats = _matchup_statistics(values.ravel()[pixels], distances, 1 / np.maximum(distances, 0.5), groups,
+                                len(stations))
+    for i in range(len(stations)):
+        expected = _brute_force(values.ravel()[pixels[groups == i]], distances[groups == i])
+        for stat, value in expected.items():
+            assert np.isclose(stats[stat][i], value), stat
+
+
+def test_collocate_granule_with_utc_station_times(oci_granule):
+    time = pd.Timestamp(granule_timestamp(oci_granule))
+    stations = pd.DataFrame({
+        "station": ["malibu", "santa_monica"],
+        "latitude": [34.0, 34.02],
+        "longitude": [-118.8, -118.49],
+        "time": pd.to_datetime([time + pd.Timedelta(hours=1), time - pd.Timedelta(hours=5)]).tz_localize("UTC"),
+    })
+    rows = collocate_granule(oci_granule, stations, ["chlor_a"], radius_km=5.0, max_hours=3.0)
+
+    # Only the observation within 3 hours of the granule is collocated
+    row, = rows
+    assert row["station"] == "malibu" and row["station_time"] == time + pd.Timedelta(hours=1)
+    assert np.isclose(row["time_diff_hours"], 1.0)
+    lon, lat, data = read_variables(oci_granule, ["chlor_a"])
+    distances = _haversine_km(lon.ravel().astype(np.float64), lat.ravel().astype(np.float64), -118.8, 34.0)
+    in_range = distances <= 5.0
+    assert row["n_pixels"] == in_range.sum()
+    expected = _brute_force(data["chlor_a"].ravel().astype(np.float64)[in_range], distances[in_range])
+    for stat, value in expected.items():
+        assert np.isclose(row[stat], value), stat
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from src.analysis import cross_correlation
+from src.analysis.cross_correlation import lagged_correlation, MIN_OVERLAP
+
+LAGS = np.arange(-12, 13)
+
+
+def _brute_force(x: np.ndarray, y: np.ndarray):
+    """The correlation of every lag from the valid pairs, with np.corrcoef"""
+    n_times = len(x)
+    correlation, n_pairs = np.full(len(LAGS), np.nan), np.zeros(len(LAGS), dtype=int)
+    for i, lag in enumerate(LAGS):
+        a, b = x[max(0, -lag):n_times - max(0, lag)], y[max(0, lag):n_times + min(0, lag)]
+        valid = np.isfinite(a) & np.isfinite(b)
+        n_pairs[i] = valid.sum()
+        if n_pairs[i] >= MIN_OVERLAP and a[valid].std() > 0 and b[valid].std() > 0:
+            correlation[i] = np.corrcoef(a[valid], b[valid])[0, 1]
+    return correlation, n_pairs
+
+
+@pytest.mark.parametrize("dtype, tolerance", [(np.float32, 1e-5), (np.float64, 1e-10)])
+def test_matches_brute_force(monkeypatch, dtype, tolerance):
+    # Small blocks so the stack is processed in several blocks
+    monkeypatch.setattr(cross_correlation, "PIXEL_BLOCK_SIZE", 7)
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=80)
+    y = rng.normal(size=(80, 4, 5)) + 0.5 * np.roll(x, 3)[:, np.newaxis, np.newaxis]
+    x[rng.random(x.shape) < 0.1] = np.nan
+    y[rng.random(y.shape) < 0.2] = np.nan
+    y[:, 0, 0] = np.nan
+    y[:, 0, 1] = 2.0
+
+    correlation, n_pairs = lagged_correlation(x, y, LAGS, dtype=dtype)
+    assert correlation.shape == n_pairs.shape == (len(LAGS), 4, 5)
+    assert correlation.dtype == dtype
+    for i, j in np.ndindex(4, 5):
+        expected, expected_pairs = _brute_force(x, y[:, i, j])
+        np.testing.assert_array_equal(n_pairs[:, i, j], expected_pairs)
+        np.testing.assert_allclose(correlation[:, i, j], expected, atol=tolerance)
+
+    # A driver per pixel gives the same correlations as a shared driver series
+    per_pixel, _ = lagged_correlation(np.broadcast_to(x[:, np.newaxis, np.newaxis], y.shape), y, LAGS, dtype=dtype)
+    np.testing.assert_allclose(per_pixel, correlation, atol=tolerance)
@@ -0,0 +1,61 @@
+import threading
+from pathlib import Path
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+import requests
+
+from src.downloader import pace_data_downloader
+from src.downloader.pace_data_downloader import _download_file
+
+GRANULE_BYTES = bytes(range(256)) * 64
+
+
+class ResumableHandler(SimpleHTTPRequestHandler):
+    """Serves files with byte ranges, answering 416 for a range that starts at or after the end of the file"""
+    def do_GET(self):
+        path = Path(self.translate_path(self.path))
+        if "Range" not in self.headers:
+            return super().do_GET()
+        size = path.stat().st_size
+        start = int(self.headers["Range"].removeprefix("bytes=").split("-")[0])
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = path.read_bytes()[start:]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def granule_url(tmp_path, monkeypatch):
+    """Serves a small file over HTTP with an unauthenticated session, returns its url"""
+    served = tmp_path / "served"
+    served.mkdir()
+    (served / "granule.nc").write_bytes(GRANULE_BYTES)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(ResumableHandler, directory=str(served)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(pace_data_downloader, "_get_session", requests.Session)
+    yield f"http://127.0.0.1:{server.server_address[1]}/granule.nc"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("part_bytes", [GRANULE_BYTES[:1000], GRANULE_BYTES, GRANULE_BYTES + b"corrupted"])
+def test_download_resumes_and_checks_complete_partial_files(granule_url, tmp_path, part_bytes):
+    dest = tmp_path / "granule.nc"
+    dest.with_name("granule.nc.part").write_bytes(part_bytes)
+
+    _download_file(granule_url, dest)
+    assert dest.read_bytes() == GRANULE_BYTES
+    assert not dest.with_name("granule.nc.part").exists()
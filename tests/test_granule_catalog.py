@@ -0,0 +1,81 @@
+from pathlib import Path
+
+from conftest import PACIFIC_PAL_BBOX
+from src.downloader.granule_catalog import GranuleCatalog, subset_key
+
+SHORT_NAME = "PACE_OCI_L2_BGC_NRT"
+
+
+class FakeGranule(dict):
+    """An earthaccess search result with the UMM fields the catalog uses"""
+    def __init__(self, name: str, start_time: str, points: list[tuple] = (), rectangles: list[tuple] = ()):
+        geometry = {
+            "GPolygons": [{"Boundary": {"Points": [{"Longitude": lon, "Latitude": lat} for lon, lat in points]}}],
+            "BoundingRectangles": [dict(zip(("WestBoundingCoordinate", "SouthBoundingCoordinate",
+                                             "EastBoundingCoordinate", "NorthBoundingCoordinate"), rect))
+                                   for rect in rectangles],
+        }
+        super().__init__(umm={
+            "GranuleUR": name,
+            "CollectionReference": {"Version": "3.0"},
+            "TemporalExtent": {"RangeDateTime": {"BeginningDateTime": start_time, "EndingDateTime": start_time}},
+            "SpatialExtent": {"HorizontalSpatialDomain": {"Geometry": geometry}},
+        })
+
+    def data_links(self):
+        return [f"https://example.com/{self['umm']['GranuleUR']}"]
+
+
+# A granule over Los Angeles, and one crossing the antimeridian
+LA_GRANULE = FakeGranule("PACE_OCI.20250104T202321.L2.OC_BGC.V3_0.NRT.nc", "2025-01-04T20:23:21Z",
+                         points=[(-125.0, 30.0), (-110.0, 30.0), (-110.0, 40.0), (-125.0, 40.0)])
+PACIFIC_GRANULE = FakeGranule("PACE_OCI.20250104T232321.L2.OC_BGC.V3_0.NRT.nc", "2025-01-04T23:23:21Z",
+                              points=[(170.0, -10.0), (-170.0, -10.0), (-170.0, 10.0), (170.0, 10.0)])
+
+
+def test_new_granules(tmp_path):
+    catalog = GranuleCatalog(tmp_path / "catalog.sqlite")
+    save_dir = tmp_path / SHORT_NAME
+    save_dir.mkdir()
+    # A granule downloaded before the catalog existed is added instead of downloaded again
+    (save_dir / PACIFIC_GRANULE["umm"]["GranuleUR"]).write_text("granule")
+
+    assert catalog.new_granules([LA_GRANULE, PACIFIC_GRANULE], SHORT_NAME, save_dir) == [LA_GRANULE]
+    assert catalog.contains(SHORT_NAME, PACIFIC_GRANULE["umm"]["GranuleUR"])
+
+    path = save_dir / LA_GRANULE["umm"]["GranuleUR"]
+    path.write_text("granule")
+    catalog.add_granule(LA_GRANULE, SHORT_NAME, path)
+    assert catalog.new_granules([LA_GRANULE, PACIFIC_GRANULE], SHORT_NAME, save_dir) == []
+    row, = catalog.query(SHORT_NAME, time_span=("2025-01-04", "2025-01-04"), bbox=PACIFIC_PAL_BBOX)
+    assert row["path"] == str(path) and row["version"] == "3.0"
+
+    # A deleted file is downloaded again
+    path.unlink()
+    assert catalog.new_granules([LA_GRANULE], SHORT_NAME, save_dir) == [LA_GRANULE]
+    catalog.close()
+
+
+def test_footprints_across_the_antimeridian(tmp_path):
+    catalog = GranuleCatalog(tmp_path / "catalog.sqlite")
+    catalog.add_granule(PACIFIC_GRANULE, SHORT_NAME, tmp_path / "pacific.nc")
+    catalog.add_granule(FakeGranule("PACE_OCI.20250105T232321.L2.OC_BGC.V3_0.NRT.nc", "2025-01-05T23:23:21Z",
+                                    rectangles=[(175.0, -5.0, -175.0, 5.0)]), SHORT_NAME, tmp_path / "rect.nc")
+
+    def query(bbox):
+        return sorted(Path(row["path"]).name for row in catalog.query(SHORT_NAME, bbox=bbox))
+
+    assert query((178.0, -1.0, 179.0, 1.0)) == ["pacific.nc", "rect.nc"]
+    assert query((-172.0, -1.0, -171.0, 1.0)) == ["pacific.nc"]
+    # The footprints don't span the globe, so an AOI far from the antimeridian doesn't match them
+    assert query(PACIFIC_PAL_BBOX) == []
+    assert query((0.0, -1.0, 1.0, 1.0)) == []
+    catalog.close()
+
+
+def test_subset_key():
+    key = subset_key(PACIFIC_PAL_BBOX, ["poc", "chlor_a"], 0.5)
+    assert key == subset_key(list(PACIFIC_PAL_BBOX), ["chlor_a", "poc"], 0.5)
+    assert key != subset_key(PACIFIC_PAL_BBOX, ["chlor_a", "poc"])
+    assert key != subset_key(PACIFIC_PAL_BBOX, ["chlor_a"], 0.5)
+    assert key != subset_key((-118.8, 33.99, -118.45, 34.15), ["chlor_a", "poc"], 0.5)
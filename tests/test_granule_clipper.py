@@ -0,0 +1,25 @@
+import json
+
+import xarray as xr
+
+from conftest import PACIFIC_PAL_BBOX
+from src.downloader.granule_clipper import clip_granules, CLIP_PARAMETERS_ATTR
+
+
+def test_clip_granules_reclips_when_the_parameters_change(synthetic_data, tmp_path):
+    _, granules = synthetic_data
+    data_dir = granules["BGC"][0].parent
+    paths = clip_granules(data_dir, PACIFIC_PAL_BBOX, ["chlor_a"], output_dir=tmp_path, verbose=False)
+    assert [path.name for path in paths] == [file_path.name for file_path in granules["BGC"]]
+    mtimes = [path.stat().st_mtime_ns for path in paths]
+
+    # The same parameters keep the clipped granules
+    assert clip_granules(data_dir, PACIFIC_PAL_BBOX, ["chlor_a"], output_dir=tmp_path, verbose=False) == paths
+    assert [path.stat().st_mtime_ns for path in paths] == mtimes
+
+    # Another padding clips the granules again
+    clip_granules(data_dir, PACIFIC_PAL_BBOX, ["chlor_a"], padding=0.1, output_dir=tmp_path, verbose=False)
+    with xr.open_dataset(paths[0]) as root:
+        assert json.loads(root.attrs[CLIP_PARAMETERS_ATTR])["padding"] == 0.1
+    with xr.open_dataset(paths[0], group="geophysical_data") as data:
+        assert list(data.data_vars) == ["chlor_a"]
@@ -0,0 +1,13 @@
+from src.processing.granule_index import list_granules
+
+
+def test_list_granules_skips_sidecars_and_partial_downloads(tmp_path):
+    names = ["PACE_HARP2.20250104T202321.L1C.V3.5km.nc", "PACE_HARP2.20250104T202321.L1C.V3.5km_derived.nc",
+             "PACE_HARP2.20250103T210000.L1C.V3.5km.nc", "PACE_HARP2.20250105T200000.L1C.V3.5km.nc.part",
+             "notes.txt"]
+    for name in names:
+        (tmp_path / name).touch()
+
+    assert [file_path.name for file_path in list_granules(tmp_path)] == [
+        "PACE_HARP2.20250103T210000.L1C.V3.5km.nc", "PACE_HARP2.20250104T202321.L1C.V3.5km.nc"]
+    assert list_granules(tmp_path / "missing") == []
@@ -0,0 +1,26 @@
+import dask.array as da
+import pytest
+
+from conftest import PACIFIC_PAL_BBOX
+from src.processing.l1c_reader import open_l1c
+
+
+def test_open_l1c_chunks(synthetic_data):
+    _, granules = synthetic_data
+    ds = open_l1c(granules["HARP2"][0], ["i"], PACIFIC_PAL_BBOX)
+    assert not isinstance(ds["i"].data, da.Array)
+    ds.close()
+
+    ds = open_l1c(granules["HARP2"][0], ["i"], chunks={})
+    assert isinstance(ds["i"].data, da.Array)
+    ds.close()
+
+
+def test_open_l1c_close(synthetic_data):
+    _, granules = synthetic_data
+    ds = open_l1c(granules["HARP2"][0], ["i"], PACIFIC_PAL_BBOX, views=[0, 1])
+    ds.close()
+
+    # Closing the dataset closes the netCDF4 file, so the lazily indexed values can't be read anymore
+    with pytest.raises(RuntimeError):
+        ds["i"].values
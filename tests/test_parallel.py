@@ -0,0 +1,45 @@
+import os
+
+from src.processing import parallel
+from src.processing.parallel import run_in_parallel
+
+
+def _render(item: int):
+    """A job that fails for item 5 and crashes its worker process for item 3"""
+    if item == 3:
+        os._exit(1)
+    if item == 5:
+        raise ValueError("bad granule")
+    return item * 2
+
+
+def test_failures_stay_isolated_per_item():
+    results = run_in_parallel(_render, range(12), max_workers=4, verbose=False)
+
+    assert sorted(item for item, _, _, _ in results) == list(range(12))
+    errors = {item: error for item, _, error, _ in results if error is not None}
+    assert set(errors) == {3, 5}
+    assert errors[3].startswith("BrokenProcessPool")
+    assert errors[5] == "ValueError: bad granule"
+    assert {item: value for item, _, error, value in results if error is None} == {
+        item: item * 2 for item in range(12) if item not in (3, 5)}
+
+
+def test_serial_run():
+    results = run_in_parallel(_render, [0, 1, 5], max_workers=1, verbose=False)
+    assert [(item, error) for item, _, error, _ in results] == [(0, None), (1, None), (5, "ValueError: bad granule")]
+
+
+def test_crash_in_retry_before_start_is_recorded(monkeypatch):
+    # The retry pool of a crashed job breaks before the job is reported as started
+    run_pool = parallel._run_pool
+
+    def _run_pool(worker, items, indices, max_workers, results, verbose):
+        if max_workers == 1:
+            return [], list(indices)
+        return run_pool(worker, items, indices, max_workers, results, verbose)
+
+    monkeypatch.setattr(parallel, "_run_pool", _run_pool)
+    results = run_in_parallel(_render, range(6), max_workers=2, verbose=False)
+    assert sorted(item for item, _, _, _ in results) == list(range(6))
+    assert [item for item, _, error, _ in results if error is not None and error.startswith("BrokenProcessPool")] == [3]
@@ -0,0 +1,130 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from conftest import PACIFIC_PAL_BBOX, OCI_TEST_SIZE
+from src.pipeline.runner import Pipeline, Task, RAN, FAILED, SKIPPED, UP_TO_DATE
+from src.synthetic.granules import write_granules, OCI_PRODUCTS
+from scripts.run_pipeline import build_pipeline
+
+
+def _concatenate(inputs: list[Path], output: Path, suffix: str = ""):
+    """A task writing its inputs (and a suffix) to its output"""
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text("".join(Path(path).read_text() for path in inputs) + suffix)
+
+
+def _fail(**kwargs):
+    raise RuntimeError("task failed")
+
+
+def _crash(**kwargs):
+    """Crashes its worker process, like a segfault in netCDF4, after the other tasks are done"""
+    time.sleep(0.5)
+    os._exit(1)
+
+
+def _write_outputs(outputs: list[Path]):
+    """Stands in for the plotting tasks: writes an output that only depends on its path"""
+    for output in outputs:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(output.name)
+
+
+def _chain(tmp_path: Path, function=_concatenate):
+    """A pipeline of three tasks: a.txt -> b.txt -> c.txt, and a.txt + b.txt -> d.txt"""
+    a, b, c, d = (tmp_path / name for name in ("a.txt", "b.txt", "c.txt", "d.txt"))
+    if not a.exists():
+        a.write_text("a")
+    pipeline = Pipeline(tmp_path / "state.json")
+    pipeline.add(Task("d", _concatenate, {"inputs": [a, b], "output": d}, inputs=[a, b], outputs=[d]))
+    pipeline.add(Task("c", _concatenate, {"inputs": [b], "output": c, "suffix": "c"}, inputs=[b], outputs=[c]))
+    pipeline.add(Task("b", function, {"inputs": [a], "output": b}, inputs=[a], outputs=[b]))
+    return pipeline
+
+
+def _statuses(results: list):
+    return {name: status for name, status, _ in results}
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_tasks_run_after_their_inputs(tmp_path, max_workers):
+    results = _chain(tmp_path).run(max_workers=max_workers, verbose=False)
+
+    order = [name for name, _, _ in results]
+    assert set(_statuses(results).values()) == {RAN}
+    assert order.index("b") < order.index("c") and order.index("b") < order.index("d")
+    assert (tmp_path / "c.txt").read_text() == "ac"
+    assert (tmp_path / "d.txt").read_text() == "aa"
+
+
+def test_tasks_after_a_failure_are_skipped(tmp_path):
+    statuses = _statuses(_chain(tmp_path, _fail).run(max_workers=1, verbose=False))
+    assert statuses == {"b": FAILED, "c": SKIPPED, "d": SKIPPED}
+
+
+def test_tasks_after_a_crash_are_skipped(tmp_path):
+    pipeline = _chain(tmp_path, _crash)
+    x = tmp_path / "x.txt"
+    pipeline.add(Task("x", _concatenate, {"inputs": [tmp_path / "a.txt"], "output": x},
+                      inputs=[tmp_path / "a.txt"], outputs=[x]))
+
+    statuses = _statuses(pipeline.run(max_workers=2, verbose=False))
+    assert statuses == {"b": FAILED, "c": SKIPPED, "d": SKIPPED, "x": RAN}
+    assert _statuses(_chain(tmp_path).run(max_workers=2, verbose=False)) == {"b": RAN, "c": RAN, "d": RAN}
+
+
+def test_only_changed_tasks_rerun(tmp_path):
+    _chain(tmp_path).run(max_workers=1, verbose=False)
+    assert set(_statuses(_chain(tmp_path).run(max_workers=1, verbose=False)).values()) == {UP_TO_DATE}
+
+    # A new input reruns every task after it, a deleted output reruns its task
+    (tmp_path / "a.txt").write_text("A")
+    assert _statuses(_chain(tmp_path).run(max_workers=1, verbose=False)) == {"b": RAN, "c": RAN, "d": RAN}
+    (tmp_path / "c.txt").unlink()
+    assert _statuses(_chain(tmp_path).run(max_workers=1, verbose=False)) == {"b": UP_TO_DATE, "c": RAN,
+                                                                             "d": UP_TO_DATE}
+
+    # A new parameter reruns the task
+    pipeline = _chain(tmp_path)
+    pipeline.tasks["c"].kwargs["suffix"] = "C"
+    assert _statuses(pipeline.run(max_workers=1, verbose=False))["c"] == RAN
+    assert (tmp_path / "c.txt").read_text() == "AC"
+
+
+def test_code_changes_rerun_the_task(tmp_path, monkeypatch):
+    _chain(tmp_path).run(max_workers=1, verbose=False)
+    monkeypatch.setattr("src.pipeline.runner._code_hash", lambda function: "edited")
+    assert set(_statuses(_chain(tmp_path).run(max_workers=1, verbose=False)).values()) == {RAN}
+
+
+def test_new_day_only_runs_its_tasks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_dir = tmp_path / "data"
+    for product in OCI_PRODUCTS:
+        write_granules(data_dir, product, 2, size=OCI_TEST_SIZE, n_wavelengths=8)
+
+    def build():
+        pipeline = build_pipeline(PACIFIC_PAL_BBOX, "pacific_palisades", data_dir, harp2=False,
+                                  state_path=data_dir / "pipeline_state.json")
+        # The renders are timed by the benchmarks, here they only write their outputs
+        for name, task in pipeline.tasks.items():
+            if name.split("/")[0] in ("render", "overlay", "gif"):
+                task.function, task.kwargs = _write_outputs, {"outputs": task.outputs}
+        return pipeline
+
+    first = _statuses(build().run(max_workers=1, verbose=False))
+    assert set(first.values()) == {RAN}
+    assert set(_statuses(build().run(max_workers=1, verbose=False)).values()) == {UP_TO_DATE}
+
+    for product in OCI_PRODUCTS:
+        write_granules(data_dir, product, 1, start="2025-01-03T20:23:21", size=OCI_TEST_SIZE, n_wavelengths=8)
+    statuses = _statuses(build().run(max_workers=1, verbose=False))
+    ran = {name for name, status in statuses.items() if status == RAN}
+    # The granules are named by their time, the overlay plots by their date
+    new_day = {name for name in statuses if "20250103T" in name or name.endswith("01-03-2025")}
+    assert new_day and all(name.startswith(("render/", "overlay/")) for name in new_day)
+    assert ran == new_day | {"gif/overlay"} | {name for name in statuses if name.startswith("stats/")}
+    assert all(statuses[name] == UP_TO_DATE for name in first if name not in ran)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from conftest import PACIFIC_PAL_BBOX
+from src.processing.aoi_stats import summarize_granules
+from src.processing.regions import RegionSet, summarize_regions, grouped_statistics
+
+# Regions of the tests: the AOI, a part of it, and a box without any pixel of the granule
+REGION_BBOXES = {
+    "pacific_palisades": PACIFIC_PAL_BBOX,
+    "santa_monica": (-118.55, 33.99, -118.45, 34.07),
+    "offshore": (-150.0, 10.0, -149.0, 11.0),
+}
+
+
+def test_regions_match_the_aoi_statistics(oci_granule):
+    variables = ["chlor_a", "carbon_phyto"]
+    regions = summarize_regions([oci_granule], variables, RegionSet.from_bboxes(REGION_BBOXES),
+                                {"chlor_a": np.log}, max_workers=1, verbose=False)
+
+    for name, bbox in REGION_BBOXES.items():
+        expected = summarize_granules([oci_granule], variables, bbox, {"chlor_a": np.log}, max_workers=1,
+                                      verbose=False)
+        actual = regions.xs(name, level="region")
+        assert actual.index.equals(expected.index)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    assert (regions.xs("offshore", level="region")["valid_pixels"] == 0).all()
+
+
+def test_grouped_statistics_match_numpy():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=500)
+    values[::7] = np.nan
+    groups = rng.integers(0, 3, size=500)
+
+    # The last group has no value
+    stats = grouped_statistics(values, groups, 4, percentiles=(5, 95))
+    for group in range(3):
+        group_values = values[groups == group]
+        finite = group_values[np.isfinite(group_values)]
+        assert stats["valid_pixels"][group] == finite.size
+        assert stats["nan_pixels"][group] == group_values.size - finite.size
+        assert np.isclose(stats["mean_value"][group], finite.mean())
+        assert np.isclose(stats["std"][group], finite.std(ddof=1))
+        assert np.allclose([stats["median"][group], stats["p5"][group], stats["p95"][group]],
+                           np.percentile(finite, [50, 5, 95]))
+    assert stats["valid_pixels"][3] == 0 and np.isnan(stats["mean_value"][3])
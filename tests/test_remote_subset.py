@@ -0,0 +1,113 @@
+import threading
+from pathlib import Path
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from conftest import PACIFIC_PAL_BBOX
+from src.downloader import pace_data_downloader, remote_subset
+from src.downloader.granule_catalog import GranuleCatalog
+from src.downloader.remote_subset import subset_granule, open_remote_file
+from src.processing.granule_reader import read_variables
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files with byte-range support like the NASA servers, counting the bytes sent"""
+    bytes_sent = 0
+
+    def do_GET(self):
+        path = Path(self.translate_path(self.path))
+        if "Range" not in self.headers or not path.is_file():
+            return super().do_GET()
+        size = path.stat().st_size
+        start, end = self.headers["Range"].removeprefix("bytes=").split("-")
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self.wfile.write(data)
+        RangeRequestHandler.bytes_sent += len(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeGranule(dict):
+    """An earthaccess search result with the fields the downloader uses"""
+    def __init__(self, url: str):
+        super().__init__(umm={"GranuleUR": url.split("/")[-1]})
+        self.url = url
+
+    def data_links(self):
+        return [self.url]
+
+
+@pytest.fixture
+def granule_server(oci_granule):
+    """Serves the directory of the synthetic granule over HTTP, returns the url of the granule"""
+    handler = partial(RangeRequestHandler, directory=str(oci_granule.parent))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    RangeRequestHandler.bytes_sent = 0
+    yield f"http://127.0.0.1:{server.server_address[1]}/{oci_granule.name}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_subset_granule_reads_only_the_aoi_window(granule_server, oci_granule, tmp_path, monkeypatch):
+    # Smaller blocks than for the real granules, since the test granule is small
+    monkeypatch.setattr(remote_subset, "BLOCK_SIZE", 16 * 1024)
+    output_path = subset_granule(granule_server, tmp_path / oci_granule.name, ["chlor_a", "poc"], PACIFIC_PAL_BBOX)
+
+    # Same window and values as reading the local file
+    lon, lat, values = read_variables(oci_granule, ["chlor_a", "poc"], PACIFIC_PAL_BBOX)
+    sub_lon, sub_lat, sub_values = read_variables(output_path, ["chlor_a", "poc"])
+    np.testing.assert_array_equal(sub_lon, lon)
+    np.testing.assert_array_equal(sub_lat, lat)
+    for var in ("chlor_a", "poc"):
+        np.testing.assert_array_equal(sub_values[var], values[var])
+    with xr.open_dataset(output_path, group="geophysical_data") as data:
+        assert set(data.data_vars) == {"chlor_a", "poc"}
+
+    # Only byte ranges were fetched, not the whole granule
+    assert 0 < RangeRequestHandler.bytes_sent < oci_granule.stat().st_size
+
+def test_subset_granule_outside_the_aoi(granule_server, oci_granule, tmp_path):
+    assert subset_granule(granule_server, tmp_path / oci_granule.name, ["chlor_a"], (10, 10, 11, 11)) is None
+
+def test_subset_data_records_subsets_apart_from_downloads(granule_server, tmp_path, monkeypatch):
+    granules = [FakeGranule(granule_server)]
+    monkeypatch.setattr(pace_data_downloader.PaceDataDownloader, "search", lambda self, *args, **kwargs: granules)
+    monkeypatch.setattr(pace_data_downloader.earthaccess, "open",
+                        lambda results: [open_remote_file(granule.url) for granule in results])
+    catalog = GranuleCatalog(tmp_path / "catalog.sqlite")
+
+    def subset(bbox):
+        downloader = pace_data_downloader.PaceDataDownloader(bbox, ("2025-01-04", "2025-01-04"), catalog)
+        return downloader.subset_data("PACE_OCI_L2_BGC_NRT", ["chlor_a"], save_dir=tmp_path / "subsets",
+                                      verbose=False)
+
+    paths = subset(PACIFIC_PAL_BBOX)
+    assert [path.name for path in paths] == [granules[0]["umm"]["GranuleUR"]]
+    assert catalog.query("PACE_OCI_L2_BGC_NRT") == []  # not recorded as a full download
+
+    # Already subset for this AOI, so nothing is streamed again
+    RangeRequestHandler.bytes_sent = 0
+    assert subset(PACIFIC_PAL_BBOX) == []
+    assert RangeRequestHandler.bytes_sent == 0
+
+    # A granule outside the AOI is recorded too, so it is only streamed once
+    assert subset((10, 10, 11, 11)) == []
+    RangeRequestHandler.bytes_sent = 0
+    assert subset((10, 10, 11, 11)) == []
+    assert RangeRequestHandler.bytes_sent == 0
+    catalog.close()
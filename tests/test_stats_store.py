@@ -0,0 +1,32 @@
+import shutil
+
+import pandas as pd
+
+from src.processing.stats_store import AOIStatsStore
+
+
+def _statistics(times: list[str], mean_value: float):
+    return pd.DataFrame({"time": pd.to_datetime(times), "variable": "chlor_a", "mean_value": mean_value,
+                         "valid_pixels": 10})
+
+
+def test_interrupted_compaction_doesnt_duplicate_rows(tmp_path):
+    store = AOIStatsStore(tmp_path / "aoi_stats")
+    store._append(_statistics(["2025-01-01", "2025-01-02"], 1.0), "PACE_OCI_L2_BGC_NRT", "pacific_palisades", "1")
+    store._append(_statistics(["2025-01-03"], 2.0), "PACE_OCI_L2_BGC_NRT", "pacific_palisades", "1")
+    expected = store.read("PACE_OCI_L2_BGC_NRT")
+    partition = next(path.parent for path in store.root.rglob("*.parquet"))
+    backup = tmp_path / "backup"
+    shutil.copytree(partition, backup)
+
+    # Put the merged files back, as if the compaction stopped after writing the merged file
+    store.compact()
+    for part in backup.glob("*.parquet"):
+        shutil.copy(part, partition / part.name)
+    assert len(list(partition.glob("*.parquet"))) == 3
+    pd.testing.assert_frame_equal(store.read("PACE_OCI_L2_BGC_NRT"), expected)
+    pd.testing.assert_frame_equal(store.read(columns=["time", "mean_value"]), expected[["time", "mean_value"]])
+
+    store.compact()
+    assert len(list(partition.glob("*.parquet"))) == 1
+    pd.testing.assert_frame_equal(store.read("PACE_OCI_L2_BGC_NRT"), expected)
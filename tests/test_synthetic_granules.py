@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from conftest import PACIFIC_PAL_BBOX
+from src.downloader.granule_clipper import clip_granule
+from src.processing.granule_reader import read_variables
+from scripts.plot_BGC_data import BGC_VARIABLES
+from scripts.plot_AOP_data import AOP_VARIABLES
+from scripts.plot_LANDVI_data import LANDVI_VARIABLES
+from scripts.refresh_aoi_stats import PRODUCTS as STATS_PRODUCTS
+
+# The variables the scripts plot and summarize for each synthetic product
+SCRIPT_VARIABLES = {
+    "BGC": ([var_spec["var_of_interest"] for var_spec in BGC_VARIABLES], "PACE_OCI_L2_BGC_NRT"),
+    "AOP": ([var_spec["var_of_interest"] for var_spec in AOP_VARIABLES], "PACE_OCI_L2_AOP_NRT"),
+    "LANDVI": ([var_spec["var_of_interest"] for var_spec in LANDVI_VARIABLES], "PACE_OCI_L2_LANDVI_NRT"),
+}
+
+
+@pytest.mark.parametrize("product", SCRIPT_VARIABLES)
+def test_granules_have_every_script_variable(synthetic_data, tmp_path, product):
+    _, granules = synthetic_data
+    plotted, short_name = SCRIPT_VARIABLES[product]
+    variables = plotted + [var for var in STATS_PRODUCTS[short_name][0] if var not in plotted]
+
+    _, _, values = read_variables(granules[product][0], variables, PACIFIC_PAL_BBOX)
+    for var in variables:
+        assert np.isfinite(values[var]).any(), var
+
+    # The pipeline clips the granules to the plotted and summarized variables
+    output_path = clip_granule(granules[product][0], PACIFIC_PAL_BBOX, variables,
+                               output_path=tmp_path / granules[product][0].name)
+    _, _, clipped = read_variables(output_path, variables)
+    assert set(clipped) == set(variables)
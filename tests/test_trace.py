@@ -0,0 +1,26 @@
+import pytest
+
+from conftest import PACIFIC_PAL_BBOX
+from src.processing.granule_reader import read_variables
+from src.profiling import trace
+
+
+@pytest.fixture
+def tracing():
+    trace.enable()
+    trace.reset()
+    yield
+    trace.disable()
+    trace.reset()
+
+
+def test_read_counts_decoded_and_stored_bytes(oci_granule, tracing):
+    lon, lat, values = read_variables(oci_granule, ["chlor_a", "poc"], PACIFIC_PAL_BBOX)
+    _, window_counters = trace.drain()
+    read_variables(oci_granule, ["chlor_a", "poc"])
+    events, counters = trace.drain()
+
+    assert window_counters["decoded_bytes"] == lon.nbytes + lat.nbytes + sum(v.nbytes for v in values.values())
+    # The window is read from whole compressed chunks, fewer than the chunks of the full swath
+    assert 0 < window_counters["stored_bytes"] < counters["stored_bytes"] <= oci_granule.stat().st_size
+    assert {"read_variables", "open_groups", "stored_chunk_bytes"} <= {event["name"] for event in events}